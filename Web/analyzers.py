@@ -1,24 +1,121 @@
+import os
+import threading
+from bisect import bisect_right
 from datetime import timedelta, datetime
-from models import PriceRange, BlacklistCategory
+from cache import TTLCache
+from models import db, PriceRange, BlacklistCategory
+
+DEFAULT_COOLING_DAYS = 7
+
+
+class RuleSnapshot:
+    """Скомпилированные правила пользователя: чёрный список и диапазоны цен"""
+    
+    __slots__ = ('blacklist', 'price_ranges', '_mins')
+    
+    def __init__(self, blacklist, price_ranges):
+        self.blacklist = frozenset(blacklist)
+        
+        # Диапазоны (min_price, max_price, cooling_days), отсортированные по min_price
+        self.price_ranges = sorted(price_ranges, key=lambda r: r[0])
+        self._mins = [r[0] for r in self.price_ranges]
+    
+    @classmethod
+    def load(cls, user_id):
+        """Загрузить правила пользователя из БД"""
+        blacklist = db.session.query(BlacklistCategory.category).filter_by(user_id=user_id).all()
+        price_ranges = db.session.query(
+            PriceRange.min_price, PriceRange.max_price, PriceRange.cooling_days
+        ).filter_by(user_id=user_id).all()
+        
+        return cls((row[0] for row in blacklist), (tuple(row) for row in price_ranges))
+    
+    def is_blacklisted(self, category):
+        return category in self.blacklist
+    
+    def cooling_days_for(self, price):
+        """Период охлаждения диапазона с наибольшим min_price, в который попадает цена"""
+        i = bisect_right(self._mins, price)
+        while i:
+            i -= 1
+            _, max_price, cooling_days = self.price_ranges[i]
+            if max_price is None or max_price >= price:
+                return cooling_days
+        return DEFAULT_COOLING_DAYS
+
+
+class RuleCache:
+    """
+    Кэш снапшотов правил по user_id (LRU ограниченного размера).
+    Сбрасывается при записи в /api/price-ranges и /api/blacklist этого процесса;
+    в других процессах правила устаревают до истечения TTL, поэтому пути,
+    которые сохраняют срок охлаждения, читают правила из БД (load_rules).
+    """
+    
+    def __init__(self, maxsize=10000, ttl=60):
+        self._snapshots = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generation = 0
+        self._lock = threading.Lock()
+    
+    def get(self, user_id):
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is not None:
+            return snapshot
+        
+        with self._lock:
+            generation = self._generation
+        
+        snapshot = RuleSnapshot.load(user_id)
+        
+        # Не сохраняем снапшот, если правила изменились во время загрузки
+        with self._lock:
+            if self._generation == generation:
+                self._snapshots.set(user_id, snapshot)
+        
+        return snapshot
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._snapshots.invalidate(user_id)
+    
+    def stats(self):
+        return self._snapshots.stats()
+
+
+rule_cache = RuleCache(
+    maxsize=int(os.getenv('RULES_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('RULES_CACHE_TTL', 60))
+)
+
 
 class PurchaseAnalyzer:
     @staticmethod
-    def analyze_impulse(user, price, category):
+    def get_rules(user_id):
+        """Получить скомпилированные правила пользователя"""
+        return rule_cache.get(int(user_id))
+    
+    @staticmethod
+    def load_rules(user_id):
+        """Правила из БД в обход кэша (для сохраняемого срока охлаждения)"""
+        return RuleSnapshot.load(int(user_id))
+    
+    @staticmethod
+    def invalidate_rules(user_id):
+        """Сбросить правила пользователя после изменения настроек"""
+        rule_cache.invalidate(int(user_id))
+    
+    @staticmethod
+    def analyze_impulse(user, price, category, rules=None):
         """Анализ импульсивности покупки с финансовым планированием"""
         
-        # Проверка blacklist
-        is_blacklisted = BlacklistCategory.query.filter_by(
-            user_id=user.id, 
-            category=category
-        ).first() is not None
+        if rules is None:
+            rules = PurchaseAnalyzer.get_rules(user.id)
         
-        price_range = PriceRange.query.filter(
-            PriceRange.user_id == user.id,
-            PriceRange.min_price <= price,
-            (PriceRange.max_price >= price) | (PriceRange.max_price.is_(None))
-        ).order_by(PriceRange.min_price.desc()).first()
+        # Проверка blacklist
+        is_blacklisted = rules.is_blacklisted(category)
         
-        cooling_days = price_range.cooling_days if price_range else 7
+        cooling_days = rules.cooling_days_for(price)
         
         # ===== ФИНАНСОВЫЙ АНАЛИЗ =====
         
@@ -26,22 +123,9 @@ class PurchaseAnalyzer:
         shortage = max(0, price - user.current_savings)
         
         savings_days = 0
-        savings_plan = None
-        
         if user.use_savings_calculation and not can_afford_now and user.monthly_savings > 0:
-            # Сколько нужно накопить
-            daily_savings = user.monthly_savings / 30
-            savings_days = int(shortage / daily_savings) + 1
-            
-            # План накопления
-            savings_plan = {
-                'shortage': shortage,
-                'daily_savings': daily_savings,
-                'days_needed': savings_days,
-                'target_date': (datetime.utcnow() + timedelta(days=savings_days)).strftime('%d.%m.%Y'),
-                'monthly_impact': (price / user.salary * 100) if user.salary > 0 else 0
-            }
-        
+            # Сколько дней копить при ежедневных отчислениях
+            savings_days = int(shortage / (user.monthly_savings / 30)) + 1
         
         extra_days = 0
         if price > user.salary * 0.5:  # Если покупка > 50% зарплаты
@@ -49,33 +133,95 @@ class PurchaseAnalyzer:
         elif price > user.salary * 0.3:  # Если покупка > 30% зарплаты
             extra_days = 7  # Дополнительная неделя
         
-        total_cooling_days = max(cooling_days, savings_days) + extra_days
-        
         # ===== РАСЧЁТ УРОВНЯ ИМПУЛЬСИВНОСТИ =====
         
         impulse_score = 0
+        
+        if user.salary > 0:
+            price_ratio = (price / user.salary) * 100
+            if price_ratio > 100:
+                impulse_score += 50
+            elif price_ratio > 50:
+                impulse_score += 40
+            elif price_ratio > 25:
+                impulse_score += 25
+            elif price_ratio > 10:
+                impulse_score += 15
+        
+        if not can_afford_now:
+            impulse_score += 35
+        elif price > user.current_savings * 0.8:
+            impulse_score += 20
+        elif price > user.current_savings * 0.5:
+            impulse_score += 10
+        
+        if is_blacklisted:
+            impulse_score = 100
+        
+        # Подушка безопасности после покупки меньше месячного дохода
+        if user.current_savings > 0 and user.current_savings - price < user.salary:
+            impulse_score += 15
+        
+        impulse_score = min(impulse_score, 100)
+        
+        return PurchaseAnalyzer.describe(user, price, category, {
+            'is_blacklisted': is_blacklisted,
+            'cooling_days': max(cooling_days, savings_days) + extra_days,
+            'price_cooling_days': cooling_days,
+            'savings_days': savings_days,
+            'extra_days': extra_days,
+            'can_afford': can_afford_now,
+            'impulse_score': impulse_score,
+            'risk_level': 'high' if impulse_score >= 70 else 'medium' if impulse_score >= 40 else 'low'
+        })
+    
+    @staticmethod
+    def describe(user, price, category, scores):
+        """
+        Полный результат анализа по числовой оценке покупки: причины, предупреждения,
+        рекомендация и план. scores — поля из analyze_impulse или одной позиции
+        VectorizedAnalyzer.score (is_blacklisted, cooling_days, price_cooling_days,
+        savings_days, extra_days, can_afford, impulse_score, risk_level).
+        """
+        is_blacklisted = scores['is_blacklisted']
+        total_cooling_days = scores['cooling_days']
+        cooling_days = scores['price_cooling_days']
+        savings_days = scores['savings_days']
+        extra_days = scores['extra_days']
+        can_afford_now = scores['can_afford']
+        risk_level = scores['risk_level']
+        
+        shortage = max(0, price - user.current_savings)
+        
+        savings_plan = None
+        if savings_days:
+            # План накопления
+            daily_savings = user.monthly_savings / 30
+            savings_plan = {
+                'shortage': shortage,
+                'daily_savings': daily_savings,
+                'days_needed': savings_days,
+                'target_date': (datetime.utcnow() + timedelta(days=savings_days)).strftime('%d.%m.%Y'),
+                'monthly_impact': (price / user.salary * 100) if user.salary > 0 else 0
+            }
+        
         reasons = []
         financial_warnings = []
         
         if user.salary > 0:
             price_ratio = (price / user.salary) * 100
             if price_ratio > 100:
-                impulse_score += 50
                 reasons.append(f"💰 Цена превышает месячную зарплату ({price_ratio:.0f}%)")
                 financial_warnings.append("⚠️ Это очень крупная покупка, требующая особого внимания")
             elif price_ratio > 50:
-                impulse_score += 40
                 reasons.append(f"💰 Цена составляет {price_ratio:.0f}% от зарплаты")
                 financial_warnings.append("⚠️ Покупка значительно повлияет на бюджет")
             elif price_ratio > 25:
-                impulse_score += 25
                 reasons.append(f"💸 Цена составляет {price_ratio:.0f}% от зарплаты")
             elif price_ratio > 10:
-                impulse_score += 15
                 reasons.append(f"💵 Цена составляет {price_ratio:.0f}% от зарплаты")
         
         if not can_afford_now:
-            impulse_score += 35
             reasons.append(f"🏦 Недостаточно накоплений (нужно ещё {shortage:,.0f} ₽)")
             
             if savings_plan:
@@ -87,40 +233,28 @@ class PurchaseAnalyzer:
                 else:
                     financial_warnings.append(f"✅ Можно накопить за {savings_days} дней")
         
-        elif price > user.current_savings * 0.8:
-            impulse_score += 20
-            reasons.append(f"⚠️ Покупка заберёт {(price/user.current_savings*100):.0f}% накоплений")
-            financial_warnings.append("💰 После покупки останется мало средств на непредвиденные расходы")
         elif price > user.current_savings * 0.5:
-            impulse_score += 10
             reasons.append(f"⚠️ Покупка заберёт {(price/user.current_savings*100):.0f}% накоплений")
+            if price > user.current_savings * 0.8:
+                financial_warnings.append("💰 После покупки останется мало средств на непредвиденные расходы")
         
         if is_blacklisted:
-            impulse_score = 100
             reasons.append(f"🚫 Категория '{category}' в чёрном списке")
         
-        if user.current_savings > 0:
+        if user.current_savings > 0 and user.current_savings - price < user.salary:
             # Идеально иметь подушку = 3-6 месячных расходов
-            ideal_cushion = user.salary * 3
-            after_purchase = user.current_savings - price
-            
-            if after_purchase < user.salary:
-                impulse_score += 15
-                reasons.append("📉 После покупки подушка безопасности < 1 месяца")
-                financial_warnings.append("⚠️ Рекомендуется иметь подушку минимум в 1 месячный доход")
+            reasons.append("📉 После покупки подушка безопасности < 1 месяца")
+            financial_warnings.append("⚠️ Рекомендуется иметь подушку минимум в 1 месячный доход")
         
         # ===== ОПРЕДЕЛЕНИЕ УРОВНЯ РИСКА =====
         
-        if impulse_score >= 70:
-            risk_level = 'high'
+        if risk_level == 'high':
             emoji = '🔴'
             risk_description = 'Очень высокий риск'
-        elif impulse_score >= 40:
-            risk_level = 'medium'
+        elif risk_level == 'medium':
             emoji = '🟡'
             risk_description = 'Средний риск'
         else:
-            risk_level = 'low'
             emoji = '🟢'
             risk_description = 'Низкий риск'
         
@@ -191,7 +325,7 @@ class PurchaseAnalyzer:
             'financial_health': financial_health,
             
             # Оценка риска
-            'impulse_score': min(impulse_score, 100),
+            'impulse_score': scores['impulse_score'],
             'risk_level': risk_level,
             'risk_description': risk_description,
             'emoji': emoji,
@@ -6,13 +6,21 @@ import threading
 
 from models import db
 from routes import api
-from telegram_bot import init_telegram_bot
+from parsers import ProductParser
+from stats import PurchaseStats
+from migrations import run_migrations
+from telegram_bot import init_telegram_bot, get_bot
+from user_cache import user_cache
 
 telegram_bot = None
 
 
-def create_app():
-    """Фабрика приложения"""
+def create_app(start_bot=False):
+    """
+    Фабрика приложения.
+    start_bot=True запускает Telegram бота в этом процессе — так поднимаются
+    WSGI-воркеры в режиме webhook: gunicorn -w 4 'app:create_app(start_bot=True)'
+    """
     app = Flask(__name__, 
                 static_folder='static',
                 template_folder='templates')
@@ -24,6 +32,7 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
     app.config['TELEGRAM_BOT_TOKEN'] = os.getenv('TELEGRAM_BOT_TOKEN')  # НОВОЕ
+    app.config['MATERIALIZED_STATS'] = os.getenv('MATERIALIZED_STATS', '0') == '1'
     
     db.init_app(app)
     CORS(app)
@@ -42,7 +51,26 @@ def create_app():
     
     @app.route('/health')
     def health():
-        return {'status': 'ok', 'message': 'Рациональный Ассистент работает!'}
+        bot = get_bot()
+        return {
+            'status': 'ok',
+            'message': 'Рациональный Ассистент работает!',
+            'product_cache': ProductParser.cache_stats(),
+            'user_cache': user_cache.stats(),
+            'send_queue': bot.send_queue.stats() if bot and bot.send_queue else None,
+            'cooling_timers': bot.cooling_timers.stats() if bot and bot.cooling_timers else None
+        }
+    
+    @app.cli.command('migrate')
+    def migrate():
+        """Применить миграции базы данных"""
+        init_db(app)
+    
+    @app.cli.command('rebuild-user-stats')
+    def rebuild_user_stats():
+        """Пересчитать таблицу user_stats и вывести число расхождений"""
+        rows, mismatched = PurchaseStats.rebuild()
+        print(f"✅ user_stats пересчитана: {rows} пользователей, расхождений: {mismatched}")
     
     @app.route('/download/android')
     def download_android():
@@ -51,13 +79,20 @@ def create_app():
             return send_file(apk_path, as_attachment=True)
         return {'error': 'APK файл не найден'}, 404
     
+    if start_bot:
+        launch_telegram_bot(app)
+    
     return app
 
 
 def init_db(app):
     """Инициализация базы данных"""
     with app.app_context():
+        # create_all создаёт отсутствующие таблицы, изменения существующих — миграции
         db.create_all()
+        applied = run_migrations()
+        if applied:
+            print(f"🔧 Применены миграции: {', '.join(map(str, applied))}")
         print("✅ База данных инициализирована!")
 
 
@@ -73,7 +108,11 @@ def start_telegram_bot(app):
             print("💡 Создайте файл .env и добавьте: TELEGRAM_BOT_TOKEN=ваш_токен")
             return
         
-        telegram_bot = init_telegram_bot(token, db.session)
+        try:
+            telegram_bot = init_telegram_bot(token)
+        except RuntimeError as e:
+            print(f"⚠️  Telegram бот не запущен: {e}")
+            return
         
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
@@ -87,20 +126,23 @@ def start_telegram_bot(app):
             print("🛑 Telegram бот остановлен")
 
 
+def launch_telegram_bot(app):
+    """Запуск бота в фоновом потоке"""
+    bot_thread = threading.Thread(
+        target=start_telegram_bot,
+        args=(app,),
+        daemon=True
+    )
+    bot_thread.start()
+
+
 if __name__ == '__main__':
     app = create_app()
     init_db(app)
     
-    bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
-    
-    if bot_token:
+    if app.config.get('TELEGRAM_BOT_TOKEN'):
         print("\n🤖 Запуск Telegram бота...")
-        bot_thread = threading.Thread(
-            target=start_telegram_bot,
-            args=(app,),
-            daemon=True
-        )
-        bot_thread.start()
+        launch_telegram_bot(app)
         print("✅ Telegram бот запущен в фоновом режиме")
     else:
         print("\n⚠️  Telegram бот НЕ запущен (отсутствует токен)")
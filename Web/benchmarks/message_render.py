@@ -0,0 +1,134 @@
+"""
+Рендер уведомлений для рассылки на 100k получателей: прежние f-строки
+(напоминание собирало все четыре варианта и пересевало глобальный random)
+против каталога шаблонов messages.
+
+    python benchmarks/message_render.py --recipients 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from messages import messages  # noqa: E402
+
+
+def legacy_reminder(purchase, day):
+    """send_periodic_reminder до каталога шаблонов"""
+    days_left = purchase['days_left']
+    variants = [
+        f"🤔 Все еще думаете о покупке?\n\n"
+        f"📦 <b>{purchase['name']}</b>\n"
+        f"💰 {purchase['price']:,.0f} ₽\n\n"
+        f"Осталось подождать: {days_left} дн.\n"
+        f"Возможно, желание пройдет? 🤷‍♂️",
+
+        f"⏰ Напоминание о покупке\n\n"
+        f"📦 <b>{purchase['name']}</b>\n"
+        f"💰 {purchase['price']:,.0f} ₽\n\n"
+        f"До конца периода ожидания: {days_left} дн.\n"
+        f"Вам действительно это нужно? 🤔",
+
+        f"💭 Период обдумывания продолжается\n\n"
+        f"📦 <b>{purchase['name']}</b>\n"
+        f"💰 {purchase['price']:,.0f} ₽\n\n"
+        f"Еще {days_left} дн до решения.\n"
+        f"Может, передумаете? Сэкономите деньги! 💰",
+
+        f"🔔 Проверка желания купить\n\n"
+        f"📦 <b>{purchase['name']}</b>\n"
+        f"💰 {purchase['price']:,.0f} ₽\n\n"
+        f"Осталось {days_left} дн охлаждения.\n"
+        f"Это все еще актуально? 🤷",
+    ]
+    random.seed(purchase['id'] + day)
+    return random.choice(variants)
+
+
+def legacy_weekly(summary):
+    """notify_weekly_stats до каталога шаблонов"""
+    message = (
+        f"📊 <b>Итоги недели</b>\n\n"
+        f"👤 {summary['nickname']}\n"
+        f"🛒 Покупок добавлено: {summary['purchases']}\n"
+        f"💸 Потрачено: {summary['spent']:,.0f} ₽\n"
+        f"💚 Сэкономлено: {summary['saved']:,.0f} ₽\n\n"
+    )
+    if summary['saved'] > summary['spent']:
+        message += "🏆 Отличная работа! Вы сэкономили больше, чем потратили!"
+    elif summary['saved'] > 0:
+        message += "✅ Хороший результат! Продолжайте в том же духе!"
+    else:
+        message += "💡 На этой неделе не было отказов от покупок. Попробуйте быть осторожнее!"
+    return message
+
+
+def render_reminder(purchase, day):
+    return messages.render('reminder', purchase, seed=purchase['id'] + day)
+
+
+def render_weekly(summary):
+    if summary['saved'] > summary['spent']:
+        verdict = 'weekly_stats.saved_more'
+    elif summary['saved'] > 0:
+        verdict = 'weekly_stats.saved'
+    else:
+        verdict = 'weekly_stats.none'
+    return messages.render('weekly_stats', {**summary, 'verdict': messages.render(verdict)})
+
+
+def recipients(count):
+    rng = random.Random(1)
+    purchases = [
+        {'id': i, 'name': f'Товар {i}', 'price': rng.uniform(100, 200000), 'days_left': rng.randint(1, 30)}
+        for i in range(1, count + 1)
+    ]
+    summaries = [
+        {'nickname': f'user{i}', 'purchases': rng.randint(0, 20),
+         'spent': rng.choice((0.0, rng.uniform(0, 50000))), 'saved': rng.choice((0.0, rng.uniform(0, 50000)))}
+        for i in range(1, count + 1)
+    ]
+    return purchases, summaries
+
+
+def timed(repeat, render, items, *args):
+    """Лучшее время из repeat прогонов по всем получателям"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            render(item, *args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--recipients', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    purchases, summaries = recipients(args.recipients)
+    day = 17
+
+    for purchase, summary in zip(purchases[:1000], summaries[:1000]):
+        assert render_reminder(purchase, day) == legacy_reminder(purchase, day), 'напоминания расходятся'
+        assert render_weekly(summary) == legacy_weekly(summary), 'итоги недели расходятся'
+
+    rows = [
+        ('reminder', timed(args.repeat, legacy_reminder, purchases, day),
+         timed(args.repeat, render_reminder, purchases, day)),
+        ('weekly_stats', timed(args.repeat, legacy_weekly, summaries), timed(args.repeat, render_weekly, summaries)),
+    ]
+    print(f'Получателей: {args.recipients}')
+    print(f'{"":14}{"f-строки":>12}{"каталог":>12}')
+    for name, legacy, compiled in rows:
+        print(f'{name:14}{legacy:11.2f}с{compiled:11.2f}с   x{legacy / compiled:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Разбор ответа Ozon composer-api: полное декодирование widgetStates с линейными
+поисками ключей (как было) против extract_widgets, плюс разбор цен.
+
+Записанные ответы передаются файлами (тело ответа composer-api как есть):
+
+    python benchmarks/ozon_widgets.py response1.json response2.json
+
+Без файлов используются сгенерированные ответы той же формы и размера
+(около 200 виджетов, значения — JSON-строки).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marketplaces.ozon import extract_widgets, parse_price  # noqa: E402
+
+# Виджеты, которые встречаются на странице товара Ozon
+FILLER_WIDGETS = (
+    'webAddToCart', 'webAspects', 'webCharacteristics', 'webDescription', 'webReviewProductScore',
+    'webStickyProducts', 'webBestSeller', 'webDelivery', 'webSellerList', 'webOneClickButton',
+    'webMarketingLabels', 'webPdpGrid', 'webShareButton', 'webCurrentSeller', 'webInstallment',
+    'webSkuCarousel', 'webProductMainWidget', 'webQuestionCount', 'webFavoriteButton', 'bigPromoPDP'
+)
+PRICES = ('12 990 ₽', '12\u00a0990\u00a0₽', '1\u2009299,50 ₽', '499 ₽', '129\u00a0999 ₽', 12990)
+
+
+def generated_payload(rng, widgets=200):
+    """Ответ composer-api: служебные виджеты разного размера и четыре нужных в случайных местах"""
+    states = {}
+    for i in range(widgets):
+        name = rng.choice(FILLER_WIDGETS)
+        items = [{'id': rng.randrange(10 ** 9), 'title': 'Товар ' * rng.randint(1, 8), 'link': '/product/x-1/'}
+                 for _ in range(rng.randint(1, 40))]
+        states[f'{name}-{rng.randrange(10 ** 7)}-default-{i}'] = json.dumps({'items': items}, ensure_ascii=False)
+
+    needed = {
+        'webProductHeading': {'title': 'Электрический чайник', 'isBestseller': True},
+        'webSale': {'price': rng.choice(PRICES), 'originalPrice': '15 990 ₽'},
+        'seoBreadcrumbs': {'breadcrumbs': [{'name': 'Ozon'}, {'name': 'Дом'}, {'name': 'Кухня'}]},
+        'webGallery': {'images': [{'src': f'//cdn1.ozone.ru/s3/{i}.jpg'} for i in range(12)]}
+    }
+    keys = list(states.items())
+    for name, value in needed.items():
+        keys.insert(rng.randrange(len(keys) + 1), (f'{name}-{rng.randrange(10 ** 7)}-default-1',
+                                                  json.dumps(value, ensure_ascii=False)))
+    return json.dumps({'widgetStates': dict(keys), 'layout': [], 'pageInfo': {}}, ensure_ascii=False).encode()
+
+
+def full_decode(widget_states):
+    """Прежний подход: декодировать все виджеты и искать каждый нужный отдельным проходом"""
+    decoded = {k: json.loads(v) if isinstance(v, str) else v for k, v in widget_states.items()}
+    result = {}
+    for ours, marker in (('heading', 'webProductHeading'), ('sale', 'webSale'),
+                         ('breadcrumbs', 'seoBreadcrumbs'), ('gallery', 'webGallery')):
+        key = next((k for k in decoded if marker in k), None)
+        if key is not None:
+            result[ours] = decoded[key]
+    return result
+
+
+def old_parse_price(value):
+    price_str = value.replace('₽', '').replace(' ', '').strip()
+    return float(price_str) if price_str.isdigit() else 0.0
+
+
+def timed(func, bodies, repeat):
+    """Медиана по повторам времени разбора всех тел, в мкс на ответ"""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for body in bodies:
+            func(json.loads(body)['widgetStates'])
+        runs.append((time.perf_counter() - started) / len(bodies) * 1e6)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('payloads', nargs='*', help='записанные ответы composer-api')
+    parser.add_argument('--generated', type=int, default=50, help='число сгенерированных ответов')
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.payloads:
+        bodies = []
+        for path in args.payloads:
+            with open(path, 'rb') as f:
+                bodies.append(f.read())
+    else:
+        rng = random.Random(1)
+        bodies = [generated_payload(rng) for _ in range(args.generated)]
+
+    sizes = [len(body) for body in bodies]
+    print(f'Ответов: {len(bodies)}, средний размер {statistics.mean(sizes) / 1024:.0f} КБ')
+
+    for sample in bodies:
+        states = json.loads(sample)['widgetStates']
+        assert full_decode(states) == extract_widgets(states), 'результаты разбора расходятся'
+
+    # Разбор тела ответа входит в оба замера, поэтому показан отдельно
+    baseline = timed(lambda states: None, bodies, args.repeat)
+    old = timed(full_decode, bodies, args.repeat)
+    new = timed(extract_widgets, bodies, args.repeat)
+    print(f'json.loads тела      {baseline:10.0f} мкс')
+    print(f'+ все виджеты        {old:10.0f} мкс  (виджеты: {old - baseline:.0f} мкс)')
+    print(f'+ extract_widgets    {new:10.0f} мкс  (виджеты: {new - baseline:.0f} мкс)')
+    print(f'ускорение разбора виджетов x{(old - baseline) / max(new - baseline, 1e-3):.1f}, ответа x{old / new:.2f}')
+
+    print('\nЦена              было      стало')
+    for value in PRICES:
+        old_value = old_parse_price(value) if isinstance(value, str) else 'ошибка'
+        print(f'{value!r:18} {old_value!s:9} {parse_price(value)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Планы и время горячих запросов к purchases без составных индексов и с ними.
+
+Заполняет отдельную SQLite базу (по умолчанию миллион покупок), удаляет индексы
+Purchase, снимает EXPLAIN QUERY PLAN и время запросов, затем создаёт индексы
+миграцией purchase_hot_indexes и повторяет замеры.
+
+    python benchmarks/purchase_indexes.py --rows 1000000 --users 10000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import sqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, User, Purchase  # noqa: E402
+from migrations import _purchase_hot_indexes  # noqa: E402
+
+CATEGORIES = ('Электроника', 'Одежда', 'Книги', 'Дом', 'Продукты', 'Развлечения')
+STATUSES = ('pending', 'approved', 'rejected')
+NOW = datetime(2026, 10, 1, 12, 0)
+
+
+def seed(engine, rows, users, seed_value=1):
+    """Пользователи и покупки за последний год; сроки охлаждения от прошлого до +60 дней"""
+    rng = random.Random(seed_value)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {'id': i, 'nickname': f'user{i}', 'salary': 100000, 'monthly_savings': 20000,
+             'telegram_chat_id': str(i) if i % 2 else None, 'telegram_notifications_enabled': True}
+            for i in range(1, users + 1)
+        ])
+
+        chunk = 50000
+        for start in range(0, rows, chunk):
+            batch = []
+            for _ in range(min(chunk, rows - start)):
+                created_at = NOW - timedelta(minutes=rng.randrange(365 * 24 * 60))
+                cooling_days = rng.choice((0, 1, 3, 7, 14, 30, 60))
+                batch.append({
+                    'user_id': rng.randint(1, users),
+                    'name': 'Покупка',
+                    'price': round(rng.uniform(100, 100000), 2),
+                    'category': rng.choice(CATEGORIES),
+                    'status': rng.choices(STATUSES, weights=(1, 3, 3))[0],
+                    'cooling_period_days': cooling_days,
+                    'cooling_end_date': created_at + timedelta(days=cooling_days),
+                    'created_at': created_at
+                })
+            connection.execute(Purchase.__table__.insert(), batch)
+
+
+def hot_queries(user_id):
+    """Запросы в том виде, в каком их строит приложение"""
+    since = NOW - timedelta(days=7)
+    linked = db.select(User.id).where(
+        User.telegram_chat_id.isnot(None),
+        User.telegram_notifications_enabled == True
+    ).order_by(User.id).limit(1000).subquery()
+
+    return {
+        # PurchaseStats.aggregate
+        'stats': db.select(Purchase.status, db.func.count(Purchase.id), db.func.sum(Purchase.price))
+            .where(Purchase.user_id == user_id).group_by(Purchase.status),
+        # CoolingTimers._load (окно в час)
+        'cooling': db.select(Purchase.id, Purchase.cooling_end_date).where(
+            Purchase.status == 'pending',
+            Purchase.cooling_end_date > NOW,
+            Purchase.cooling_end_date <= NOW + timedelta(hours=1),
+            Purchase.notified_at.is_(None)
+        ),
+        # GET /api/purchases?user_id=<id>&limit=50&fields=name,price, первая страница
+        'list': db.select(Purchase.id, Purchase.created_at, Purchase.name, Purchase.price)
+            .where(Purchase.user_id == user_id)
+            .order_by(Purchase.created_at.desc(), Purchase.id.desc()).limit(50),
+        # PurchaseStats.weekly_summaries, одна пачка
+        'weekly': db.select(User.id, Purchase.status, db.func.count(Purchase.id), db.func.sum(Purchase.price))
+            .join(linked, linked.c.id == User.id)
+            .outerjoin(Purchase, db.and_(Purchase.user_id == User.id, Purchase.created_at >= since))
+            .group_by(User.id, Purchase.status)
+    }
+
+
+def compile_sql(statement):
+    return str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+def measure(engine, users, repeat):
+    """{имя: (план, медиана в мс)}; user_id для каждого повтора свой"""
+    rng = random.Random(2)
+    user_ids = [rng.randint(1, users) for _ in range(repeat)]
+    results = {}
+    with engine.connect() as connection:
+        for name in hot_queries(1):
+            plan = [row[-1] for row in connection.exec_driver_sql(
+                'EXPLAIN QUERY PLAN ' + compile_sql(hot_queries(user_ids[0])[name])
+            )]
+            timings = []
+            for user_id in user_ids:
+                sql = compile_sql(hot_queries(user_id)[name])
+                started = time.perf_counter()
+                connection.exec_driver_sql(sql).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (plan, statistics.median(timings))
+    return results
+
+
+def report(title, results):
+    print(f'\n=== {title} ===')
+    for name, (plan, median_ms) in results.items():
+        print(f'{name:8} {median_ms:10.2f} мс')
+        for line in plan:
+            print(f'         {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', help='файл базы (по умолчанию временный)')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'purchase_indexes.db')
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+
+    started = time.perf_counter()
+    seed(engine, args.rows, args.users)
+    print(f'Заполнено {args.rows} покупок, {args.users} пользователей за {time.perf_counter() - started:.1f} с ({path})')
+
+    with engine.begin() as connection:
+        for index in Purchase.__table__.indexes:
+            index.drop(connection, checkfirst=True)
+        connection.exec_driver_sql('ANALYZE')
+    before = measure(engine, args.users, args.repeat)
+    report('без индексов', before)
+
+    with engine.begin() as connection:
+        started = time.perf_counter()
+        _purchase_hot_indexes(connection)
+        print(f'\nМиграция purchase_hot_indexes: {time.perf_counter() - started:.1f} с')
+        connection.exec_driver_sql('ANALYZE')
+    after = measure(engine, args.users, args.repeat)
+    report('с индексами', after)
+
+    print('\n=== ускорение ===')
+    for name in before:
+        print(f'{name:8} x{before[name][1] / max(after[name][1], 1e-6):.1f}')
+
+    engine.dispose()
+    if not args.db:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import os
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# На сколько вперёд загружать сроки окончания охлаждения из БД
+COOLING_TIMER_WINDOW = timedelta(hours=int(os.getenv('COOLING_TIMER_WINDOW_HOURS', 24)))
+# За сколько до конца загруженного окна подгружать следующее
+COOLING_TIMER_REFRESH = timedelta(hours=1)
+# Пауза перед повтором после ошибки подгрузки или обработки наступивших сроков (секунды)
+LOAD_RETRY_DELAY = 60
+
+
+class CoolingTimers:
+    """
+    Таймеры окончания периодов охлаждения: куча (срок, id покупки) в памяти процесса.
+    Сроки подгружаются из БД окнами (COOLING_TIMER_WINDOW) по индексу (status, cooling_end_date),
+    новые и изменённые покупки добавляются через track(), вставленные пачкой — через
+    track_user(user_id, created_since). Поток таймеров просыпается
+    к ближайшему сроку и передаёт наступившие id в on_due(ids) внутри контекста приложения.
+    """
+
+    def __init__(self, app, on_due, window=COOLING_TIMER_WINDOW, refresh=COOLING_TIMER_REFRESH):
+        self.app = app
+        self.on_due = on_due
+        self.window = window
+        self.refresh = refresh
+
+        self._heap = []   # (срок, id покупки); устаревшие записи пропускаются при извлечении
+        self._due = {}    # id покупки -> актуальный срок
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.loaded_until = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='cooling-timers', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def track(self, purchase_id, due, active=True):
+        """Поставить, перенести или (active=False) снять таймер покупки"""
+        with self._cond:
+            if not active:
+                self._due.pop(purchase_id, None)
+                return
+
+            # Сроки за пределами окна подхватит следующая подгрузка
+            if self.loaded_until is None or due > self.loaded_until:
+                self._due.pop(purchase_id, None)
+                return
+
+            self._due[purchase_id] = due
+            heapq.heappush(self._heap, (due, purchase_id))
+            self._cond.notify()
+
+    def cancel(self, purchase_id):
+        self.track(purchase_id, None, active=False)
+
+    def track_user(self, user_id, created_since=None):
+        """
+        Поставить таймеры ожидающих покупок пользователя, в том числе просроченных
+        (нужен контекст приложения). Вызывается после привязки Telegram или включения
+        уведомлений: пока их не было, наступившие сроки снимались без уведомления.
+        created_since ограничивает покупками, созданными не раньше этого момента, —
+        так ставятся таймеры пакетно вставленных покупок (пакетный анализ, импорт),
+        срок которых попал в уже загруженное окно.
+        """
+        from models import db, Purchase
+
+        if self.loaded_until is None:
+            return
+
+        query = db.session.query(Purchase.id, Purchase.cooling_end_date).filter(
+            Purchase.user_id == user_id,
+            Purchase.status == 'pending',
+            Purchase.cooling_end_date <= self.loaded_until,
+            Purchase.notified_at.is_(None)
+        )
+        if created_since is not None:
+            query = query.filter(Purchase.created_at >= created_since)
+        rows = query.all()
+        for purchase_id, due in rows:
+            self.track(purchase_id, due)
+
+    def stats(self):
+        return {
+            'scheduled': len(self._due),
+            'next_due': self._heap[0][0].isoformat() if self._heap else None,
+            'loaded_until': self.loaded_until.isoformat() if self.loaded_until else None
+        }
+
+    def _load(self, now):
+        """Подгрузить сроки до now + window (при первом запуске — и просроченные)"""
+        from models import db, Purchase
+
+        with self._cond:
+            lower = self.loaded_until
+            upper = self.loaded_until = now + self.window
+
+        query = db.session.query(Purchase.id, Purchase.cooling_end_date).filter(
+            Purchase.status == 'pending',
+            Purchase.cooling_end_date <= upper,
+            Purchase.notified_at.is_(None)
+        )
+        if lower is not None:
+            query = query.filter(Purchase.cooling_end_date > lower)
+
+        try:
+            rows = query.all()
+        except Exception:
+            with self._cond:
+                self.loaded_until = lower
+            raise
+
+        with self._cond:
+            for purchase_id, due in rows:
+                if purchase_id not in self._due:
+                    self._due[purchase_id] = due
+                    heapq.heappush(self._heap, (due, purchase_id))
+        logger.info(f"Cooling timers loaded {len(rows)} purchases up to {upper}")
+
+    def _retry(self, ids, due):
+        """Вернуть в кучу id, которые не удалось обработать (если их не перенесли и не сняли за это время)"""
+        with self._cond:
+            for purchase_id in ids:
+                if purchase_id not in self._due:
+                    self._due[purchase_id] = due
+                    heapq.heappush(self._heap, (due, purchase_id))
+            self._cond.notify()
+
+    def _pop_due(self, now):
+        ids = []
+        while self._heap and self._heap[0][0] <= now:
+            due, purchase_id = heapq.heappop(self._heap)
+            if self._due.get(purchase_id) == due:
+                del self._due[purchase_id]
+                ids.append(purchase_id)
+        return ids
+
+    def _run(self):
+        while True:
+            now = datetime.utcnow()
+
+            if self.loaded_until is None or now >= self.loaded_until - self.refresh:
+                try:
+                    with self.app.app_context():
+                        self._load(now)
+                except Exception as e:
+                    logger.error(f"Cooling timers load error: {e}")
+                    with self._cond:
+                        self._cond.wait(timeout=LOAD_RETRY_DELAY)
+                    continue
+
+            with self._cond:
+                if self._stopped:
+                    return
+
+                ids = self._pop_due(now)
+                if not ids:
+                    wake_at = self.loaded_until - self.refresh
+                    if self._heap:
+                        wake_at = min(wake_at, self._heap[0][0])
+                    self._cond.wait(timeout=max((wake_at - now).total_seconds(), 0.01))
+                    continue
+
+            try:
+                with self.app.app_context():
+                    self.on_due(ids)
+            except Exception as e:
+                logger.error(f"Cooling timers callback error: {e}")
+                self._retry(ids, datetime.utcnow() + timedelta(seconds=LOAD_RETRY_DELAY))
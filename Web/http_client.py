@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3'
+}
+
+
+class PooledHttpClient:
+    """
+    HTTP-клиент с пулом keep-alive соединений на каждый хост,
+    ограничением параллельных запросов к хосту и повторами с backoff.
+    """
+
+    def __init__(self, pool_size=10, max_concurrency=8, retries=2, backoff=0.3,
+                 timeout=(3.05, 10), max_workers=16, max_hosts=16):
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+        # Ограниченное число повторов: без ожидания Retry-After, чтобы не держать воркер
+        self.retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=False,
+            raise_on_status=False
+        )
+
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+
+        # PoolManager адаптера держит отдельный пул keep-alive соединений на каждый хост
+        # (до max_hosts). Адаптеры монтируются только здесь: Session.mount во время
+        # запросов из других потоков меняет словарь, по которому идёт get_adapter.
+        adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size, max_retries=self.retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._limits = {}
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http-client')
+
+    def _host_limit(self, host):
+        """Семафор ограничения параллельных запросов к хосту"""
+        limit = self._limits.get(host)
+        if limit is not None:
+            return limit
+
+        with self._lock:
+            if host not in self._limits:
+                self._limits[host] = threading.BoundedSemaphore(self.max_concurrency)
+            return self._limits[host]
+
+    def get(self, url, headers=None):
+        """GET-запрос через пул соединений хоста"""
+        parsed = urlparse(url)
+        limit = self._host_limit(parsed.netloc.lower())
+
+        if not limit.acquire(timeout=self.timeout[1]):
+            raise requests.Timeout(f'Превышен лимит одновременных запросов к {parsed.netloc}')
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+            return response
+        finally:
+            limit.release()
+
+    def get_json(self, url, headers=None):
+        return self.get(url, headers=headers).json()
+
+    async def run_async(self, func, *args):
+        """Выполнить блокирующую функцию в пуле клиента, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def close(self):
+        self.session.close()
+        self.executor.shutdown(wait=False)
+
+
+http_client = PooledHttpClient()
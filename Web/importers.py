@@ -0,0 +1,151 @@
+import codecs
+import csv
+import json
+import math
+from datetime import datetime, timedelta
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Purchase
+from analyzers import PurchaseAnalyzer
+from scoring import VectorizedAnalyzer
+from stats import PurchaseStats
+
+IMPORT_STATUSES = ('pending', 'approved', 'rejected')
+# Сколько ошибок по строкам возвращать в ответе
+MAX_REPORTED_ERRORS = 1000
+
+
+def _decode_lines(stream):
+    """Строки потока байт; недекодируемые байты сохраняются как суррогаты (surrogateescape)"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='surrogateescape')
+    for line in stream:
+        yield decoder.decode(line)
+
+
+def _undecodable(value):
+    """Строка с суррогатами: байты не в UTF-8 или одиночные \\udcXX из JSON"""
+    if not isinstance(value, str):
+        return False
+    try:
+        value.encode('utf-8')
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+class PurchaseImporter:
+    """Потоковый импорт покупок из CSV/NDJSON пачками фиксированного размера"""
+
+    @staticmethod
+    def iter_records(stream, fmt):
+        """
+        (номер строки, словарь) для каждой записи потока. Байты не в UTF-8 не прерывают
+        чтение: такие записи отклоняет validate с ошибкой по строке.
+        """
+        lines = _decode_lines(stream)
+
+        if fmt == 'csv':
+            reader = csv.DictReader(lines)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_no, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield line_no, record
+
+    @staticmethod
+    def validate(record):
+        """Подготовленная строка покупки или текст ошибки"""
+        if not isinstance(record, dict):
+            return 'Неверный формат записи'
+        if any(_undecodable(value) for value in record.values()):
+            return 'Неверная кодировка строки (ожидается UTF-8)'
+        if not all(record.get(k) not in (None, '') for k in ['name', 'price', 'category']):
+            return 'name, price и category обязательны'
+
+        try:
+            price = float(record['price'])
+        except (TypeError, ValueError):
+            return 'Неверная цена'
+        # nan и inf не проходят в БД и роняют всю пачку
+        if not math.isfinite(price) or price < 0:
+            return 'Неверная цена'
+
+        status = record.get('status') or 'pending'
+        if status not in IMPORT_STATUSES:
+            return 'Неверный статус'
+
+        return {
+            'name': str(record['name'])[:255],
+            'price': price,
+            'category': str(record['category'])[:100],
+            'status': status,
+            'notes': record.get('notes') or '',
+            'product_url': record.get('product_url') or None,
+            'image_url': record.get('image_url') or None
+        }
+
+    @staticmethod
+    def import_records(user, records, chunk_size=1000):
+        """
+        Импорт записей (line_no, record): анализ пачкой с одной загрузкой правил,
+        вставка через executemany, commit на каждую пачку.
+        Ошибки строк собираются без прерывания импорта.
+        """
+        rules = PurchaseAnalyzer.load_rules(user.id)
+        report = {'imported': 0, 'failed': 0, 'errors': []}
+
+        def fail(line_no, message):
+            report['failed'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line_no, 'error': message})
+
+        chunk = []
+        for line_no, record in records:
+            row = PurchaseImporter.validate(record)
+            if isinstance(row, str):
+                fail(line_no, row)
+                continue
+
+            chunk.append((line_no, row))
+            if len(chunk) >= chunk_size:
+                PurchaseImporter._insert_chunk(user, rules, chunk, report, fail)
+                chunk = []
+
+        if chunk:
+            PurchaseImporter._insert_chunk(user, rules, chunk, report, fail)
+
+        return report
+
+    @staticmethod
+    def _insert_chunk(user, rules, chunk, report, fail):
+        rows = [row for _, row in chunk]
+        scores = VectorizedAnalyzer.score_for_user(
+            user,
+            [row['price'] for row in rows],
+            [row['category'] for row in rows],
+            rules=rules
+        )
+
+        now = datetime.utcnow()
+        for row, cooling_days, is_blacklisted in zip(rows, scores['cooling_days'], scores['is_blacklisted']):
+            row['user_id'] = user.id
+            row['cooling_period_days'] = int(cooling_days)
+            row['cooling_end_date'] = now + timedelta(days=int(cooling_days))
+            row['is_blacklisted'] = bool(is_blacklisted)
+            row['created_at'] = now
+
+        try:
+            db.session.execute(db.insert(Purchase), rows)
+            # executemany идёт в обход flush, поэтому счётчики обновляем явно
+            PurchaseStats.apply_bulk_insert(db.session.connection(), rows)
+            db.session.commit()
+            report['imported'] += len(rows)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            for line_no, _ in chunk:
+                fail(line_no, f'Ошибка записи: {e.__class__.__name__}')
@@ -0,0 +1,140 @@
+import os
+import socket
+import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import IntegrityError
+from models import db, JobLease
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор узла в таблице аренды
+NODE_ID = os.getenv('NODE_ID') or f'{socket.gethostname()}:{os.getpid()}'
+# Сколько секунд аренда действует без продления (упавший узел освобождает её по истечении)
+LEASE_TTL = int(os.getenv('JOB_LEASE_TTL', 3600))
+# На сколько шардов делить пользователей в тяжёлых задачах
+JOB_SHARDS = int(os.getenv('JOB_SHARDS', 1))
+
+
+def shard_filter(column, shard):
+    """Условие на колонку с id пользователя для шарда (номер, всего шардов)"""
+    if not shard or shard[1] <= 1:
+        return db.true()
+    return column % shard[1] == shard[0]
+
+
+class JobLeases:
+    """
+    Выполнение задач планировщика на нескольких узлах: каждый тик (и каждый его шард)
+    выполняет ровно один узел — тот, кто первым взял аренду условным UPDATE.
+    """
+    
+    @staticmethod
+    def scheduled_tick(trigger, now=None):
+        """
+        Тик текущего запуска — время срабатывания trigger по расписанию, а не момент
+        старта: узлы, запустившие задачу с разной задержкой, получают один и тот же тик
+        """
+        now = now or datetime.now(trigger.timezone)
+        fire_time = JobLeases.last_fire_time(trigger, now - timedelta(seconds=LEASE_TTL), now)
+        if fire_time is None:
+            return now.astimezone(timezone.utc).replace(tzinfo=None, second=0, microsecond=0)
+        return fire_time.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    @staticmethod
+    def last_fire_time(trigger, since, now):
+        """Последнее срабатывание trigger в промежутке от since до now или None"""
+        last = None
+        fire_time = trigger.get_next_fire_time(None, since)
+        while fire_time is not None and fire_time <= now:
+            last = fire_time
+            fire_time = trigger.get_next_fire_time(fire_time, fire_time + timedelta(minutes=1))
+        return last
+    
+    @staticmethod
+    def acquire(name, tick, owner=NODE_ID, ttl=LEASE_TTL):
+        """Взять аренду на тик; False, если тик уже выполнен или аренда занята"""
+        if db.session.get(JobLease, name) is None:
+            try:
+                db.session.add(JobLease(name=name))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+        
+        now = datetime.utcnow()
+        result = db.session.execute(
+            db.update(JobLease)
+            .where(
+                JobLease.name == name,
+                db.or_(JobLease.last_run_at.is_(None), JobLease.last_run_at < tick),
+                db.or_(JobLease.lease_until.is_(None), JobLease.lease_until < now)
+            )
+            .values(owner=owner, lease_until=now + timedelta(seconds=ttl))
+        )
+        db.session.commit()
+        return result.rowcount == 1
+    
+    @staticmethod
+    def complete(name, tick, owner=NODE_ID):
+        """Отметить тик выполненным и освободить аренду"""
+        db.session.execute(
+            db.update(JobLease)
+            .where(JobLease.name == name, JobLease.owner == owner)
+            .values(last_run_at=tick, lease_until=None)
+        )
+        db.session.commit()
+    
+    @staticmethod
+    def release(name, owner=NODE_ID):
+        """Освободить аренду, не отмечая тик (после ошибки)"""
+        db.session.execute(
+            db.update(JobLease)
+            .where(JobLease.name == name, JobLease.owner == owner)
+            .values(lease_until=None)
+        )
+        db.session.commit()
+    
+    @staticmethod
+    def run(job_id, func, tick, shards=JOB_SHARDS):
+        """
+        Выполнить тик задачи. Шарды разбираются узлами по очереди: пока один узел
+        выполняет шард, остальные берут следующие. Возвращает число выполненных здесь шардов.
+        """
+        done = 0
+        for index in range(shards):
+            name = f'{job_id}:{index}'
+            if not JobLeases.acquire(name, tick):
+                continue
+            
+            try:
+                func(shard=(index, shards))
+            except Exception:
+                db.session.rollback()
+                JobLeases.release(name)
+                logger.exception(f"Job {name} failed for tick {tick}")
+                continue
+            
+            JobLeases.complete(name, tick)
+            done += 1
+        return done
+    
+    @staticmethod
+    def missed_tick(job_id, trigger, shards=JOB_SHARDS):
+        """
+        Последний тик trigger, пропущенный после предыдущего выполнения задачи
+        (например, пока узлы были выключены), или None. Новые задачи не догоняются.
+        """
+        last_runs = [
+            row.last_run_at for row in JobLease.query.filter(
+                JobLease.name.in_([f'{job_id}:{index}' for index in range(shards)])
+            )
+        ]
+        if not last_runs or any(last_run is None for last_run in last_runs):
+            return None
+        
+        now = datetime.now(trigger.timezone)
+        since = min(last_runs).replace(tzinfo=timezone.utc) + timedelta(minutes=1)
+        
+        missed = JobLeases.last_fire_time(trigger, since, now)
+        if missed is None:
+            return None
+        return missed.astimezone(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,54 @@
+import importlib
+import threading
+
+# Имя адаптера -> (модуль, класс, название для пользователя)
+_adapters = {}
+# Суффикс домена -> имя адаптера
+_domains = {}
+_instances = {}
+_lock = threading.Lock()
+
+
+def register(name, module, class_name, title, domains):
+    """Зарегистрировать адаптер; модуль импортируется при первом обращении"""
+    _adapters[name] = (module, class_name, title)
+    for domain in domains:
+        _domains[domain.lower()] = name
+
+
+def get_adapter(name):
+    adapter = _instances.get(name)
+    if adapter is not None:
+        return adapter
+    
+    with _lock:
+        if name not in _instances:
+            module, class_name, _ = _adapters[name]
+            _instances[name] = getattr(importlib.import_module(module), class_name)()
+        return _instances[name]
+
+
+def resolve(hostname):
+    """
+    Адаптер для хоста по суффиксу домена (www.ozon.ru -> ozon.ru) или None.
+    hostname — из urlparse(url).hostname: без учётных данных и порта.
+    """
+    if not hostname:
+        return None
+    labels = hostname.lower().rstrip('.').split('.')
+    for i in range(len(labels) - 1):
+        name = _domains.get('.'.join(labels[i:]))
+        if name is not None:
+            return get_adapter(name)
+    return None
+
+
+def supported_titles():
+    titles = [title for _, _, title in _adapters.values()]
+    if len(titles) < 2:
+        return ''.join(titles)
+    return f"{', '.join(titles[:-1])} и {titles[-1]}"
+
+
+register('wildberries', 'marketplaces.wildberries', 'WildberriesAdapter', 'Wildberries', ['wildberries.ru'])
+register('ozon', 'marketplaces.ozon', 'OzonAdapter', 'Ozon', ['ozon.ru'])
@@ -0,0 +1,30 @@
+from abc import ABC, abstractmethod
+
+NOT_FOUND_ERROR = 'Товар не найден'
+
+
+class MarketplaceAdapter(ABC):
+    """
+    Адаптер маркетплейса: извлечение ID товара из URL,
+    запрос к API и разбор ответа. Адаптер без любого из трёх
+    методов не создаётся (TypeError при первом обращении к нему).
+    """
+    
+    name = None
+    # TTL записи в кэше товаров; None — значение по умолчанию
+    cache_ttl = None
+    
+    @abstractmethod
+    def extract_id(self, parsed_url):
+        """ID товара из разобранного URL или словарь с ошибкой"""
+    
+    @abstractmethod
+    def fetch(self, product_id):
+        """Сырой ответ API маркетплейса"""
+    
+    @abstractmethod
+    def parse(self, product_id, payload):
+        """Словарь name/price/category/image_url или словарь с ошибкой"""
+    
+    def load(self, product_id):
+        return self.parse(product_id, self.fetch(product_id))
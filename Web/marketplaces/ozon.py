@@ -0,0 +1,104 @@
+import json
+import os
+import re
+from http_client import http_client
+from marketplaces.base import MarketplaceAdapter
+
+OZON_API_URL = os.getenv('OZON_API_URL', 'https://www.ozon.ru')
+
+# Имя виджета (часть ключа widgetStates до '-') -> наше имя
+WIDGETS = {
+    'webProductHeading': 'heading',
+    'webSale': 'sale',
+    'seoBreadcrumbs': 'breadcrumbs',
+    'webGallery': 'gallery'
+}
+
+_PRICE_JUNK = re.compile(r'[^\d,.]')
+
+
+class OzonAdapter(MarketplaceAdapter):
+    name = 'ozon'
+    
+    def extract_id(self, parsed_url):
+        path_parts = parsed_url.path.split('/')
+        if 'product' in path_parts and len(path_parts) > 2:
+            product_slug = path_parts[path_parts.index('product') + 1]
+            try:
+                return int(product_slug.split('-')[-1]) if '-' in product_slug else int(product_slug)
+            except ValueError:
+                return {'error': 'Неверный ID товара в URL Ozon (используйте URL с числовым ID)'}
+        return {'error': 'Неверный формат URL Ozon'}
+    
+    def fetch(self, product_id):
+        api_url = f'{OZON_API_URL}/api/composer-api.bx/page/json/v2?url=/product/{product_id}'
+        headers = {
+            'Accept': 'application/json',
+            'Referer': 'https://www.ozon.ru/'
+        }
+        return http_client.get_json(api_url, headers=headers)
+    
+    def parse(self, product_id, payload):
+        widgets = extract_widgets(payload.get('widgetStates', {}))
+        
+        main_data = widgets.get('heading')
+        if not main_data:
+            return {'error': 'Данные товара не найдены в ответе Ozon'}
+
+        name = main_data.get('title', 'Неизвестно')
+        price = parse_price(widgets.get('sale', {}).get('price', '0 ₽'))
+
+        category = 'Неизвестно'
+        if 'breadcrumbs' in widgets:
+            breadcrumbs = widgets['breadcrumbs'].get('breadcrumbs', [])
+            category = ' / '.join([b.get('name', '') for b in breadcrumbs[1:]])
+
+        image_data = widgets.get('gallery', {}).get('images', [])
+        image_url = image_data[0].get('src', None) if image_data else None
+        if image_url and not image_url.startswith('http'):
+            image_url = 'https:' + image_url
+
+        return {
+            'name': name,
+            'price': price,
+            'category': category,
+            'image_url': image_url
+        }
+
+
+def extract_widgets(widget_states):
+    """
+    Один проход по ключам widgetStates: находит нужные виджеты по имени
+    (часть ключа до '-') и декодирует только их. Значения виджетов часто
+    сами являются JSON-строками.
+    """
+    raw = {}
+    for key, value in widget_states.items():
+        name = WIDGETS.get(key.partition('-')[0])
+        if name is not None and name not in raw:
+            raw[name] = value
+            if len(raw) == len(WIDGETS):
+                break
+    
+    widgets = {}
+    for name, value in raw.items():
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                continue
+        if isinstance(value, dict):
+            widgets[name] = value
+    return widgets
+
+
+def parse_price(value):
+    """Цена из строки вида '12 990 ₽' (в том числе с неразрывными пробелами и копейками)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    
+    price_str = _PRICE_JUNK.sub('', str(value)).replace(',', '.')
+    try:
+        return float(price_str)
+    except ValueError:
+        return 0.0
@@ -0,0 +1,51 @@
+import os
+from http_client import http_client
+from marketplaces.base import MarketplaceAdapter, NOT_FOUND_ERROR
+
+WB_API_URL = os.getenv('WB_API_URL', 'https://card.wb.ru')
+
+
+class WildberriesAdapter(MarketplaceAdapter):
+    name = 'wildberries'
+    
+    def extract_id(self, parsed_url):
+        # Извлекаем ID из /catalog/{id}/
+        path_parts = parsed_url.path.split('/')
+        if 'catalog' in path_parts and len(path_parts) > 2:
+            product_id_str = path_parts[path_parts.index('catalog') + 1]
+            try:
+                return int(product_id_str)
+            except ValueError:
+                return {'error': 'Неверный ID товара в URL'}
+        return {'error': 'Неверный формат URL Wildberries'}
+    
+    def fetch(self, product_id):
+        api_url = f'{WB_API_URL}/cards/v2/detail?appType=1&curr=rub&dest=-1257786&spp=30&nm={product_id}'
+        headers = {
+            'Accept': 'application/json, text/plain, */*',
+            'Referer': 'https://www.wildberries.ru/'
+        }
+        return http_client.get_json(api_url, headers=headers)
+    
+    def parse(self, product_id, payload):
+        data = payload.get('data', {}).get('products', [])
+        if not data:
+            return {'error': NOT_FOUND_ERROR}
+
+        product = data[0]
+        name = product.get('name', 'Неизвестно')
+        price = product.get('salePriceU', 0) / 100  # В копейках
+        category = product.get('subj_name', product.get('subj_root_name', 'Неизвестно'))
+
+        vol = product_id // 100000
+        part = product_id // 1000
+        basket_num = (vol % 100) + 1 
+        basket = f'basket-{basket_num:02d}.wb.ru'
+        image_url = f'https://{basket}/vol{vol}/part{part}/{product_id}/images/c516x688/1.jpg'
+
+        return {
+            'name': name,
+            'price': price,
+            'category': category,
+            'image_url': image_url
+        }
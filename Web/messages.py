@@ -0,0 +1,164 @@
+import os
+import random
+from string import Formatter
+
+# Язык уведомлений по умолчанию (шаблоны других языков добавляются в TEMPLATES)
+DEFAULT_LOCALE = os.getenv('BOT_LOCALE', 'ru')
+
+# Преобразования полей, которые понимает str.format
+CONVERSIONS = (None, 'r', 's', 'a')
+
+# Шаблоны уведомлений бота: locale -> ключ -> строка str.format или список вариантов
+TEMPLATES = {
+    'ru': {
+        'cooling_ended': (
+            "⏰ <b>Период ожидания закончился!</b>\n\n"
+            "🛒 <b>{name}</b>\n"
+            "💰 {price:,.0f} ₽\n"
+            "📦 {category}\n\n"
+            "Вы все еще хотите это купить?"
+        ),
+        'cooling_ended.line': "⏰ Ожидание закончилось: <b>{name}</b> — {price:,.0f} ₽",
+        'high_impulse': (
+            "{risk_emoji} <b>Новая покупка добавлена</b>\n\n"
+            "🛒 <b>{name}</b>\n"
+            "💰 {price:,.0f} ₽\n"
+            "📊 Риск импульсивности: {impulse_score}%\n\n"
+            "💡 {recommendation}\n"
+            "⏰ Период охлаждения: {cooling_days} дней"
+        ),
+        'high_impulse.line': "{risk_emoji} Новая покупка: <b>{name}</b> — {price:,.0f} ₽, риск {impulse_score}%",
+        'outbox_digest': "🔔 <b>Новые уведомления ({count})</b>\n\n{lines}",
+        'reminder': [
+            "🤔 Все еще думаете о покупке?\n\n"
+            "📦 <b>{name}</b>\n"
+            "💰 {price:,.0f} ₽\n\n"
+            "Осталось подождать: {days_left} дн.\n"
+            "Возможно, желание пройдет? 🤷‍♂️",
+
+            "⏰ Напоминание о покупке\n\n"
+            "📦 <b>{name}</b>\n"
+            "💰 {price:,.0f} ₽\n\n"
+            "До конца периода ожидания: {days_left} дн.\n"
+            "Вам действительно это нужно? 🤔",
+
+            "💭 Период обдумывания продолжается\n\n"
+            "📦 <b>{name}</b>\n"
+            "💰 {price:,.0f} ₽\n\n"
+            "Еще {days_left} дн до решения.\n"
+            "Может, передумаете? Сэкономите деньги! 💰",
+
+            "🔔 Проверка желания купить\n\n"
+            "📦 <b>{name}</b>\n"
+            "💰 {price:,.0f} ₽\n\n"
+            "Осталось {days_left} дн охлаждения.\n"
+            "Это все еще актуально? 🤷",
+        ],
+        'reminder.keep': "✅ Да, хочу",
+        'reminder.cancel': "❌ Передумал",
+        'reminder_digest': (
+            "🔔 <b>Покупки в периоде ожидания: {count}</b>\n\n"
+            "{lines}\n\n"
+            "Вам действительно всё это нужно? 🤔"
+        ),
+        'reminder_digest.line': "{number}. <b>{name}</b> — {price:,.0f} ₽, осталось {days_left} дн.",
+        'reminder_digest.page': "\n\nСтраница {page} из {pages}",
+        'reminder_digest.keep': "✅ {number}. Хочу",
+        'reminder_digest.cancel': "❌ {number}. Передумал",
+        'savings_goal': (
+            "🎯 <b>Цель накопления близка!</b>\n\n"
+            "До покупки <b>{name}</b> осталось накопить:\n"
+            "⏰ {days_left} дней\n"
+            "💰 Примерно {amount:,.0f} ₽\n\n"
+            "Продолжайте откладывать, вы на правильном пути! 💪"
+        ),
+        'weekly_stats': (
+            "📊 <b>Итоги недели</b>\n\n"
+            "👤 {nickname}\n"
+            "🛒 Покупок добавлено: {purchases}\n"
+            "💸 Потрачено: {spent:,.0f} ₽\n"
+            "💚 Сэкономлено: {saved:,.0f} ₽\n\n"
+            "{verdict}"
+        ),
+        'weekly_stats.saved_more': "🏆 Отличная работа! Вы сэкономили больше, чем потратили!",
+        'weekly_stats.saved': "✅ Хороший результат! Продолжайте в том же духе!",
+        'weekly_stats.none': "💡 На этой неделе не было отказов от покупок. Попробуйте быть осторожнее!",
+    }
+}
+
+
+class MessageTemplate:
+    """
+    Шаблон сообщения: строка разбирается один раз при загрузке (ошибки синтаксиса,
+    неизвестные преобразования и список полей видны сразу), подстановка — str.format_map
+    """
+
+    __slots__ = ('text', 'fields', 'render')
+
+    def __init__(self, text):
+        fields = set()
+        for _, field, _, conversion in Formatter().parse(text):
+            if field is None:
+                continue
+            if conversion not in CONVERSIONS:
+                raise ValueError(f'Неизвестное преобразование !{conversion} в шаблоне: {text!r}')
+            fields.add(field.split('.')[0].split('[')[0])
+
+        self.text = text
+        self.fields = frozenset(fields)
+        self.render = text.format_map
+
+
+class MessageCatalog:
+    """
+    Скомпилированные шаблоны по языкам. Ключ может содержать несколько вариантов текста:
+    вариант выбирается собственным генератором random.Random(seed) на каждый вызов,
+    поэтому выбор детерминирован и не трогает глобальное состояние модуля random.
+    """
+
+    def __init__(self, templates=TEMPLATES, default_locale=DEFAULT_LOCALE):
+        if default_locale not in templates:
+            raise ValueError(f'Нет шаблонов для языка по умолчанию: {default_locale}')
+
+        self.default_locale = default_locale
+        self._templates = {
+            locale: {
+                key: tuple(MessageTemplate(text) for text in ([value] if isinstance(value, str) else value))
+                for key, value in messages.items()
+            }
+            for locale, messages in templates.items()
+        }
+
+        # Переводы должны требовать те же поля, что и шаблоны языка по умолчанию
+        default = self._templates[default_locale]
+        for locale, messages in self._templates.items():
+            for key, variants in messages.items():
+                if key not in default:
+                    raise ValueError(f'Шаблон {locale}:{key} отсутствует в языке {default_locale}')
+                expected = default[key][0].fields
+                for variant in variants:
+                    if variant.fields - expected:
+                        raise ValueError(f'Лишние поля в шаблоне {locale}:{key}: {sorted(variant.fields - expected)}')
+
+        # Откат на язык по умолчанию вычисляется один раз: при рендере — один поиск по словарю
+        self._default = default
+        self._resolved = {locale: {**default, **messages} for locale, messages in self._templates.items()}
+
+    def variants(self, key, locale=None):
+        """Варианты шаблона для языка (с откатом на язык по умолчанию)"""
+        return self._resolved.get(locale or self.default_locale, self._default)[key]
+
+    def render(self, key, values=None, locale=None, seed=None):
+        """
+        Текст по ключу. Для ключа с несколькими вариантами seed задаёт выбор
+        (без seed — случайный); форматируется только выбранный вариант.
+        """
+        variants = self._resolved.get(locale or self.default_locale, self._default)[key]
+        if len(variants) == 1:
+            template = variants[0]
+        else:
+            template = random.Random(seed).choice(variants)
+        return template.render(values or {})
+
+
+messages = MessageCatalog()
@@ -0,0 +1,100 @@
+from datetime import datetime
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from models import db, Purchase, PriceRange, BlacklistCategory, OutboundMessage, JobLease, OutboxEvent
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('name', db.String(100), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False)
+)
+
+
+def _create_indexes(connection, model):
+    """Создать объявленные в модели индексы, которых ещё нет"""
+    for index in model.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _add_column(connection, model, column_name):
+    """Добавить объявленную в модели колонку в существующую таблицу"""
+    table = model.__table__
+    existing = {c['name'] for c in inspect(connection).get_columns(table.name)}
+    if column_name in existing:
+        return
+    
+    column = table.columns[column_name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+
+
+def _purchase_hot_indexes(connection):
+    _create_indexes(connection, Purchase)
+    _create_indexes(connection, PriceRange)
+    _create_indexes(connection, BlacklistCategory)
+
+
+def _purchase_notified_at(connection):
+    _add_column(connection, Purchase, 'notified_at')
+
+
+def _outbound_messages(connection):
+    OutboundMessage.__table__.create(connection, checkfirst=True)
+    _create_indexes(connection, OutboundMessage)
+
+
+def _job_leases(connection):
+    JobLease.__table__.create(connection, checkfirst=True)
+
+
+def _outbox(connection):
+    OutboxEvent.__table__.create(connection, checkfirst=True)
+    _create_indexes(connection, OutboxEvent)
+
+
+def _outbound_message_leases(connection):
+    for column_name in ('owner', 'claim_token', 'lease_until'):
+        _add_column(connection, OutboundMessage, column_name)
+    _create_indexes(connection, OutboundMessage)
+
+
+def _purchase_claim_token(connection):
+    _add_column(connection, Purchase, 'claim_token')
+
+
+# Версионированные миграции: (версия, имя, функция); применяются по возрастанию версии
+MIGRATIONS = [
+    (1, 'purchase_hot_indexes', _purchase_hot_indexes),
+    (2, 'purchase_notified_at', _purchase_notified_at),
+    (3, 'outbound_messages', _outbound_messages),
+    (4, 'job_leases', _job_leases),
+    (5, 'outbox', _outbox),
+    (6, 'outbound_message_leases', _outbound_message_leases),
+    (7, 'purchase_claim_token', _purchase_claim_token),
+]
+
+
+def run_migrations():
+    """Применить недостающие миграции; возвращает список применённых версий"""
+    schema_migrations.create(db.engine, checkfirst=True)
+    
+    with db.engine.connect() as connection:
+        done = {row[0] for row in connection.execute(db.select(schema_migrations.c.version))}
+    
+    applied = []
+    for version, name, migrate in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+        try:
+            with db.engine.begin() as connection:
+                migrate(connection)
+                connection.execute(schema_migrations.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Миграцию уже применил параллельно запущенный процесс
+            continue
+        applied.append(version)
+    
+    return applied
@@ -24,6 +24,7 @@ class User(db.Model):
     price_ranges = db.relationship('PriceRange', backref='user', lazy=True, cascade='all, delete-orphan')
     blacklist_categories = db.relationship('BlacklistCategory', backref='user', lazy=True, cascade='all, delete-orphan')
     purchases = db.relationship('Purchase', backref='user', lazy=True, cascade='all, delete-orphan')
+    stats = db.relationship('UserStats', backref='user', uselist=False, lazy=True, cascade='all, delete-orphan')
 
     def to_dict(self):
         return {
@@ -43,7 +44,7 @@ class PriceRange(db.Model):
     __tablename__ = 'price_ranges'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     min_price = db.Column(db.Float, nullable=False)
     max_price = db.Column(db.Float)
     cooling_days = db.Column(db.Integer, nullable=False)
@@ -61,7 +62,7 @@ class BlacklistCategory(db.Model):
     __tablename__ = 'blacklist_categories'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     category = db.Column(db.String(100), nullable=False)
 
     def to_dict(self):
@@ -73,6 +74,14 @@ class BlacklistCategory(db.Model):
 
 class Purchase(db.Model):
     __tablename__ = 'purchases'
+    __table_args__ = (
+        # Статистика и фильтр по статусу
+        db.Index('ix_purchases_user_status', 'user_id', 'status'),
+        # Проверка окончания периодов охлаждения
+        db.Index('ix_purchases_status_cooling_end', 'status', 'cooling_end_date'),
+        # Список покупок пользователя и недельная статистика
+        db.Index('ix_purchases_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -87,6 +96,25 @@ class Purchase(db.Model):
     product_url = db.Column(db.String(500))
     image_url = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Когда отправлено уведомление об окончании охлаждения
+    notified_at = db.Column(db.DateTime)
+    # Метка процесса, забравшего покупку для уведомления (условный UPDATE)
+    claim_token = db.Column(db.String(32))
+
+    # Поля, которые отдаёт API (см. to_dict)
+    API_FIELDS = (
+        'id', 'name', 'price', 'category', 'status', 'cooling_period_days', 'cooling_end_date',
+        'is_blacklisted', 'notes', 'product_url', 'image_url', 'created_at'
+    )
+
+    @staticmethod
+    def row_to_dict(row, fields):
+        """Сериализация строки выборки по отдельным колонкам"""
+        result = {}
+        for field in fields:
+            value = getattr(row, field)
+            result[field] = value.isoformat() if isinstance(value, datetime) else value
+        return result
 
     def to_dict(self):
         return {
@@ -102,4 +130,83 @@ class Purchase(db.Model):
             'product_url': self.product_url,
             'image_url': self.image_url,
             'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        }
+
+
+class UserStats(db.Model):
+    """Материализованные счётчики покупок пользователя"""
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total = db.Column(db.Integer, default=0, nullable=False)
+    pending = db.Column(db.Integer, default=0, nullable=False)
+    approved = db.Column(db.Integer, default=0, nullable=False)
+    rejected = db.Column(db.Integer, default=0, nullable=False)
+    total_spent = db.Column(db.Float, default=0.0, nullable=False)
+    total_saved = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'pending': self.pending,
+            'approved': self.approved,
+            'rejected': self.rejected,
+            'total_spent': float(self.total_spent),
+            'total_saved': float(self.total_saved)
+        }
+
+
+class OutboundMessage(db.Model):
+    """Исходящее сообщение Telegram, ожидающее отправки в очереди"""
+    __tablename__ = 'outbound_messages'
+    __table_args__ = (
+        db.Index('ix_outbound_messages_status_id', 'status', 'id'),
+        db.Index('ix_outbound_messages_owner', 'owner'),
+        db.Index('ix_outbound_messages_claim_token', 'claim_token'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.String(100), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    parse_mode = db.Column(db.String(20))
+    reply_markup = db.Column(db.Text)
+    priority = db.Column(db.Integer, default=1, nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    # Процесс, который держит сообщение в своей очереди, и срок его аренды
+    owner = db.Column(db.String(100))
+    claim_token = db.Column(db.String(32))
+    lease_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class JobLease(db.Model):
+    """Аренда задачи планировщика: какой узел выполняет тик и до какого тика задача выполнена"""
+    __tablename__ = 'job_leases'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(100))
+    lease_until = db.Column(db.DateTime)
+    last_run_at = db.Column(db.DateTime)
+
+
+class OutboxEvent(db.Model):
+    """Событие для уведомления пользователя; пишется в одной транзакции с изменением состояния"""
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        db.Index('ix_outbox_status_id', 'status', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    purchase_id = db.Column(db.Integer, index=True)
+    kind = db.Column(db.String(50), nullable=False)  # high_impulse, cooling_ended
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sent, skipped
+    claim_token = db.Column(db.String(32))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
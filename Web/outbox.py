@@ -0,0 +1,91 @@
+import os
+import json
+import uuid
+from datetime import datetime
+from models import db, User, OutboxEvent
+from send_queue import SendQueue, QueuedMessage
+
+# Сколько событий outbox переносить в очередь отправки за одну транзакцию
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 200))
+# Как часто проверять outbox без явного сигнала (события других процессов), секунды
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 5))
+
+
+class Outbox:
+    """
+    Transactional outbox уведомлений: события пишутся в той же транзакции,
+    что и изменение покупки, а воркер бота переносит их в outbound_messages.
+    
+    Гарантия доставки — at-least-once. Событие переходит в outbound_messages ровно
+    один раз (claim_token и commit вместе со строками сообщений), но отправка
+    из outbound_messages может повториться: если процесс упал после ответа Telegram,
+    но до удаления строки, после истечения аренды её заберёт и отправит другая
+    очередь. Bot API не принимает ключ идемпотентности, поэтому такой дубль
+    пользователь увидит; idempotency_key защищает только от повторной записи события.
+    """
+    
+    @staticmethod
+    def add(kind, user_id, payload, key, purchase_id=None):
+        """Добавить событие в текущую транзакцию (commit делает вызывающий код)"""
+        db.session.add(OutboxEvent(
+            idempotency_key=key,
+            user_id=user_id,
+            purchase_id=purchase_id,
+            kind=kind,
+            payload=json.dumps(payload, ensure_ascii=False)
+        ))
+    
+    @staticmethod
+    def skip_for_purchase(purchase_id):
+        """Не отправлять ещё не обработанные события покупки (решение уже принято или она удалена)"""
+        OutboxEvent.query.filter_by(purchase_id=purchase_id, status='pending').update(
+            {'status': 'skipped', 'processed_at': datetime.utcnow()}, synchronize_session=False
+        )
+    
+    @staticmethod
+    def drain(render, owner=None, limit=OUTBOX_BATCH_SIZE):
+        """
+        Забрать пачку событий и в одной транзакции превратить их в исходящие сообщения.
+        События одного чата объединяются: render(events) получает список (kind, payload)
+        и возвращает (текст, parse_mode, reply_markup, приоритет); owner — очередь отправки,
+        которой сразу принадлежат созданные строки.
+        Возвращает (число событий, список QueuedMessage, уже сохранённых в outbound_messages).
+        """
+        token = uuid.uuid4().hex
+        now = datetime.utcnow()
+        
+        # Условный UPDATE: параллельный процесс не заберёт те же события
+        batch = db.select(OutboxEvent.id).where(
+            OutboxEvent.status == 'pending'
+        ).order_by(OutboxEvent.id).limit(limit)
+        db.session.execute(
+            db.update(OutboxEvent)
+            .where(OutboxEvent.id.in_(batch), OutboxEvent.status == 'pending')
+            .values(status='sent', claim_token=token, processed_at=now)
+        )
+        
+        rows = db.session.query(
+            OutboxEvent, User.telegram_chat_id, User.telegram_notifications_enabled
+        ).join(User, User.id == OutboxEvent.user_id).filter(
+            OutboxEvent.claim_token == token
+        ).order_by(OutboxEvent.id).all()
+        
+        by_chat = {}
+        for event, chat_id, enabled in rows:
+            if not chat_id or not enabled:
+                event.status = 'skipped'
+                continue
+            by_chat.setdefault(chat_id, []).append((event.kind, json.loads(event.payload)))
+        
+        stored = []
+        for chat_id, events in by_chat.items():
+            message = QueuedMessage(chat_id, *render(events))
+            row = SendQueue.to_row(message, owner)
+            db.session.add(row)
+            stored.append((message, row))
+        
+        db.session.commit()
+        
+        for message, row in stored:
+            message.id = row.id
+        return len(rows), [message for message, _ in stored]
@@ -1,116 +1,95 @@
+import os
 import requests
 from urllib.parse import urlparse
+from http_client import http_client
+from cache import TTLCache
+from singleflight import SingleFlight
+import marketplaces
+from marketplaces.base import NOT_FOUND_ERROR
+
+NEGATIVE_CACHE_TTL = float(os.getenv('PRODUCT_CACHE_NEGATIVE_TTL', 60))
+
+# Кэш результатов по (маркетплейс, ID товара); TTL определяет свежесть цены
+product_cache = TTLCache(
+    maxsize=int(os.getenv('PRODUCT_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('PRODUCT_CACHE_TTL', 600))
+)
+product_flight = SingleFlight()
+
 
 class ProductParser:
+    @staticmethod
+    async def parse_product_url_async(url):
+        """Асинхронный вариант parse_product_url (для event loop Telegram бота)"""
+        try:
+            key = ProductParser.extract_product_key(url)
+            if isinstance(key, dict):
+                return key
+
+            cached = product_cache.get(key)
+            if cached is None:
+                cached = await product_flight.do_async(
+                    key, ProductParser._fetch_and_cache, key, executor=http_client.executor
+                )
+            return dict(cached)
+
+        except Exception as e:
+            return ProductParser._error_from_exception(e)
+
+    @staticmethod
+    def cache_stats():
+        """Счётчики кэша товаров"""
+        return product_cache.stats()
+
+    @staticmethod
+    def extract_product_key(url):
+        """Нормализованный ключ (маркетплейс, ID товара) или словарь с ошибкой"""
+        parsed_url = urlparse(url)
+        adapter = marketplaces.resolve(parsed_url.hostname)
+
+        if adapter is None:
+            return {'error': f'Поддерживаются только {marketplaces.supported_titles()}'}
+
+        product_id = adapter.extract_id(parsed_url)
+        if isinstance(product_id, dict):
+            return product_id
+
+        return (adapter.name, product_id)
+
     @staticmethod
     def parse_product_url(url):
         try:
-            parsed_url = urlparse(url)
-            domain = parsed_url.netloc.lower()
-
-            if 'wildberries.ru' in domain:
-                # Извлекаем ID из /catalog/{id}/
-                path_parts = parsed_url.path.split('/')
-                if 'catalog' in path_parts and len(path_parts) > 2:
-                    product_id_str = path_parts[path_parts.index('catalog') + 1]
-                    try:
-                        product_id = int(product_id_str)
-                    except ValueError:
-                        return {'error': 'Неверный ID товара в URL'}
-                else:
-                    return {'error': 'Неверный формат URL Wildberries'}
-
-                api_url = f'https://card.wb.ru/cards/v2/detail?appType=1&curr=rub&dest=-1257786&spp=30&nm={product_id}'
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'application/json, text/plain, */*',
-                    'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-                    'Referer': 'https://www.wildberries.ru/'
-                }
-                response = requests.get(api_url, headers=headers, timeout=10)
-                response.raise_for_status()
-                data = response.json().get('data', {}).get('products', [])
-                if not data:
-                    return {'error': 'Товар не найден'}
-
-                product = data[0]
-                name = product.get('name', 'Неизвестно')
-                price = product.get('salePriceU', 0) / 100  # В копейках
-                category = product.get('subj_name', product.get('subj_root_name', 'Неизвестно'))
-
-                vol = product_id // 100000
-                part = product_id // 1000
-                basket_num = (vol % 100) + 1 
-                basket = f'basket-{basket_num:02d}.wb.ru'
-                image_url = f'https://{basket}/vol{vol}/part{part}/{product_id}/images/c516x688/1.jpg'
-
-                return {
-                    'name': name,
-                    'price': price,
-                    'category': category,
-                    'image_url': image_url
-                }
-
-            elif 'ozon.ru' in domain:
-                path_parts = parsed_url.path.split('/')
-                if 'product' in path_parts and len(path_parts) > 2:
-                    product_slug = path_parts[path_parts.index('product') + 1]
-                    try:
-                        product_id = int(product_slug.split('-')[-1]) if '-' in product_slug else int(product_slug)
-                    except ValueError:
-                        return {'error': 'Неверный ID товара в URL Ozon (используйте URL с числовым ID)'}
-                else:
-                    return {'error': 'Неверный формат URL Ozon'}
-
-                api_url = f'https://www.ozon.ru/api/composer-api.bx/page/json/v2?url=/product/{product_id}'
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'application/json',
-                    'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-                    'Referer': 'https://www.ozon.ru/'
-                }
-                response = requests.get(api_url, headers=headers, timeout=10)
-                response.raise_for_status()
-                json_data = response.json()
-
-                widgets = json_data.get('widgetStates', {})
-                main_widget_key = next((k for k in widgets if 'webProductHeading' in k), None)
-                if not main_widget_key:
-                    return {'error': 'Данные товара не найдены в ответе Ozon'}
-
-                main_data = widgets[main_widget_key]
-                name = main_data.get('title', 'Неизвестно')
-
-                price_widget_key = next((k for k in widgets if 'webSale' in k), None)
-                price_data = widgets.get(price_widget_key, {})
-                price_str = price_data.get('price', '0 ₽').replace('₽', '').replace(' ', '').strip()
-                price = float(price_str) if price_str.isdigit() else 0.0
-
-                category = 'Неизвестно'
-                seo_widget_key = next((k for k in widgets if 'seoBreadcrumbs' in k), None)
-                if seo_widget_key:
-                    breadcrumbs = widgets[seo_widget_key].get('breadcrumbs', [])
-                    category = ' / '.join([b.get('name', '') for b in breadcrumbs[1:]])
-
-                image_widget_key = next((k for k in widgets if 'webGallery' in k), None)
-                image_data = widgets.get(image_widget_key, {}).get('images', [])
-                image_url = image_data[0].get('src', None) if image_data else None
-                if image_url and not image_url.startswith('http'):
-                    image_url = 'https:' + image_url
-
-                return {
-                    'name': name,
-                    'price': price,
-                    'category': category,
-                    'image_url': image_url
-                }
-
-            else:
-                return {'error': 'Поддерживаются только Wildberries и Ozon'}
-
-        except requests.RequestException as e:
+            key = ProductParser.extract_product_key(url)
+            if isinstance(key, dict):
+                return key
+
+            cached = product_cache.get(key)
+            if cached is None:
+                # Одновременные запросы одного товара ждут единственный запрос к маркетплейсу
+                cached = product_flight.do(key, ProductParser._fetch_and_cache, key)
+            return dict(cached)
+
+        except Exception as e:
+            return ProductParser._error_from_exception(e)
+
+    @staticmethod
+    def _error_from_exception(e):
+        if isinstance(e, requests.RequestException):
             return {'error': f'Ошибка запроса: {str(e)}'}
-        except ValueError as e:
+        if isinstance(e, ValueError):
             return {'error': f'Ошибка парсинга данных: {str(e)}'}
-        except Exception as e:
-            return {'error': f'Неизвестная ошибка: {str(e)}'}
\ No newline at end of file
+        return {'error': f'Неизвестная ошибка: {str(e)}'}
+
+    @staticmethod
+    def _fetch_and_cache(key):
+        """Запрос товара у маркетплейса с сохранением результата в кэш"""
+        name, product_id = key
+        adapter = marketplaces.get_adapter(name)
+        result = adapter.load(product_id)
+
+        if 'error' not in result:
+            product_cache.set(key, result, ttl=adapter.cache_ttl)
+        elif result['error'] == NOT_FOUND_ERROR:
+            product_cache.set(key, result, ttl=NEGATIVE_CACHE_TTL)
+
+        return result
@@ -1,10 +1,21 @@
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, Response, stream_with_context
 from datetime import datetime, timedelta
 from models import db, User, Purchase, PriceRange, BlacklistCategory
 from parsers import ProductParser
 from analyzers import PurchaseAnalyzer
+from scoring import VectorizedAnalyzer
+from stats import PurchaseStats
+from importers import PurchaseImporter
+from outbox import Outbox
 from telegram_bot import get_bot
-import asyncio
+from user_cache import user_cache
+import base64
+import binascii
+import csv
+import io
+import json
+import math
+import zlib
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
@@ -19,14 +30,16 @@ def login():
     if not nickname:
         return jsonify({'error': 'Никнейм обязателен'}), 400
     
-    user = User.query.filter_by(nickname=nickname).first()
+    profile = user_cache.by_nickname(nickname)
     
-    if user:
-        user.last_login = datetime.utcnow()
+    if profile:
+        now = datetime.utcnow()
+        User.query.filter_by(id=profile.id).update({'last_login': now})
         db.session.commit()
+        profile = user_cache.refresh(profile, last_login=now)
         return jsonify({
             'message': 'Вход выполнен',
-            'user': user.to_dict()
+            'user': profile.to_dict()
         })
     else:
         return jsonify({'error': 'Пользователь не найден'}), 404
@@ -92,8 +105,7 @@ def parse_product():
 @api.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     """Получить данные пользователя"""
-    user = User.query.get_or_404(user_id)
-    return jsonify(user.to_dict())
+    return jsonify(user_cache.get_or_404(user_id).to_dict())
 
 
 @api.route('/users/<int:user_id>', methods=['PUT'])
@@ -112,10 +124,29 @@ def update_user(user_id):
         user.use_savings_calculation = data['use_savings_calculation']
     
     db.session.commit()
+    user_cache.invalidate(user_id)
     return jsonify({'message': 'Пользователь обновлен', 'user': user.to_dict()})
 
 
 
+def track_cooling(purchase):
+    """Передать таймерам охлаждения бота новый срок или статус покупки"""
+    bot = get_bot()
+    if bot and bot.cooling_timers:
+        bot.cooling_timers.track(
+            purchase.id,
+            purchase.cooling_end_date,
+            active=purchase.status == 'pending' and purchase.notified_at is None
+        )
+
+
+def track_cooling_created(user_id, since):
+    """Передать таймерам охлаждения покупки пользователя, вставленные пачкой начиная с since"""
+    bot = get_bot()
+    if bot and bot.cooling_timers:
+        bot.cooling_timers.track_user(user_id, created_since=since)
+
+
 @api.route('/purchases', methods=['POST'])
 def create_purchase():
     """Создать новую покупку с анализом"""
@@ -124,13 +155,14 @@ def create_purchase():
     if not all(k in data for k in ['user_id', 'name', 'price', 'category']):
         return jsonify({'error': 'user_id, name, price и category обязательны'}), 400
     
+    # Срок охлаждения сохраняется навсегда, поэтому профиль читается из БД, а не из кэша
     user = User.query.get_or_404(data['user_id'])
     
     price = float(data['price'])
     category = data['category']
     
-    # Анализ импульсивности
-    analysis = PurchaseAnalyzer.analyze_impulse(user, price, category)
+    # Анализ импульсивности; правила тоже из БД — кэш другого процесса мог устареть
+    analysis = PurchaseAnalyzer.analyze_impulse(user, price, category, PurchaseAnalyzer.load_rules(user.id))
     
     # Расчет даты окончания охлаждения
     cooling_end_date = datetime.utcnow() + timedelta(days=analysis['cooling_days'])
@@ -150,14 +182,28 @@ def create_purchase():
     )
     
     db.session.add(purchase)
+    
+    # Уведомление пишется в outbox в той же транзакции; отправляет его воркер бота
+    notify = (analysis['risk_level'] in ['high', 'medium']
+              and user.telegram_chat_id and user.telegram_notifications_enabled)
+    if notify:
+        db.session.flush()
+        Outbox.add('high_impulse', user.id, {
+            'purchase_id': purchase.id,
+            'name': purchase.name,
+            'price': purchase.price,
+            'risk_level': analysis['risk_level'],
+            'impulse_score': analysis['impulse_score'],
+            'recommendation': analysis['recommendation'],
+            'cooling_days': analysis['cooling_days']
+        }, key=f'high_impulse:{purchase.id}', purchase_id=purchase.id)
+    
     db.session.commit()
+    track_cooling(purchase)
     
     bot = get_bot()
-    if bot and analysis['risk_level'] in ['high', 'medium']:
-        try:
-            asyncio.run(bot.notify_high_impulse(purchase, analysis))
-        except Exception as e:
-            print(f"Ошибка отправки уведомления: {e}")
+    if bot and notify:
+        bot.wake_outbox()
     
     return jsonify({
         'id': purchase.id,
@@ -166,22 +212,271 @@ def create_purchase():
     }), 201
 
 
+MAX_BATCH_ITEMS = 1000
+
+
+@api.route('/purchases/analyze-batch', methods=['POST'])
+def analyze_purchases_batch():
+    """Пакетный анализ и создание покупок (одна транзакция)"""
+    data = request.get_json()
+
+    if not data or 'user_id' not in data or not isinstance(data.get('items'), list):
+        return jsonify({'error': 'user_id и items обязательны'}), 400
+
+    items = data['items']
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'Не более {MAX_BATCH_ITEMS} товаров за запрос'}), 400
+
+    user = User.query.get_or_404(data['user_id'])
+    dry_run = bool(data.get('dry_run', False))
+
+    results = [None] * len(items)
+    valid = []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not all(k in item for k in ['name', 'price', 'category']):
+            results[index] = {'index': index, 'error': 'name, price и category обязательны'}
+            continue
+        try:
+            price = float(item['price'])
+        except (TypeError, ValueError):
+            price = None
+        # nan и inf не проходят в БД (ошибка всей пачки при flush) и в JSON ответа
+        if price is None or not math.isfinite(price) or price < 0:
+            results[index] = {'index': index, 'error': 'Неверная цена'}
+            continue
+        valid.append((index, item, price))
+
+    rules = PurchaseAnalyzer.get_rules(user.id) if dry_run else PurchaseAnalyzer.load_rules(user.id)
+    analyses = VectorizedAnalyzer.analyze_batch(
+        user, [price for _, _, price in valid], [item['category'] for _, item, _ in valid], rules=rules
+    )
+
+    now = datetime.utcnow()
+    purchases = []
+
+    for (index, item, price), analysis in zip(valid, analyses):
+        results[index] = {'index': index, 'analysis': analysis}
+
+        if dry_run:
+            continue
+
+        purchase = Purchase(
+            user_id=user.id,
+            name=item['name'],
+            price=price,
+            category=item['category'],
+            cooling_period_days=analysis['cooling_days'],
+            cooling_end_date=now + timedelta(days=analysis['cooling_days']),
+            is_blacklisted=analysis['is_blacklisted'],
+            notes=item.get('notes', ''),
+            product_url=item.get('product_url'),
+            image_url=item.get('image_url')
+        )
+        purchases.append((index, purchase))
+
+    if purchases:
+        db.session.add_all([p for _, p in purchases])
+        db.session.flush()
+
+        # Сериализуем до commit, чтобы не перечитывать каждую строку после expire
+        for index, purchase in purchases:
+            results[index]['purchase'] = purchase.to_dict()
+
+        db.session.commit()
+        track_cooling_created(user.id, now)
+
+    return jsonify({
+        'dry_run': dry_run,
+        'created': len(purchases),
+        'results': results
+    }), 200 if dry_run else 201
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at, purchase_id):
+    raw = f'{created_at.isoformat()}|{purchase_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) из курсора; ValueError при неверном формате"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, purchase_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(purchase_id)
+    except (UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+
+def requested_fields():
+    """Поля из параметра fields= (по умолчанию все) и множество неизвестных полей"""
+    if not request.args.get('fields'):
+        return Purchase.API_FIELDS, set()
+    fields = tuple(f.strip() for f in request.args['fields'].split(',') if f.strip())
+    return fields, set(fields) - set(Purchase.API_FIELDS)
+
+
 @api.route('/purchases', methods=['GET'])
 def get_purchases():
-    """Получить список покупок пользователя"""
+    """
+    Получить список покупок пользователя.
+    С limit или cursor ответ постраничный (ключ пагинации — created_at, id),
+    fields= ограничивает загружаемые и отдаваемые поля.
+    """
     user_id = request.args.get('user_id')
     status = request.args.get('status')
     
     if not user_id:
         return jsonify({'error': 'user_id обязателен'}), 400
     
-    query = Purchase.query.filter_by(user_id=user_id)
+    fields, unknown = requested_fields()
+    if unknown:
+        return jsonify({'error': f"Неизвестные поля: {', '.join(sorted(unknown))}"}), 400
+    
+    # id и created_at нужны для курсора, даже если не запрошены
+    columns = dict.fromkeys(('id', 'created_at') + fields)
+    query = db.session.query(*[getattr(Purchase, c) for c in columns]).filter(
+        Purchase.user_id == user_id
+    )
     
     if status:
-        query = query.filter_by(status=status)
+        statuses = status.split(',')
+        query = query.filter(Purchase.status.in_(statuses)) if len(statuses) > 1 else query.filter(Purchase.status == status)
     
-    purchases = query.order_by(Purchase.created_at.desc()).all()
-    return jsonify([p.to_dict() for p in purchases])
+    query = query.order_by(Purchase.created_at.desc(), Purchase.id.desc())
+    
+    paginated = 'limit' in request.args or 'cursor' in request.args
+    if not paginated:
+        return jsonify([Purchase.row_to_dict(row, fields) for row in query])
+    
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Неверный limit'}), 400
+    
+    if request.args.get('cursor'):
+        try:
+            created_at, purchase_id = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Неверный cursor'}), 400
+        query = query.filter(
+            db.tuple_(Purchase.created_at, Purchase.id) < db.tuple_(created_at, purchase_id)
+        )
+    
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    return jsonify({
+        'items': [Purchase.row_to_dict(row, fields) for row in rows],
+        'next_cursor': next_cursor
+    })
+
+
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+
+def _export_chunks(rows, fmt, fields):
+    """Сериализация строк пачками по EXPORT_CHUNK_ROWS"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for i, row in enumerate(rows, 1):
+            writer.writerow(Purchase.row_to_dict(row, fields).values())
+            if i % EXPORT_CHUNK_ROWS == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+    else:
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(Purchase.row_to_dict(row, fields), ensure_ascii=False))
+            if len(lines) == EXPORT_CHUNK_ROWS:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@api.route('/purchases/export', methods=['GET'])
+def export_purchases():
+    """Потоковая выгрузка всей истории покупок в NDJSON или CSV"""
+    user_id = request.args.get('user_id', type=int)
+    fmt = request.args.get('format', 'ndjson')
+
+    if not user_id:
+        return jsonify({'error': 'user_id обязателен'}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'format должен быть ndjson или csv'}), 400
+
+    fields, unknown = requested_fields()
+    if unknown:
+        return jsonify({'error': f"Неизвестные поля: {', '.join(sorted(unknown))}"}), 400
+
+    # Серверный курсор: в памяти не больше одной пачки строк
+    rows = db.session.query(*[getattr(Purchase, f) for f in fields]).filter(
+        Purchase.user_id == user_id
+    ).order_by(Purchase.id).yield_per(EXPORT_CHUNK_ROWS)
+
+    chunks = _export_chunks(rows, fmt, fields)
+    headers = {
+        'Content-Disposition': f'attachment; filename=purchases_{user_id}.{fmt}'
+    }
+
+    if request.args.get('gzip') == '1' or 'gzip' in request.accept_encodings:
+        chunks = _gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(chunks), content_type=EXPORT_FORMATS[fmt], headers=headers)
+
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+
+@api.route('/purchases/import', methods=['POST'])
+def import_purchases():
+    """
+    Потоковый импорт покупок из тела запроса (CSV с заголовком или NDJSON).
+    Ошибки отдельных строк не прерывают импорт.
+    """
+    user_id = request.args.get('user_id', type=int)
+    fmt = request.args.get('format', 'csv')
+
+    if not user_id:
+        return jsonify({'error': 'user_id обязателен'}), 400
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': 'format должен быть csv или ndjson'}), 400
+
+    user = User.query.get_or_404(user_id)
+
+    started = datetime.utcnow()
+    records = PurchaseImporter.iter_records(request.stream, fmt)
+    report = PurchaseImporter.import_records(user, records)
+    if report['imported']:
+        track_cooling_created(user.id, started)
+
+    return jsonify(report), 201 if report['imported'] else 200
 
 
 @api.route('/purchases/<int:purchase_id>', methods=['PUT'])
@@ -194,11 +489,14 @@ def update_purchase(purchase_id):
         if data['status'] not in ['pending', 'approved', 'rejected']:
             return jsonify({'error': 'Неверный статус'}), 400
         purchase.status = data['status']
+        if purchase.status != 'pending':
+            Outbox.skip_for_purchase(purchase.id)
     
     if 'notes' in data:
         purchase.notes = data['notes']
     
     db.session.commit()
+    track_cooling(purchase)
     return jsonify({'message': 'Покупка обновлена', 'purchase': purchase.to_dict()})
 
 
@@ -206,8 +504,13 @@ def update_purchase(purchase_id):
 def delete_purchase(purchase_id):
     """Удалить покупку"""
     purchase = Purchase.query.get_or_404(purchase_id)
+    Outbox.skip_for_purchase(purchase_id)
     db.session.delete(purchase)
     db.session.commit()
+    
+    bot = get_bot()
+    if bot and bot.cooling_timers:
+        bot.cooling_timers.cancel(purchase_id)
     return jsonify({'message': 'Покупка удалена'})
 
 
@@ -235,6 +538,7 @@ def create_price_range():
     
     db.session.add(price_range)
     db.session.commit()
+    PurchaseAnalyzer.invalidate_rules(price_range.user_id)
     
     return jsonify({
         'message': 'Диапазон создан',
@@ -246,8 +550,10 @@ def create_price_range():
 def delete_price_range(range_id):
     """Удалить диапазон цен"""
     price_range = PriceRange.query.get_or_404(range_id)
+    user_id = price_range.user_id
     db.session.delete(price_range)
     db.session.commit()
+    PurchaseAnalyzer.invalidate_rules(user_id)
     return jsonify({'message': 'Диапазон удален'})
 
 
@@ -282,6 +588,7 @@ def add_to_blacklist():
     
     db.session.add(category)
     db.session.commit()
+    PurchaseAnalyzer.invalidate_rules(category.user_id)
     
     return jsonify({
         'message': 'Категория добавлена',
@@ -293,36 +600,40 @@ def add_to_blacklist():
 def remove_from_blacklist(category_id):
     """Удалить категорию из чёрного списка"""
     category = BlacklistCategory.query.get_or_404(category_id)
+    user_id = category.user_id
     db.session.delete(category)
     db.session.commit()
+    PurchaseAnalyzer.invalidate_rules(user_id)
     return jsonify({'message': 'Категория удалена'})
 
 
+@api.route('/telegram/webhook', methods=['POST'])
+def telegram_webhook():
+    """Приём обновлений Telegram в режиме webhook"""
+    bot = get_bot()
+    if not bot or not bot.webhook_mode or bot.loop is None:
+        return jsonify({'error': 'Webhook не настроен'}), 404
+    
+    if not bot.check_webhook_secret(request.headers.get('X-Telegram-Bot-Api-Secret-Token')):
+        return jsonify({'error': 'Неверный секретный токен'}), 403
+    
+    data = request.get_json(silent=True)
+    if not data or 'update_id' not in data:
+        return jsonify({'error': 'Некорректное обновление'}), 400
+    
+    bot.process_webhook_update(data)
+    return jsonify({'ok': True})
+
+
 @api.route('/statistics/<int:user_id>', methods=['GET'])
 def get_statistics(user_id):
     """Получить статистику пользователя"""
-    user = User.query.get_or_404(user_id)
-    
-    total = Purchase.query.filter_by(user_id=user_id).count()
-    pending = Purchase.query.filter_by(user_id=user_id, status='pending').count()
-    approved = Purchase.query.filter_by(user_id=user_id, status='approved').count()
-    rejected = Purchase.query.filter_by(user_id=user_id, status='rejected').count()
-    
-    spent = db.session.query(db.func.sum(Purchase.price)).filter_by(
-        user_id=user_id, status='approved'
-    ).scalar() or 0
+    user = user_cache.get_or_404(user_id)
     
-    saved = db.session.query(db.func.sum(Purchase.price)).filter_by(
-        user_id=user_id, status='rejected'
-    ).scalar() or 0
+    stats = PurchaseStats.get(user_id)
     
     return jsonify({
-        'total': total,
-        'pending': pending,
-        'approved': approved,
-        'rejected': rejected,
-        'total_spent': float(spent),
-        'total_saved': float(saved),
+        **stats,
         'current_savings': user.current_savings,
         'monthly_savings': user.monthly_savings,
         'salary': user.salary
@@ -0,0 +1,162 @@
+import numpy as np
+from models import db, Purchase
+from analyzers import PurchaseAnalyzer, DEFAULT_COOLING_DAYS
+
+
+class VectorizedAnalyzer:
+    """
+    Векторизованный расчёт импульсивности на NumPy.
+    Повторяет числовую часть PurchaseAnalyzer.analyze_impulse
+    (impulse_score, risk_level, cooling_days, savings_days) для массивов цен,
+    например для сценариев «что если зарплата была бы X» и ночного пересчёта.
+    """
+
+    @staticmethod
+    def price_cooling_days(rules, prices):
+        """Период охлаждения по диапазонам цен для массива цен"""
+        prices = np.asarray(prices, dtype=float)
+        if not rules.price_ranges:
+            return np.full(prices.shape, DEFAULT_COOLING_DAYS)
+
+        mins = np.array([r[0] for r in rules.price_ranges], dtype=float)
+        maxs = np.array([np.inf if r[1] is None else r[1] for r in rules.price_ranges], dtype=float)
+        days = np.array([r[2] for r in rules.price_ranges])
+
+        # Подходящий диапазон с наибольшим min_price — последний True в строке
+        covered = (mins <= prices[..., None]) & (prices[..., None] <= maxs)
+        last = covered.shape[-1] - 1 - np.argmax(covered[..., ::-1], axis=-1)
+
+        return np.where(covered.any(axis=-1), days[last], DEFAULT_COOLING_DAYS)
+
+    @staticmethod
+    def score(prices, categories, salary, current_savings, monthly_savings,
+              use_savings_calculation, rules):
+        """
+        Оценка массива покупок. Параметры пользователя могут быть скалярами
+        или массивами, совместимыми по форме с prices.
+        """
+        prices = np.asarray(prices, dtype=float)
+        prices, salary, current_savings, monthly_savings, use_savings = np.broadcast_arrays(
+            prices,
+            np.asarray(salary, dtype=float),
+            np.asarray(current_savings, dtype=float),
+            np.asarray(monthly_savings, dtype=float),
+            np.asarray(use_savings_calculation, dtype=bool)
+        )
+
+        if categories is None:
+            is_blacklisted = np.zeros(prices.shape, dtype=bool)
+        else:
+            is_blacklisted = np.broadcast_to(np.fromiter(
+                (rules.is_blacklisted(c) for c in np.ravel(categories)), dtype=bool
+            ).reshape(np.shape(categories)), prices.shape)
+
+        cooling_days = VectorizedAnalyzer.price_cooling_days(rules, prices)
+
+        # ===== ФИНАНСОВЫЙ АНАЛИЗ =====
+
+        can_afford = prices <= current_savings
+        shortage = np.maximum(0, prices - current_savings)
+
+        has_plan = use_savings & ~can_afford & (monthly_savings > 0)
+        daily_savings = np.where(has_plan, monthly_savings / 30, 1)
+        savings_days = np.where(has_plan, np.floor(shortage / daily_savings) + 1, 0).astype(int)
+
+        extra_days = np.select([prices > salary * 0.5, prices > salary * 0.3], [14, 7], 0)
+        total_cooling_days = np.maximum(cooling_days, savings_days) + extra_days
+
+        # ===== РАСЧЁТ УРОВНЯ ИМПУЛЬСИВНОСТИ =====
+
+        has_salary = salary > 0
+        price_ratio = np.divide(prices, salary, where=has_salary, out=np.zeros(prices.shape)) * 100
+
+        impulse_score = np.select(
+            [has_salary & (price_ratio > 100), has_salary & (price_ratio > 50),
+             has_salary & (price_ratio > 25), has_salary & (price_ratio > 10)],
+            [50, 40, 25, 15], 0
+        )
+        impulse_score += np.select(
+            [~can_afford, prices > current_savings * 0.8, prices > current_savings * 0.5],
+            [35, 20, 10], 0
+        )
+        impulse_score = np.where(is_blacklisted, 100, impulse_score)
+        impulse_score += np.where((current_savings > 0) & (current_savings - prices < salary), 15, 0)
+
+        risk_level = np.select(
+            [impulse_score >= 70, impulse_score >= 40], ['high', 'medium'], 'low'
+        )
+
+        return {
+            'is_blacklisted': is_blacklisted,
+            'cooling_days': total_cooling_days,
+            'price_cooling_days': cooling_days,
+            'savings_days': savings_days,
+            'extra_days': extra_days,
+            'can_afford': can_afford,
+            'impulse_score': np.minimum(impulse_score, 100),
+            'risk_level': risk_level
+        }
+
+    @staticmethod
+    def score_for_user(user, prices, categories=None, rules=None, **overrides):
+        """Оценка для пользователя; overrides подменяют его параметры (salary=..., ...)"""
+        if rules is None:
+            rules = PurchaseAnalyzer.get_rules(user.id)
+
+        params = {
+            'salary': user.salary,
+            'current_savings': user.current_savings,
+            'monthly_savings': user.monthly_savings,
+            'use_savings_calculation': bool(user.use_savings_calculation)
+        }
+        params.update(overrides)
+
+        return VectorizedAnalyzer.score(prices, categories, rules=rules, **params)
+
+    @staticmethod
+    def analyze_batch(user, prices, categories, rules=None):
+        """
+        Полный анализ списка покупок: числовая оценка одним векторным вызовом,
+        тексты причин и рекомендаций — PurchaseAnalyzer.describe по каждой позиции
+        """
+        if rules is None:
+            rules = PurchaseAnalyzer.get_rules(user.id)
+        if not len(prices):
+            return []
+
+        scores = VectorizedAnalyzer.score_for_user(
+            user, prices, np.array(categories, dtype=object), rules=rules
+        )
+        return [
+            PurchaseAnalyzer.describe(user, price, category, {
+                'is_blacklisted': bool(scores['is_blacklisted'][i]),
+                'cooling_days': int(scores['cooling_days'][i]),
+                'price_cooling_days': int(scores['price_cooling_days'][i]),
+                'savings_days': int(scores['savings_days'][i]),
+                'extra_days': int(scores['extra_days'][i]),
+                'can_afford': bool(scores['can_afford'][i]),
+                'impulse_score': int(scores['impulse_score'][i]),
+                'risk_level': str(scores['risk_level'][i])
+            })
+            for i, (price, category) in enumerate(zip(prices, categories))
+        ]
+
+    @staticmethod
+    def salary_sweep(user, prices, salaries, rules=None):
+        """Сценарий «что если»: матрица оценок размером len(salaries) x len(prices)"""
+        prices = np.asarray(prices, dtype=float)[None, :]
+        salaries = np.asarray(salaries, dtype=float)[:, None]
+        return VectorizedAnalyzer.score_for_user(user, prices, rules=rules, salary=salaries)
+
+    @staticmethod
+    def score_pending(user, rules=None):
+        """Пересчёт всех ожидающих покупок пользователя; возвращает (ids, оценки)"""
+        rows = db.session.query(Purchase.id, Purchase.price, Purchase.category).filter_by(
+            user_id=user.id, status='pending'
+        ).all()
+
+        ids = np.array([r[0] for r in rows], dtype=int)
+        prices = np.array([r[1] for r in rows], dtype=float)
+        categories = np.array([r[2] for r in rows], dtype=object)
+
+        return ids, VectorizedAnalyzer.score_for_user(user, prices, categories, rules=rules)
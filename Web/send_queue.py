@@ -0,0 +1,431 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from telegram.error import RetryAfter, NetworkError
+
+from job_leases import NODE_ID
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше — раньше
+PRIORITY_HIGH = 0      # реакция на действие пользователя
+PRIORITY_NORMAL = 1    # окончание охлаждения
+PRIORITY_LOW = 2       # периодические напоминания
+PRIORITY_BULK = 3      # массовые рассылки (еженедельная статистика)
+
+# Лимиты Telegram: ~30 сообщений в секунду всего и 1 в секунду на чат
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+# Сколько корзин чатов держать в памяти до очистки простаивающих
+MAX_CHAT_BUCKETS = 10000
+# Аренда сохранённых сообщений процессом, секунды: по истечении их забирает другой процесс
+OUTBOUND_LEASE_TTL = int(os.getenv('OUTBOUND_LEASE_TTL', 120))
+# Сколько строк outbound_messages вставлять или удалять одним commit
+OUTBOUND_WRITE_BATCH = int(os.getenv('OUTBOUND_WRITE_BATCH', 500))
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def wait_time(self, now):
+        """Сколько секунд ждать до доступного токена (0 — можно отправлять)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def block(self, until):
+        """Не выдавать токены до until (например, по retry_after)"""
+        self.blocked_until = max(self.blocked_until, until)
+
+    def idle(self, now):
+        return now >= self.blocked_until and self.wait_time(now) == 0 and self.tokens >= self.capacity
+
+
+class GroupCommit:
+    """
+    Групповая запись в БД: элементы, добавленные, пока пишется предыдущая пачка,
+    уходят следующей пачкой (не больше batch_size) одним вызовом write(items)
+    """
+
+    def __init__(self, write, batch_size=OUTBOUND_WRITE_BATCH):
+        self.write = write
+        self.batch_size = batch_size
+        self._items = []
+        self._task = None
+
+    async def add(self, item):
+        """Добавить элемент и дождаться записи его пачки"""
+        future = asyncio.get_running_loop().create_future()
+        self._items.append((item, future))
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self):
+        try:
+            while self._items:
+                batch = self._items[:self.batch_size]
+                del self._items[:self.batch_size]
+                try:
+                    await self.write([item for item, _ in batch])
+                finally:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            self._task = None
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+class QueuedMessage:
+    __slots__ = ('id', 'chat_id', 'text', 'parse_mode', 'reply_markup', 'priority', 'attempts', 'enqueued_at')
+
+    def __init__(self, chat_id, text, parse_mode='HTML', reply_markup=None, priority=PRIORITY_NORMAL,
+                 attempts=0, enqueued_at=None, id=None):
+        self.id = id
+        self.chat_id = str(chat_id)
+        self.text = text
+        self.parse_mode = parse_mode
+        self.reply_markup = reply_markup
+        self.priority = priority
+        self.attempts = attempts
+        self.enqueued_at = enqueued_at or time.time()
+
+
+class SendQueue:
+    """
+    Очередь исходящих сообщений Telegram с приоритетами и корзинами токенов
+    (общей и на каждый чат). Учитывает retry_after, повторяет отправку с backoff
+    и хранит неотправленные сообщения в БД (outbound_messages), чтобы пережить перезапуск.
+    Каждая строка принадлежит одному процессу (owner) на срок аренды, который он продлевает;
+    сообщения без владельца или с истёкшей арендой забираются условным UPDATE.
+    """
+
+    def __init__(self, send_func, app=None, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE,
+                 max_attempts=5, max_backoff=60, max_in_flight=GLOBAL_RATE, lease_ttl=OUTBOUND_LEASE_TTL):
+        self.send_func = send_func
+        self.app = app
+        # Уникален для экземпляра: перезапущенный процесс с тем же NODE_ID не считает чужие строки своими
+        self.owner = f'{NODE_ID}:{uuid.uuid4().hex[:8]}'
+        self.lease_ttl = lease_ttl
+        self.per_chat_rate = per_chat_rate
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+
+        self._ready = []    # (priority, seq, message)
+        self._delayed = []  # (not_before, seq, message)
+        self._seq = itertools.count()
+        self._global = TokenBucket(global_rate, global_rate, time.monotonic())
+        self._chat_buckets = {}
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+        self._wakeup = asyncio.Event()
+        self._runner = None
+        self._leases = None
+        self.loop = None
+        # Вставки новых и удаление доставленных сообщений пишутся пачками
+        self._inserts = GroupCommit(lambda messages: self._db(self._insert_many, messages))
+        self._deletes = GroupCommit(lambda messages: self._db(self._delete_many, messages))
+
+        # Запись в БД выполняется последовательно и вне event loop
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='send-queue-db')
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    # ===== ПУБЛИЧНЫЙ ИНТЕРФЕЙС =====
+
+    async def start(self):
+        """Забрать сохранённые сообщения и запустить обработчик очереди и продление аренды"""
+        self.loop = asyncio.get_running_loop()
+        for message in await self._db(self._claim):
+            self._push(message)
+        self._runner = asyncio.create_task(self._run())
+        self._leases = asyncio.create_task(self._keep_leases())
+
+    async def stop(self):
+        for task in (self._runner, self._leases):
+            if task:
+                task.cancel()
+        self._inserts.cancel()
+        self._deletes.cancel()
+        self._db_executor.shutdown(wait=False)
+
+    async def put(self, chat_id, text, parse_mode='HTML', reply_markup=None, priority=PRIORITY_NORMAL):
+        """
+        Сохранить сообщение в outbound_messages и поставить в очередь.
+        Одновременные вызовы (например, из asyncio.gather) сохраняются одним commit.
+        """
+        message = QueuedMessage(chat_id, text, parse_mode, reply_markup, priority)
+        await self._inserts.add(message)
+        self._push(message)
+        return message
+
+    def push_stored(self, messages):
+        """
+        Поставить в очередь сообщения, уже сохранённые в outbound_messages (например, из outbox)
+        со строками, созданными to_row(message, owner=self.owner)
+        """
+        for message in messages:
+            self._push(message)
+
+    def stats(self):
+        return {
+            'depth': len(self._ready) + len(self._delayed),
+            'ready': len(self._ready),
+            'delayed': len(self._delayed),
+            'in_flight': len(self._tasks),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'latency_avg': round(self._latency_total / self.sent, 3) if self.sent else 0.0,
+            'latency_max': round(self._latency_max, 3)
+        }
+
+    # ===== ОБРАБОТКА ОЧЕРЕДИ =====
+
+    def _push(self, message, not_before=None):
+        if not_before is None:
+            heapq.heappush(self._ready, (message.priority, next(self._seq), message))
+        else:
+            heapq.heappush(self._delayed, (not_before, next(self._seq), message))
+        self._wakeup.set()
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.idle(now)}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, 1, now)
+        return bucket
+
+    async def _wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, message = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (message.priority, seq, message))
+
+            if not self._ready:
+                await self._wait(self._delayed[0][0] - now if self._delayed else None)
+                continue
+
+            wait = self._global.wait_time(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            _, seq, message = heapq.heappop(self._ready)
+            bucket = self._chat_bucket(message.chat_id, now)
+            wait = bucket.wait_time(now)
+            if wait > 0:
+                heapq.heappush(self._delayed, (now + wait, seq, message))
+                continue
+
+            bucket.consume()
+            self._global.consume()
+
+            await self._in_flight.acquire()
+            task = asyncio.create_task(self._deliver(message))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, message):
+        try:
+            await self.send_func(message.chat_id, message.text, message.parse_mode, message.reply_markup)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            delay = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+            # По ответу 429 не видно, чат это или общий лимит бота, поэтому пауза для всей очереди
+            now = time.monotonic()
+            until = now + delay
+            self._chat_bucket(message.chat_id, now).block(until)
+            self._global.block(until)
+            await self._retry(message, delay, e)
+        except NetworkError as e:
+            await self._retry(message, min(self.max_backoff, 2 ** message.attempts), e)
+        except Exception as e:
+            # Ошибки вроде Forbidden/BadRequest повторять бессмысленно
+            await self._fail(message, e)
+        else:
+            latency = time.time() - message.enqueued_at
+            self.sent += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+            await self._deletes.add(message)
+            logger.info(f"Notification sent to {message.chat_id}")
+        finally:
+            self._in_flight.release()
+
+    async def _retry(self, message, delay, error):
+        message.attempts += 1
+        if message.attempts >= self.max_attempts:
+            await self._fail(message, error)
+            return
+
+        self.retried += 1
+        logger.warning(f"Retry {message.attempts} for {message.chat_id} in {delay:.1f}s: {error}")
+        await self._db(self._update_attempts, message)
+        self._push(message, not_before=time.monotonic() + delay)
+
+    async def _fail(self, message, error):
+        self.failed += 1
+        logger.error(f"Failed to send notification to {message.chat_id}: {error}")
+        await self._db(self._mark_failed, message, str(error))
+
+    async def _keep_leases(self):
+        """Продлевать аренду своих сообщений и забирать сообщения упавших процессов"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            await self._db(self._renew)
+            for message in await self._db(self._claim):
+                self._push(message)
+
+    # ===== ХРАНЕНИЕ В БД =====
+
+    async def _db(self, func, *args):
+        if self.app is None:
+            return [] if func == self._claim else None
+        return await self.loop.run_in_executor(self._db_executor, self._in_app_context, func, args)
+
+    def _in_app_context(self, func, args):
+        try:
+            with self.app.app_context():
+                return func(*args)
+        except Exception as e:
+            logger.error(f"Send queue storage error: {e}")
+            return [] if func == self._claim else None
+
+    def _claim(self):
+        """
+        Забрать условным UPDATE сообщения без владельца или с истёкшей арендой
+        (параллельный процесс не заберёт те же строки) и загрузить их
+        """
+        from models import db, OutboundMessage
+
+        token = uuid.uuid4().hex
+        now = datetime.utcnow()
+        free = db.and_(
+            OutboundMessage.status == 'queued',
+            db.or_(
+                OutboundMessage.owner.is_(None),
+                db.and_(OutboundMessage.lease_until < now, OutboundMessage.owner != self.owner)
+            )
+        )
+        db.session.execute(
+            db.update(OutboundMessage)
+            .where(OutboundMessage.id.in_(db.select(OutboundMessage.id).where(free)), free)
+            .values(owner=self.owner, claim_token=token, lease_until=now + timedelta(seconds=self.lease_ttl))
+        )
+        db.session.commit()
+
+        rows = OutboundMessage.query.filter_by(claim_token=token).order_by(OutboundMessage.id).all()
+        if rows:
+            logger.info(f"Send queue claimed {len(rows)} stored messages")
+        return [
+            QueuedMessage(
+                row.chat_id, row.text, row.parse_mode,
+                json.loads(row.reply_markup) if row.reply_markup else None,
+                row.priority, row.attempts, row.created_at.timestamp(), row.id
+            )
+            for row in rows
+        ]
+
+    def _renew(self):
+        from models import db, OutboundMessage
+
+        OutboundMessage.query.filter_by(owner=self.owner, status='queued').update(
+            {'lease_until': datetime.utcnow() + timedelta(seconds=self.lease_ttl)}, synchronize_session=False
+        )
+        db.session.commit()
+
+    @staticmethod
+    def to_row(message, owner=None, lease_ttl=OUTBOUND_LEASE_TTL):
+        """Строка outbound_messages для сообщения (без commit); owner — очередь, которая его отправит"""
+        from models import OutboundMessage
+
+        reply_markup = message.reply_markup
+        if reply_markup is not None and not isinstance(reply_markup, dict):
+            reply_markup = reply_markup.to_dict()
+
+        return OutboundMessage(
+            chat_id=message.chat_id,
+            text=message.text,
+            parse_mode=message.parse_mode,
+            reply_markup=json.dumps(reply_markup, ensure_ascii=False) if reply_markup else None,
+            priority=message.priority,
+            owner=owner,
+            lease_until=datetime.utcnow() + timedelta(seconds=lease_ttl) if owner else None
+        )
+
+    def _insert_many(self, messages):
+        from models import db
+
+        rows = [self.to_row(message, self.owner, self.lease_ttl) for message in messages]
+        db.session.add_all(rows)
+        db.session.commit()
+        for message, row in zip(messages, rows):
+            message.id = row.id
+
+    def _delete_many(self, messages):
+        from models import db, OutboundMessage
+
+        ids = [message.id for message in messages if message.id is not None]
+        if ids:
+            db.session.execute(db.delete(OutboundMessage).where(OutboundMessage.id.in_(ids)))
+            db.session.commit()
+
+    def _update_attempts(self, message):
+        from models import db, OutboundMessage
+
+        if message.id is not None:
+            OutboundMessage.query.filter_by(id=message.id).update({'attempts': message.attempts})
+            db.session.commit()
+
+    def _mark_failed(self, message, error):
+        from models import db, OutboundMessage
+
+        if message.id is not None:
+            OutboundMessage.query.filter_by(id=message.id).update({
+                'status': 'failed',
+                'attempts': message.attempts,
+                'last_error': error[:500],
+                'updated_at': datetime.utcnow()
+            })
+            db.session.commit()
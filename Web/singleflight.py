@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Объединение одновременных вызовов с одинаковым ключом:
+    функция выполняется один раз, остальные вызовы (потоки и asyncio-задачи)
+    ждут и получают тот же результат.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        """Future текущего вызова по ключу и признак того, что вызывающий — ведущий"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _run(self, key, future, func, args):
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def do(self, key, func, *args):
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, func, args)
+        return future.result()
+
+    async def do_async(self, key, func, *args, executor=None):
+        """
+        Вариант для event loop: ведущий выполняет func в executor, остальные не занимают потоки.
+        Каждый вызов ждёт свою asyncio-future: отмена одной задачи не отменяет общий вызов
+        и не затрагивает других ожидающих (asyncio.wrap_future передал бы отмену в общую future).
+        """
+        future, leader = self._join(key)
+        loop = asyncio.get_running_loop()
+        if leader:
+            loop.run_in_executor(executor, self._run, key, future, func, args)
+
+        waiter = loop.create_future()
+
+        def resolve(done):
+            if waiter.done():
+                return
+            if done.exception() is not None:
+                waiter.set_exception(done.exception())
+            else:
+                waiter.set_result(done.result())
+
+        def on_done(done):
+            try:
+                loop.call_soon_threadsafe(resolve, done)
+            except RuntimeError:
+                # event loop ожидающего уже закрыт
+                pass
+
+        future.add_done_callback(on_done)
+        return await waiter
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
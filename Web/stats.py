@@ -0,0 +1,235 @@
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Purchase, UserStats
+from job_leases import shard_filter
+
+STATUSES = ('pending', 'approved', 'rejected')
+# Сколько пользователей обрабатывать одним запросом при еженедельной рассылке
+WEEKLY_CHUNK_SIZE = 1000
+EMPTY_STATS = {
+    'total': 0,
+    'pending': 0,
+    'approved': 0,
+    'rejected': 0,
+    'total_spent': 0.0,
+    'total_saved': 0.0
+}
+
+
+def _add_row(stats, status, count, amount):
+    """Добавить строку GROUP BY status к словарю счётчиков"""
+    stats['total'] += count
+    if status in STATUSES:
+        stats[status] += count
+    if status == 'approved':
+        stats['total_spent'] += float(amount or 0)
+    elif status == 'rejected':
+        stats['total_saved'] += float(amount or 0)
+
+
+class PurchaseStats:
+    @staticmethod
+    def enabled():
+        """
+        Включена ли таблица user_stats (MATERIALIZED_STATS). Пока флаг выключен, строки
+        не обновляются; после включения их пересчитывает flask rebuild-user-stats.
+        """
+        return bool(current_app.config.get('MATERIALIZED_STATS'))
+
+    @staticmethod
+    def aggregate(user_id):
+        """Статистика пользователя одним запросом с GROUP BY status"""
+        rows = db.session.query(
+            Purchase.status, db.func.count(Purchase.id), db.func.sum(Purchase.price)
+        ).filter(Purchase.user_id == user_id).group_by(Purchase.status).all()
+
+        stats = dict(EMPTY_STATS)
+        for status, count, amount in rows:
+            _add_row(stats, status, count, amount)
+        return stats
+
+    @staticmethod
+    def get(user_id):
+        """
+        Статистика пользователя. При MATERIALIZED_STATS читается строка user_stats,
+        которая создаётся при первом обращении.
+        """
+        if not PurchaseStats.enabled():
+            return PurchaseStats.aggregate(user_id)
+
+        row = db.session.get(UserStats, user_id)
+        if row is not None:
+            return row.to_dict()
+
+        # Строка создаётся одной транзакцией, которая берёт блокировку до агрегации:
+        # пустая строка вставляется первой (в SQLite это блокировка БД на запись),
+        # а строка пользователя блокируется FOR UPDATE (apply_deltas берёт FOR KEY SHARE).
+        # Параллельная покупка либо закоммичена раньше и попадёт в агрегат,
+        # либо применит свою дельту уже к заполненной строке.
+        try:
+            db.session.execute(db.select(User.id).where(User.id == user_id).with_for_update())
+            db.session.add(UserStats(user_id=user_id, **EMPTY_STATS))
+            db.session.flush()
+        except IntegrityError:
+            # Строку уже создал параллельный запрос
+            db.session.rollback()
+            row = db.session.get(UserStats, user_id)
+            return row.to_dict() if row is not None else PurchaseStats.aggregate(user_id)
+
+        stats = PurchaseStats.aggregate(user_id)
+        UserStats.query.filter_by(user_id=user_id).update(stats, synchronize_session=False)
+        db.session.commit()
+        return stats
+
+    @staticmethod
+    def rebuild():
+        """Пересчитать user_stats с нуля; возвращает (число строк, число расхождений)"""
+        rows = db.session.query(
+            Purchase.user_id, Purchase.status, db.func.count(Purchase.id), db.func.sum(Purchase.price)
+        ).group_by(Purchase.user_id, Purchase.status).all()
+
+        fresh = defaultdict(lambda: dict(EMPTY_STATS))
+        for user_id, status, count, amount in rows:
+            _add_row(fresh[user_id], status, count, amount)
+
+        mismatched = 0
+        for row in UserStats.query.all():
+            if row.to_dict() != fresh.get(row.user_id, EMPTY_STATS):
+                mismatched += 1
+
+        UserStats.query.delete()
+        db.session.add_all([UserStats(user_id=user_id, **stats) for user_id, stats in fresh.items()])
+        db.session.commit()
+
+        return len(fresh), mismatched
+
+    @staticmethod
+    def weekly_summaries(since, chunk_size=WEEKLY_CHUNK_SIZE, shard=None):
+        """
+        Итоги за период для пользователей с включёнными уведомлениями.
+        Генератор списков-пачек: на каждую пачку пользователей (по возрастанию id)
+        один запрос с LEFT JOIN покупок и GROUP BY user_id, status.
+        """
+        last_id = 0
+        
+        while True:
+            users = db.select(User.id).where(
+                User.telegram_chat_id.isnot(None),
+                User.telegram_notifications_enabled == True,
+                User.id > last_id,
+                shard_filter(User.id, shard)
+            ).order_by(User.id).limit(chunk_size).subquery()
+            
+            rows = db.session.execute(
+                db.select(
+                    User.id, User.nickname, User.telegram_chat_id,
+                    Purchase.status, db.func.count(Purchase.id), db.func.sum(Purchase.price)
+                )
+                .join(users, users.c.id == User.id)
+                .outerjoin(Purchase, db.and_(Purchase.user_id == User.id, Purchase.created_at >= since))
+                .group_by(User.id, User.nickname, User.telegram_chat_id, Purchase.status)
+                .order_by(User.id)
+            ).all()
+            
+            if not rows:
+                return
+            
+            summaries = {}
+            for user_id, nickname, chat_id, status, count, amount in rows:
+                summary = summaries.get(user_id)
+                if summary is None:
+                    summary = summaries[user_id] = {
+                        'user_id': user_id,
+                        'nickname': nickname,
+                        'chat_id': chat_id,
+                        'purchases': 0,
+                        'spent': 0.0,
+                        'saved': 0.0
+                    }
+                summary['purchases'] += count
+                if status == 'approved':
+                    summary['spent'] += float(amount or 0)
+                elif status == 'rejected':
+                    summary['saved'] += float(amount or 0)
+            
+            last_id = rows[-1][0]
+            yield list(summaries.values())
+    
+    @staticmethod
+    def apply_deltas(connection, deltas):
+        """Инкрементально обновить существующие строки user_stats"""
+        if connection.dialect.name != 'sqlite':
+            # Очерёдность с созданием строки в get(); в SQLite её даёт блокировка БД на запись
+            connection.execute(
+                db.select(User.id).where(User.id.in_(list(deltas))).with_for_update(read=True, key_share=True)
+            )
+        now = datetime.utcnow()
+        for user_id, delta in deltas.items():
+            connection.execute(
+                db.update(UserStats)
+                .where(UserStats.user_id == user_id)
+                .values(
+                    total=UserStats.total + delta['total'],
+                    pending=UserStats.pending + delta['pending'],
+                    approved=UserStats.approved + delta['approved'],
+                    rejected=UserStats.rejected + delta['rejected'],
+                    total_spent=UserStats.total_spent + delta['total_spent'],
+                    total_saved=UserStats.total_saved + delta['total_saved'],
+                    updated_at=now
+                )
+            )
+
+    @staticmethod
+    def apply_bulk_insert(connection, rows):
+        """Учесть строки, вставленные в обход ORM (словари с user_id, status, price)"""
+        if not PurchaseStats.enabled():
+            return
+        deltas = defaultdict(lambda: dict.fromkeys(EMPTY_STATS, 0))
+        for row in rows:
+            _add_row(deltas[row['user_id']], row.get('status') or 'pending', 1, row['price'])
+        PurchaseStats.apply_deltas(connection, deltas)
+
+
+def _committed(obj, attr):
+    """Значение атрибута до изменений в текущем flush"""
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, attr)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_purchase_changes(session, flush_context):
+    """Перенос изменений покупок (создание, смена статуса, удаление) в user_stats"""
+    # Без MATERIALIZED_STATS flush не ходит в user_stats и не берёт блокировок
+    if not PurchaseStats.enabled():
+        return
+
+    deltas = defaultdict(lambda: dict.fromkeys(EMPTY_STATS, 0))
+
+    def add(user_id, status, price, sign):
+        _add_row(deltas[user_id], status, sign, sign * (price or 0))
+
+    for obj in session.new:
+        if isinstance(obj, Purchase):
+            add(obj.user_id, obj.status or 'pending', obj.price, 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Purchase):
+            add(_committed(obj, 'user_id'), _committed(obj, 'status'), _committed(obj, 'price'), -1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Purchase) and session.is_modified(obj):
+            old = (_committed(obj, 'user_id'), _committed(obj, 'status'), _committed(obj, 'price'))
+            new = (obj.user_id, obj.status, obj.price)
+            if old != new:
+                add(*old, -1)
+                add(*new, 1)
+
+    if deltas:
+        PurchaseStats.apply_deltas(session.connection(), deltas)
@@ -1,10 +1,21 @@
 import os
+import asyncio
+import hmac
 import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from flask import current_app
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from cooling_timers import CoolingTimers
+from job_leases import JobLeases, shard_filter
+from messages import messages
+from outbox import Outbox, OUTBOX_POLL_INTERVAL
+from send_queue import SendQueue, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, PRIORITY_BULK
+from user_cache import user_cache
 
 # Настройка логирования
 logging.basicConfig(
@@ -13,14 +24,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+RISK_EMOJI = {
+    'high': '🔴',
+    'medium': '🟡',
+    'low': '🟢'
+}
+
+# Размер пачки при обходе покупок с закончившимся охлаждением
+COOLING_BATCH_SIZE = 500
+# Сколько покупок показывать на одной странице сводки напоминаний
+REMINDER_DIGEST_SIZE = int(os.getenv('REMINDER_DIGEST_SIZE', 5))
+# Адрес Bot API (например, локальный сервер или заглушка для нагрузочных тестов)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')
+# Режим webhook: полный публичный URL эндпоинта /api/telegram/webhook и секрет заголовка
+# (обязателен: без него любой мог бы прислать обновление от имени чужого чата).
+# Без URL бот получает обновления через polling
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+# Сколько ждать постановки обновления из webhook в очередь бота (секунды)
+WEBHOOK_ENQUEUE_TIMEOUT = 5
+# Число потоков для запросов к БД из обработчиков бота
+BOT_DB_WORKERS = int(os.getenv('BOT_DB_WORKERS', 4))
+
 
 class TelegramNotificationBot:
     
-    def __init__(self, token: str, db_session):
+    def __init__(self, token: str):
+        if TELEGRAM_WEBHOOK_URL and not TELEGRAM_WEBHOOK_SECRET:
+            raise RuntimeError('Для режима webhook нужен TELEGRAM_WEBHOOK_SECRET')
+        
         self.token = token
-        self.db = db_session
+        self.app = None
+        self.loop = None
         self.application = None
+        self.send_queue = None
+        self.cooling_timers = None
+        self.outbox_wakeup = None
+        self.outbox_task = None
+        self.webhook_mode = bool(TELEGRAM_WEBHOOK_URL)
         self.scheduler = BackgroundScheduler()
+        # Отдельный пул для запросов к БД из обработчиков бота
+        self.db_executor = ThreadPoolExecutor(max_workers=BOT_DB_WORKERS, thread_name_prefix='bot-db')
         
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -40,8 +84,6 @@ class TelegramNotificationBot:
     
     async def link_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Привязка Telegram к аккаунту"""
-        from models import User
-        
         chat_id = update.effective_chat.id
         
         if not context.args:
@@ -51,19 +93,16 @@ class TelegramNotificationBot:
             return
         
         nickname = context.args[0]
-        user = User.query.filter_by(nickname=nickname).first()
         
-        if not user:
+        user_id = await self.run_db(self._link_account, nickname, str(chat_id))
+        if not user_id:
             await update.message.reply_text(
                 f"❌ Пользователь с никнеймом '{nickname}' не найден.\n"
                 "Сначала зарегистрируйтесь в веб-приложении."
             )
             return
         
-        # Сохраняем chat_id в БД
-        user.telegram_chat_id = str(chat_id)
-        user.telegram_notifications_enabled = True
-        self.db.commit()
+        await self.track_user_purchases(user_id)
         
         await update.message.reply_text(
             f"✅ Аккаунт '{nickname}' успешно привязан!\n\n"
@@ -77,41 +116,27 @@ class TelegramNotificationBot:
     
     async def unlink_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отвязка Telegram от аккаунта"""
-        from models import User
-        
         chat_id = str(update.effective_chat.id)
-        user = User.query.filter_by(telegram_chat_id=chat_id).first()
         
-        if not user:
+        if not await self.run_db(self._unlink_account, chat_id):
             await update.message.reply_text("❌ Ваш аккаунт не привязан.")
             return
         
-        user.telegram_chat_id = None
-        user.telegram_notifications_enabled = False
-        self.db.commit()
-        
         await update.message.reply_text("✅ Аккаунт отвязан. Уведомления отключены.")
     
     async def pending_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать ожидающие покупки"""
-        from models import User, Purchase
-        
         chat_id = str(update.effective_chat.id)
-        user = User.query.filter_by(telegram_chat_id=chat_id).first()
+        purchases = await self.run_db(self._pending_purchases, chat_id)
         
-        if not user:
-            await update.message.reply_text(
+        if purchases is None:
+            await update.effective_message.reply_text(
                 "❌ Сначала привяжите аккаунт: /link ваш_никнейм"
             )
             return
         
-        purchases = Purchase.query.filter_by(
-            user_id=user.id,
-            status='pending'
-        ).order_by(Purchase.cooling_end_date).all()
-        
         if not purchases:
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "📋 У вас нет ожидающих покупок.\n"
                 "Все решения приняты! 🎉"
             )
@@ -120,7 +145,7 @@ class TelegramNotificationBot:
         message = "📋 <b>Ожидающие покупки:</b>\n\n"
         
         for p in purchases:
-            end_date = p.cooling_end_date
+            end_date = p['cooling_end_date']
             now = datetime.utcnow()
             days_left = (end_date - now).days
             
@@ -128,10 +153,10 @@ class TelegramNotificationBot:
             days_text = "Можно решить!" if days_left <= 0 else f"Осталось {days_left} дн"
             
             message += (
-                f"{status_emoji} <b>{p.name}</b>\n"
-                f"💰 {p.price:,.0f} ₽ | 📦 {p.category}\n"
+                f"{status_emoji} <b>{p['name']}</b>\n"
+                f"💰 {p['price']:,.0f} ₽ | 📦 {p['category']}\n"
                 f"📅 {days_text}\n"
-                f"{'🚫 В черном списке' if p.is_blacklisted else ''}\n\n"
+                f"{'🚫 В черном списке' if p['is_blacklisted'] else ''}\n\n"
             )
         
         keyboard = [[
@@ -140,7 +165,7 @@ class TelegramNotificationBot:
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             message,
             parse_mode='HTML',
             reply_markup=reply_markup
@@ -148,36 +173,25 @@ class TelegramNotificationBot:
     
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать статистику"""
-        from models import User, Purchase
-        from sqlalchemy import func
-        
         chat_id = str(update.effective_chat.id)
-        user = User.query.filter_by(telegram_chat_id=chat_id).first()
+        stats = await self.run_db(self._user_stats, chat_id)
         
-        if not user:
-            await update.message.reply_text(
+        if stats is None:
+            await update.effective_message.reply_text(
                 "❌ Сначала привяжите аккаунт: /link ваш_никнейм"
             )
             return
         
-        total = Purchase.query.filter_by(user_id=user.id).count()
-        pending = Purchase.query.filter_by(user_id=user.id, status='pending').count()
-        approved = Purchase.query.filter_by(user_id=user.id, status='approved').count()
-        rejected = Purchase.query.filter_by(user_id=user.id, status='rejected').count()
-        
-        spent = self.db.query(func.sum(Purchase.price)).filter_by(
-            user_id=user.id, status='approved'
-        ).scalar() or 0
-        
-        saved = self.db.query(func.sum(Purchase.price)).filter_by(
-            user_id=user.id, status='rejected'
-        ).scalar() or 0
+        total, pending, approved, rejected = (
+            stats['total'], stats['pending'], stats['approved'], stats['rejected']
+        )
+        spent, saved = stats['total_spent'], stats['total_saved']
         
         message = (
             f"📊 <b>Ваша статистика</b>\n\n"
-            f"👤 Пользователь: {user.nickname}\n"
-            f"💰 Зарплата: {user.salary:,.0f} ₽\n"
-            f"🦊 Накопления: {user.current_savings:,.0f} ₽\n\n"
+            f"👤 Пользователь: {stats['nickname']}\n"
+            f"💰 Зарплата: {stats['salary']:,.0f} ₽\n"
+            f"🦊 Накопления: {stats['current_savings']:,.0f} ₽\n\n"
             f"📈 <b>Покупки:</b>\n"
             f"Всего: {total}\n"
             f"⏳ Ожидают: {pending}\n"
@@ -191,32 +205,30 @@ class TelegramNotificationBot:
             efficiency = (saved / (spent + saved)) * 100
             message += f"\n🎯 Эффективность: {efficiency:.1f}%"
         
-        await update.message.reply_text(message, parse_mode='HTML')
+        await update.effective_message.reply_text(message, parse_mode='HTML')
     
     async def settings_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Настройки уведомлений"""
-        from models import User
-        
         chat_id = str(update.effective_chat.id)
-        user = User.query.filter_by(telegram_chat_id=chat_id).first()
+        enabled = await self.run_db(self._notifications_enabled, chat_id)
         
-        if not user:
-            await update.message.reply_text(
+        if enabled is None:
+            await update.effective_message.reply_text(
                 "❌ Сначала привяжите аккаунт: /link ваш_никнейм"
             )
             return
         
-        status = "🟢 Включены" if user.telegram_notifications_enabled else "🔴 Отключены"
+        status = "🟢 Включены" if enabled else "🔴 Отключены"
         
         keyboard = [[
             InlineKeyboardButton(
-                "✅ Включить" if not user.telegram_notifications_enabled else "❌ Отключить",
+                "✅ Включить" if not enabled else "❌ Отключить",
                 callback_data="toggle_notifications"
             )
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             f"⚙️ <b>Настройки уведомлений</b>\n\n"
             f"Статус: {status}\n\n"
             f"Вы получаете уведомления о:\n"
@@ -231,23 +243,22 @@ class TelegramNotificationBot:
     
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка нажатий на кнопки"""
-        from models import User
-        
         query = update.callback_query
         await query.answer()
         
         chat_id = str(update.effective_chat.id)
-        user = User.query.filter_by(telegram_chat_id=chat_id).first()
+        user_id = await self.run_db(self._linked_user_id, chat_id)
         
-        if not user:
+        if not user_id:
             await query.edit_message_text("❌ Аккаунт не привязан.")
             return
         
         if query.data == "toggle_notifications":
-            user.telegram_notifications_enabled = not user.telegram_notifications_enabled
-            self.db.commit()
+            enabled = await self.run_db(self._toggle_notifications, user_id)
+            if enabled:
+                await self.track_user_purchases(user_id)
             
-            status = "включены ✅" if user.telegram_notifications_enabled else "отключены ❌"
+            status = "включены ✅" if enabled else "отключены ❌"
             await query.edit_message_text(f"Уведомления {status}")
         
         elif query.data == "stats":
@@ -257,292 +268,550 @@ class TelegramNotificationBot:
             await self.settings_command(update, context)
         
         elif query.data.startswith("remind_"):
-            action, purchase_id = query.data.split("_")[1], int(query.data.split("_")[2])
-            from models import Purchase
+            action, value = query.data.split("_")[1], int(query.data.split("_")[2])
+            
+            if action == "page":
+                items = await self.run_db(self._reminder_items, user_id)
+                if not items:
+                    await query.edit_message_text("📋 Больше нет покупок, ожидающих решения.")
+                    return
+                
+                message, reply_markup = self.render_reminder_digest(items, value)
+                await query.edit_message_text(message, parse_mode='HTML', reply_markup=reply_markup)
+                return
             
-            purchase = Purchase.query.get(purchase_id)
+            purchase_id = value
+            purchase = await self.run_db(self._remind_action, user_id, purchase_id, action)
             if not purchase:
                 await query.edit_message_text("❌ Покупка не найдена")
                 return
             
+            # Из сводки можно вернуться к списку остальных покупок
+            reply_markup = None
+            original = query.message.reply_markup if query.message else None
+            if original and len(original.inline_keyboard) > 1:
+                reply_markup = InlineKeyboardMarkup([[
+                    InlineKeyboardButton("📋 К списку покупок", callback_data="remind_page_0")
+                ]])
+            
             if action == "keep":
                 await query.edit_message_text(
                     f"✅ Хорошо, напомню вам о покупке позже!\n\n"
-                    f"📦 {purchase.name}\n"
-                    f"💰 {purchase.price:,.0f} ₽\n\n"
-                    f"Период охлаждения продолжается до {purchase.cooling_end_date.strftime('%d.%m.%Y')}"
+                    f"📦 {purchase['name']}\n"
+                    f"💰 {purchase['price']:,.0f} ₽\n\n"
+                    f"Период охлаждения продолжается до {purchase['cooling_end_date'].strftime('%d.%m.%Y')}",
+                    reply_markup=reply_markup
                 )
             elif action == "cancel":
-                purchase.status = 'rejected'
-                self.db.commit()
+                if self.cooling_timers:
+                    self.cooling_timers.cancel(purchase_id)
                 await query.edit_message_text(
                     f"❌ Покупка отменена!\n\n"
-                    f"📦 {purchase.name}\n"
-                    f"💰 Вы сэкономили {purchase.price:,.0f} ₽! 🎉\n\n"
-                    f"Отличное решение! Продолжайте в том же духе."
+                    f"📦 {purchase['name']}\n"
+                    f"💰 Вы сэкономили {purchase['price']:,.0f} ₽! 🎉\n\n"
+                    f"Отличное решение! Продолжайте в том же духе.",
+                    reply_markup=reply_markup
                 )
     
-    async def send_notification(self, chat_id: str, message: str, parse_mode='HTML', reply_markup=None):
-        """Отправить уведомление пользователю"""
-        try:
-            await self.application.bot.send_message(
-                chat_id=chat_id,
-                text=message,
-                parse_mode=parse_mode,
-                reply_markup=reply_markup
-            )
-            logger.info(f"Notification sent to {chat_id}")
-        except Exception as e:
-            logger.error(f"Failed to send notification to {chat_id}: {e}")
+    # ===== ДОСТУП К БД =====
+    # Функции выполняются в пуле потоков (run_db), каждая со своей сессией,
+    # и возвращают простые данные вместо ORM-объектов
     
-    async def notify_cooling_ended(self, purchase):
-        """Уведомление об окончании периода охлаждения"""
-        from models import User
-        
-        user = User.query.get(purchase.user_id)
-        if not user or not user.telegram_chat_id or not user.telegram_notifications_enabled:
-            return
+    async def run_db(self, func, *args):
+        """Выполнить блокирующий доступ к БД в пуле потоков, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.db_executor, self._call_in_app_context, func, args)
+    
+    def _call_in_app_context(self, func, args):
+        # Flask-SQLAlchemy привязывает сессию к контексту приложения:
+        # новый контекст — новая сессия, закрываемая при выходе
+        with self.app.app_context():
+            return func(*args)
+    
+    @staticmethod
+    def _link_account(nickname, chat_id):
+        """id привязанного пользователя или None, если никнейм не найден"""
+        from models import db, User
         
-        keyboard = [[
-            InlineKeyboardButton("✅ Куплю", callback_data=f"approve_{purchase.id}"),
-            InlineKeyboardButton("❌ Откажусь", callback_data=f"reject_{purchase.id}")
-        ]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        user = User.query.filter_by(nickname=nickname).first()
+        if not user:
+            return None
         
-        message = (
-            f"⏰ <b>Период ожидания закончился!</b>\n\n"
-            f"🛒 <b>{purchase.name}</b>\n"
-            f"💰 {purchase.price:,.0f} ₽\n"
-            f"📦 {purchase.category}\n\n"
-            f"Вы все еще хотите это купить?"
-        )
+        user.telegram_chat_id = chat_id
+        user.telegram_notifications_enabled = True
+        db.session.commit()
         
-        await self.send_notification(user.telegram_chat_id, message, reply_markup=reply_markup)
+        user_cache.invalidate(user.id, chat_id=chat_id)
+        return user.id
     
-    async def notify_high_impulse(self, purchase, analysis):
-        """Уведомление о высоком риске импульсивной покупки"""
-        from models import User
+    @staticmethod
+    def _unlink_account(chat_id):
+        from models import db, User
         
-        user = User.query.get(purchase.user_id)
-        if not user or not user.telegram_chat_id or not user.telegram_notifications_enabled:
-            return
+        user = User.query.filter_by(telegram_chat_id=chat_id).first()
+        if not user:
+            return False
         
-        risk_emoji = {
-            'high': '🔴',
-            'medium': '🟡',
-            'low': '🟢'
-        }
+        user.telegram_chat_id = None
+        user.telegram_notifications_enabled = False
+        db.session.commit()
         
-        message = (
-            f"{risk_emoji[analysis['risk_level']]} <b>Новая покупка добавлена</b>\n\n"
-            f"🛒 <b>{purchase.name}</b>\n"
-            f"💰 {purchase.price:,.0f} ₽\n"
-            f"📊 Риск импульсивности: {analysis['impulse_score']}%\n\n"
-            f"💡 {analysis['recommendation']}\n"
-            f"⏰ Период охлаждения: {analysis['cooling_days']} дней"
-        )
+        user_cache.invalidate(user.id, chat_id=chat_id)
+        return True
+    
+    @staticmethod
+    def _linked_user_id(chat_id):
+        profile = user_cache.by_chat(chat_id)
+        return profile.id if profile else None
+    
+    @staticmethod
+    def _pending_purchases(chat_id):
+        """Ожидающие покупки пользователя или None, если аккаунт не привязан"""
+        from models import db, Purchase
         
-        await self.send_notification(user.telegram_chat_id, message)
+        profile = user_cache.by_chat(chat_id)
+        if not profile:
+            return None
+        
+        rows = db.session.query(
+            Purchase.name, Purchase.price, Purchase.category, Purchase.cooling_end_date, Purchase.is_blacklisted
+        ).filter_by(user_id=profile.id, status='pending').order_by(Purchase.cooling_end_date).all()
+        
+        return [row._asdict() for row in rows]
     
-    async def send_periodic_reminder(self, purchase):
-        """
-        Периодическое напоминание во время периода охлаждения
-        """
-        from models import User
+    @staticmethod
+    def _user_stats(chat_id):
+        """Профиль и статистика пользователя или None, если аккаунт не привязан"""
+        from stats import PurchaseStats
+        
+        profile = user_cache.by_chat(chat_id)
+        if not profile:
+            return None
+        
+        stats = PurchaseStats.get(profile.id)
+        stats.update(nickname=profile.nickname, salary=profile.salary, current_savings=profile.current_savings)
+        return stats
+    
+    @staticmethod
+    def _notifications_enabled(chat_id):
+        profile = user_cache.by_chat(chat_id)
+        return bool(profile.telegram_notifications_enabled) if profile else None
+    
+    @staticmethod
+    def _toggle_notifications(user_id):
+        from models import db, User
         
-        user = User.query.get(purchase.user_id)
-        if not user or not user.telegram_chat_id or not user.telegram_notifications_enabled:
-            return
+        user = db.session.get(User, user_id)
+        user.telegram_notifications_enabled = not user.telegram_notifications_enabled
+        db.session.commit()
         
-        if purchase.status != 'pending':
-            return
+        user_cache.invalidate(user_id)
+        return user.telegram_notifications_enabled
+    
+    @staticmethod
+    def _reminder_items(user_id):
+        """Покупки пользователя, о которых пора напомнить (для страниц сводки)"""
+        from models import db, Purchase
         
         now = datetime.utcnow()
-        days_left = (purchase.cooling_end_date - now).days
-        
-        if days_left < 0:
-            return
+        rows = db.session.query(*TelegramNotificationBot._reminder_columns()).filter(
+            Purchase.user_id == user_id,
+            Purchase.status == 'pending',
+            Purchase.cooling_end_date > now
+        ).order_by(Purchase.cooling_end_date, Purchase.id).all()
         
-        messages = [
-            f"🤔 Все еще думаете о покупке?\n\n"
-            f"📦 <b>{purchase.name}</b>\n"
-            f"💰 {purchase.price:,.0f} ₽\n\n"
-            f"Осталось подождать: {days_left} дн.\n"
-            f"Возможно, желание пройдет? 🤷‍♂️",
-            
-            f"⏰ Напоминание о покупке\n\n"
-            f"📦 <b>{purchase.name}</b>\n"
-            f"💰 {purchase.price:,.0f} ₽\n\n"
-            f"До конца периода ожидания: {days_left} дн.\n"
-            f"Вам действительно это нужно? 🤔",
-            
-            f"💭 Период обдумывания продолжается\n\n"
-            f"📦 <b>{purchase.name}</b>\n"
-            f"💰 {purchase.price:,.0f} ₽\n\n"
-            f"Еще {days_left} дн до решения.\n"
-            f"Может, передумаете? Сэкономите деньги! 💰",
-            
-            f"🔔 Проверка желания купить\n\n"
-            f"📦 <b>{purchase.name}</b>\n"
-            f"💰 {purchase.price:,.0f} ₽\n\n"
-            f"Осталось {days_left} дн охлаждения.\n"
-            f"Это все еще актуально? 🤷",
-        ]
+        items = (TelegramNotificationBot._reminder_item(row, now) for row in rows)
+        return [item for item in items if item]
+    
+    @staticmethod
+    def _remind_action(user_id, purchase_id, action):
+        """Ответ на напоминание: cancel отклоняет покупку. Возвращает данные покупки или None"""
+        from models import db, Purchase
+        
+        purchase = Purchase.query.filter_by(id=purchase_id, user_id=user_id).first()
+        if not purchase:
+            return None
+        
+        if action == "cancel":
+            purchase.status = 'rejected'
+            Outbox.skip_for_purchase(purchase.id)
+            db.session.commit()
+        
+        return {
+            'name': purchase.name,
+            'price': purchase.price,
+            'cooling_end_date': purchase.cooling_end_date
+        }
+    
+    async def send_notification(self, chat_id: str, message: str, parse_mode='HTML', reply_markup=None,
+                                priority=PRIORITY_NORMAL):
+        """Поставить уведомление пользователю в очередь отправки"""
+        try:
+            await self.send_queue.put(chat_id, message, parse_mode, reply_markup, priority)
+        except Exception as e:
+            logger.error(f"Failed to enqueue notification to {chat_id}: {e}")
+    
+    async def deliver_message(self, chat_id, message, parse_mode, reply_markup):
+        """Фактическая отправка сообщения (вызывается очередью с учётом лимитов)"""
+        if isinstance(reply_markup, dict):
+            # Клавиатура восстановлена из БД после перезапуска
+            reply_markup = InlineKeyboardMarkup.de_json(reply_markup, self.application.bot)
+        
+        await self.application.bot.send_message(
+            chat_id=chat_id,
+            text=message,
+            parse_mode=parse_mode,
+            reply_markup=reply_markup
+        )
+    
+    def render_cooling_ended(self, purchase):
+        """Уведомление об окончании периода охлаждения: (текст, клавиатура)"""
+        keyboard = [[
+            InlineKeyboardButton("✅ Куплю", callback_data=f"approve_{purchase['purchase_id']}"),
+            InlineKeyboardButton("❌ Откажусь", callback_data=f"reject_{purchase['purchase_id']}")
+        ]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        import random
-        random.seed(purchase.id + now.day)
-        message = random.choice(messages)
+        return messages.render('cooling_ended', purchase), reply_markup
+    
+    def render_high_impulse(self, purchase):
+        """Уведомление о высоком риске импульсивной покупки (данные покупки и анализа)"""
+        return messages.render('high_impulse', {**purchase, 'risk_emoji': RISK_EMOJI[purchase['risk_level']]})
+    
+    def render_outbox_events(self, events):
+        """
+        Сообщение для событий outbox одного чата: (текст, parse_mode, клавиатура, приоритет).
+        Несколько событий (под нагрузкой) объединяются в одну сводку.
+        """
+        if len(events) == 1:
+            kind, payload = events[0]
+            if kind == 'cooling_ended':
+                message, reply_markup = self.render_cooling_ended(payload)
+                return message, 'HTML', reply_markup, PRIORITY_NORMAL
+            return self.render_high_impulse(payload), 'HTML', None, PRIORITY_HIGH
+        
+        lines = []
+        for kind, payload in events:
+            if kind == 'cooling_ended':
+                lines.append(messages.render('cooling_ended.line', payload))
+            else:
+                lines.append(messages.render(
+                    'high_impulse.line', {**payload, 'risk_emoji': RISK_EMOJI[payload['risk_level']]}
+                ))
+        
+        message = messages.render('outbox_digest', {'count': len(events), 'lines': "\n".join(lines)})
+        priority = PRIORITY_HIGH if any(kind == 'high_impulse' for kind, _ in events) else PRIORITY_NORMAL
+        return message, 'HTML', None, priority
+    
+    async def send_periodic_reminder(self, purchase, chat_id):
+        """
+        Периодическое напоминание во время периода охлаждения (purchase — данные из _reminder_item).
+        Вариант текста зависит от покупки и дня месяца, чтобы напоминания не повторялись подряд.
+        """
+        now = datetime.utcnow()
+        message = messages.render('reminder', purchase, seed=purchase['id'] + now.day)
         
         keyboard = [[
-            InlineKeyboardButton("✅ Да, хочу", callback_data=f"remind_keep_{purchase.id}"),
-            InlineKeyboardButton("❌ Передумал", callback_data=f"remind_cancel_{purchase.id}")
+            InlineKeyboardButton(messages.render('reminder.keep'), callback_data=f"remind_keep_{purchase['id']}"),
+            InlineKeyboardButton(messages.render('reminder.cancel'), callback_data=f"remind_cancel_{purchase['id']}")
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await self.send_notification(user.telegram_chat_id, message, reply_markup=reply_markup)
+        await self.send_notification(chat_id, message, reply_markup=reply_markup, priority=PRIORITY_LOW)
+    
+    def render_reminder_digest(self, items, page=0):
+        """Сводка напоминаний одного чата: страница списка и клавиатура с кнопками по каждой покупке"""
+        size = REMINDER_DIGEST_SIZE
+        pages = (len(items) + size - 1) // size
+        page = min(max(page, 0), pages - 1)
+        start = page * size
+        numbered = list(enumerate(items[start:start + size], start=start + 1))
+        
+        lines = [messages.render('reminder_digest.line', {**item, 'number': number}) for number, item in numbered]
+        message = messages.render('reminder_digest', {'count': len(items), 'lines': "\n".join(lines)})
+        if pages > 1:
+            message += messages.render('reminder_digest.page', {'page': page + 1, 'pages': pages})
+        
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    messages.render('reminder_digest.keep', {'number': number}),
+                    callback_data=f"remind_keep_{item['id']}"
+                ),
+                InlineKeyboardButton(
+                    messages.render('reminder_digest.cancel', {'number': number}),
+                    callback_data=f"remind_cancel_{item['id']}"
+                )
+            ]
+            for number, item in numbered
+        ]
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀️ Назад", callback_data=f"remind_page_{page - 1}"))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("Далее ▶️", callback_data=f"remind_page_{page + 1}"))
+        if navigation:
+            keyboard.append(navigation)
+        
+        return message, InlineKeyboardMarkup(keyboard)
     
     async def notify_savings_goal(self, user, purchase, days_left):
         """Уведомление о приближении к цели накопления"""
         if not user.telegram_chat_id or not user.telegram_notifications_enabled:
             return
         
-        message = (
-            f"🎯 <b>Цель накопления близка!</b>\n\n"
-            f"До покупки <b>{purchase.name}</b> осталось накопить:\n"
-            f"⏰ {days_left} дней\n"
-            f"💰 Примерно {(purchase.price - user.current_savings):,.0f} ₽\n\n"
-            f"Продолжайте откладывать, вы на правильном пути! 💪"
-        )
+        message = messages.render('savings_goal', {
+            'name': purchase.name,
+            'days_left': days_left,
+            'amount': purchase.price - user.current_savings
+        })
         
         await self.send_notification(user.telegram_chat_id, message)
     
-    async def notify_weekly_stats(self, user):
-        """Еженедельная статистика"""
-        from models import Purchase
-        from sqlalchemy import func
-        from datetime import timedelta
-        
-        if not user.telegram_chat_id or not user.telegram_notifications_enabled:
-            return
-        
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        
-        week_purchases = Purchase.query.filter(
-            Purchase.user_id == user.id,
-            Purchase.created_at >= week_ago
-        ).count()
-        
-        week_spent = self.db.query(func.sum(Purchase.price)).filter(
-            Purchase.user_id == user.id,
-            Purchase.status == 'approved',
-            Purchase.created_at >= week_ago
-        ).scalar() or 0
-        
-        week_saved = self.db.query(func.sum(Purchase.price)).filter(
-            Purchase.user_id == user.id,
-            Purchase.status == 'rejected',
-            Purchase.created_at >= week_ago
-        ).scalar() or 0
+    async def notify_weekly_stats(self, summary):
+        """Еженедельная статистика по готовой сводке из PurchaseStats.weekly_summaries"""
+        if summary['saved'] > summary['spent']:
+            verdict = 'weekly_stats.saved_more'
+        elif summary['saved'] > 0:
+            verdict = 'weekly_stats.saved'
+        else:
+            verdict = 'weekly_stats.none'
         
-        message = (
-            f"📊 <b>Итоги недели</b>\n\n"
-            f"👤 {user.nickname}\n"
-            f"🛒 Покупок добавлено: {week_purchases}\n"
-            f"💸 Потрачено: {week_spent:,.0f} ₽\n"
-            f"💚 Сэкономлено: {week_saved:,.0f} ₽\n\n"
-        )
+        message = messages.render('weekly_stats', {**summary, 'verdict': messages.render(verdict)})
         
-        if week_saved > week_spent:
-            message += "🏆 Отличная работа! Вы сэкономили больше, чем потратили!"
-        elif week_saved > 0:
-            message += "✅ Хороший результат! Продолжайте в том же духе!"
-        else:
-            message += "💡 На этой неделе не было отказов от покупок. Попробуйте быть осторожнее!"
+        await self.send_notification(summary['chat_id'], message, priority=PRIORITY_BULK)
+    
+    def check_webhook_secret(self, token):
+        """Проверка заголовка X-Telegram-Bot-Api-Secret-Token (без настроенного секрета — отказ)"""
+        if not TELEGRAM_WEBHOOK_SECRET:
+            return False
+        return hmac.compare_digest(token or '', TELEGRAM_WEBHOOK_SECRET)
+    
+    def process_webhook_update(self, data):
+        """
+        Передать обновление из webhook (вызывается в потоке Flask) в очередь обновлений
+        бота; дальше оно обрабатывается теми же обработчиками, что и при polling
+        """
+        update = Update.de_json(data, self.application.bot)
+        asyncio.run_coroutine_threadsafe(
+            self.application.update_queue.put(update), self.loop
+        ).result(timeout=WEBHOOK_ENQUEUE_TIMEOUT)
+    
+    def wake_outbox(self):
+        """Сообщить воркеру outbox о новых событиях (можно вызывать из любого потока)"""
+        if self.loop is not None and self.outbox_wakeup is not None:
+            self.loop.call_soon_threadsafe(self.outbox_wakeup.set)
+    
+    async def drain_outbox(self):
+        """Фоновая задача: перенос событий outbox в очередь отправки пачками"""
+        while True:
+            try:
+                count, queued = await self.run_db(
+                    Outbox.drain, self.render_outbox_events, self.send_queue.owner
+                )
+                self.send_queue.push_stored(queued)
+            except Exception as e:
+                logger.error(f"Outbox drain error: {e}")
+                count = 0
+            
+            if count:
+                continue
+            
+            try:
+                await asyncio.wait_for(self.outbox_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.outbox_wakeup.clear()
+    
+    async def track_user_purchases(self, user_id):
+        """Вернуть в таймеры покупки пользователя, сроки которых прошли без уведомления"""
+        if self.cooling_timers:
+            await self.run_db(self.cooling_timers.track_user, user_id)
+    
+    def run_coroutine(self, coro):
+        """Выполнить корутину в event loop бота из другого потока и дождаться результата"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+    
+    def in_app_context(self, func):
+        """Обёртка задачи планировщика: задачи выполняются в своих потоках без контекста Flask"""
+        def job():
+            with self.app.app_context():
+                return func()
+        return job
+    
+    def notify_cooling_due(self, purchase_ids):
+        """
+        Уведомления об окончании охлаждения для покупок, срок которых наступил
+        (вызывается таймерами охлаждения). Покупки помечаются notified_at и claim_token
+        условным UPDATE (при нескольких процессах каждую забирает только один) и
+        выбираются по claim_token; в той же транзакции для них пишутся события outbox.
+        Покупки пользователей без привязки или с выключенными уведомлениями
+        пропускаются: их таймеры ставятся заново при /link и включении уведомлений
+        (track_user_purchases).
+        """
+        from models import db, User, Purchase
         
-        await self.send_notification(user.telegram_chat_id, message)
+        for start in range(0, len(purchase_ids), COOLING_BATCH_SIZE):
+            ids = purchase_ids[start:start + COOLING_BATCH_SIZE]
+            stamp = datetime.utcnow()
+            token = uuid.uuid4().hex
+            
+            linked_users = db.select(User.id).where(
+                User.telegram_chat_id.isnot(None),
+                User.telegram_notifications_enabled == True
+            )
+            Purchase.query.filter(
+                Purchase.id.in_(ids),
+                Purchase.status == 'pending',
+                Purchase.notified_at.is_(None),
+                Purchase.user_id.in_(linked_users)
+            ).update({'notified_at': stamp, 'claim_token': token}, synchronize_session=False)
+            
+            rows = db.session.query(
+                Purchase.id, Purchase.user_id, Purchase.name, Purchase.price, Purchase.category
+            ).filter(
+                Purchase.id.in_(ids),
+                Purchase.claim_token == token
+            ).order_by(Purchase.id).all()
+            
+            for row in rows:
+                Outbox.add('cooling_ended', row.user_id, {
+                    'purchase_id': row.id,
+                    'name': row.name,
+                    'price': row.price,
+                    'category': row.category
+                }, key=f'cooling_ended:{row.id}', purchase_id=row.id)
+            db.session.commit()
+            
+            if rows:
+                self.wake_outbox()
     
-    def check_cooling_periods(self):
-        """Проверка окончания периодов охлаждения (выполняется каждый час)"""
+    @staticmethod
+    def _reminder_columns():
+        """Колонки покупки, нужные для напоминаний"""
         from models import Purchase
-        import asyncio
         
-        now = datetime.utcnow()
-        ready_purchases = Purchase.query.filter(
-            Purchase.status == 'pending',
-            Purchase.cooling_end_date <= now
-        ).all()
+        return (
+            Purchase.id, Purchase.name, Purchase.price, Purchase.cooling_period_days,
+            Purchase.created_at, Purchase.cooling_end_date
+        )
+    
+    @staticmethod
+    def _reminder_item(purchase, now):
+        """Данные для напоминания о покупке или None, если напоминать ещё рано"""
+        total_days = purchase.cooling_period_days
+        days_passed = (now - purchase.created_at).days
+        days_left = (purchase.cooling_end_date - now).days
+        hours_since_creation = (now - purchase.created_at).total_seconds() / 3600
         
-        for purchase in ready_purchases:
-            asyncio.run(self.notify_cooling_ended(purchase))
+        if days_passed >= total_days * 0.3 and days_left >= 1 and hours_since_creation >= 12:
+            return {'id': purchase.id, 'name': purchase.name, 'price': purchase.price, 'days_left': days_left}
+        return None
     
-    def send_periodic_reminders(self):
+    async def _send_reminder_digests(self, digests):
+        """
+        Одно сообщение на чат: обычное напоминание для одной покупки, сводка — для нескольких.
+        Сообщения ставятся в очередь одновременно, чтобы очередь сохранила их пачками.
+        """
+        sends = []
+        for chat_id, items in digests.items():
+            if len(items) == 1:
+                sends.append(self.send_periodic_reminder(items[0], chat_id))
+                continue
+            
+            message, reply_markup = self.render_reminder_digest(items)
+            sends.append(self.send_notification(chat_id, message, reply_markup=reply_markup, priority=PRIORITY_LOW))
+        await asyncio.gather(*sends)
+    
+    def send_periodic_reminders(self, shard=None):
         """
         Отправка периодических напоминаний о покупках в периоде охлаждения
-        Выполняется каждые 12 часов
+        Выполняется каждые 12 часов; покупки группируются в одну сводку на чат
         """
-        from models import Purchase
-        import asyncio
+        from models import db, User, Purchase
         
         now = datetime.utcnow()
         
-        pending_purchases = Purchase.query.filter(
+        rows = db.session.query(*self._reminder_columns(), User.telegram_chat_id).join(
+            User, User.id == Purchase.user_id
+        ).filter(
             Purchase.status == 'pending',
-            Purchase.cooling_end_date > now
-        ).all()
+            Purchase.cooling_end_date > now,
+            shard_filter(Purchase.user_id, shard),
+            User.telegram_chat_id.isnot(None),
+            User.telegram_notifications_enabled == True
+        ).order_by(Purchase.cooling_end_date, Purchase.id).all()
         
-        for purchase in pending_purchases:
-            total_days = purchase.cooling_period_days
-            days_passed = (now - purchase.created_at).days
-            days_left = (purchase.cooling_end_date - now).days
-            
-            if days_passed >= total_days * 0.3 and days_left >= 1:
-
-                hours_since_creation = (now - purchase.created_at).total_seconds() / 3600
-                if hours_since_creation >= 12:
-                    asyncio.run(self.send_periodic_reminder(purchase))
+        digests = {}
+        for row in rows:
+            item = self._reminder_item(row, now)
+            if item:
+                digests.setdefault(row.telegram_chat_id, []).append(item)
+        
+        self.run_coroutine(self._send_reminder_digests(digests))
     
-    def send_weekly_stats(self):
-        """Отправка еженедельной статистики (каждый понедельник в 9:00)"""
-        from models import User
-        import asyncio
+    async def _send_weekly_batch(self, summaries):
+        """Постановка пачки еженедельных сводок в очередь отправки (сохраняются одним commit)"""
+        await asyncio.gather(*(self.notify_weekly_stats(summary) for summary in summaries))
+    
+    def send_weekly_stats(self, shard=None):
+        """
+        Отправка еженедельной статистики (каждый понедельник в 9:00).
+        Сводки считаются пачками пользователей, по одному запросу на пачку.
+        """
+        from stats import PurchaseStats
         
-        users = User.query.filter(
-            User.telegram_chat_id.isnot(None),
-            User.telegram_notifications_enabled == True
-        ).all()
+        week_ago = datetime.utcnow() - timedelta(days=7)
         
-        for user in users:
-            asyncio.run(self.notify_weekly_stats(user))
+        for summaries in PurchaseStats.weekly_summaries(week_ago, shard=shard):
+            self.run_coroutine(self._send_weekly_batch(summaries))
+    
+    def leased_job(self, job_id, func, trigger=None, tick=None):
+        """
+        Задача планировщика, которая выполняет тик только на узле, взявшем аренду
+        в job_leases (при нескольких экземплярах приложения). Тик — время срабатывания
+        trigger по расписанию либо заданный явно (догоняющий запуск).
+        """
+        def job():
+            JobLeases.run(job_id, func, tick or JobLeases.scheduled_tick(trigger))
+        return self.in_app_context(job)
     
     def start_scheduler(self):
         """Запуск планировщика задач"""
-        self.scheduler.add_job(
-            self.check_cooling_periods,
-            CronTrigger(minute=0),
-            id='check_cooling',
-            replace_existing=True
-        )
+        # Окончание охлаждения отслеживают таймеры (CoolingTimers), а не периодический обход
+        jobs = [
+            ('periodic_reminders', self.send_periodic_reminders, CronTrigger(hour='9,21', minute=0)),
+            ('weekly_stats', self.send_weekly_stats, CronTrigger(day_of_week='mon', hour=9, minute=0)),
+        ]
         
-        self.scheduler.add_job(
-            self.send_periodic_reminders,
-            CronTrigger(hour='9,21', minute=0),
-            id='periodic_reminders',
-            replace_existing=True
-        )
+        for job_id, func, trigger in jobs:
+            self.scheduler.add_job(
+                self.leased_job(job_id, func, trigger),
+                trigger,
+                id=job_id,
+                replace_existing=True
+            )
         
-        self.scheduler.add_job(
-            self.send_weekly_stats,
-            CronTrigger(day_of_week='mon', hour=9, minute=0),
-            id='weekly_stats',
-            replace_existing=True
-        )
+        # Тики, пропущенные пока приложение было остановлено, выполняются один раз сразу
+        with self.app.app_context():
+            for job_id, func, trigger in jobs:
+                tick = JobLeases.missed_tick(job_id, trigger)
+                if tick is not None:
+                    logger.info(f"Catching up missed {job_id} tick {tick}")
+                    self.scheduler.add_job(self.leased_job(job_id, func, tick=tick), id=f'{job_id}_catch_up')
         
         self.scheduler.start()
         logger.info("Scheduler started with periodic reminders")
     
     async def start_bot(self):
         """Запуск бота"""
-        self.application = Application.builder().token(self.token).build()
+        self.app = current_app._get_current_object()
+        self.loop = asyncio.get_running_loop()
+        builder = Application.builder().token(self.token)
+        if TELEGRAM_API_BASE_URL:
+            builder = builder.base_url(TELEGRAM_API_BASE_URL)
+        self.application = builder.build()
+        self.send_queue = SendQueue(self.deliver_message, self.app)
         
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("link", self.link_command))
@@ -552,28 +821,48 @@ class TelegramNotificationBot:
         self.application.add_handler(CommandHandler("settings", self.settings_command))
         self.application.add_handler(CallbackQueryHandler(self.button_callback))
         
-        self.start_scheduler()
-        
         await self.application.initialize()
         await self.application.start()
-        await self.application.updater.start_polling()
+        await self.send_queue.start()
+        
+        self.outbox_wakeup = asyncio.Event()
+        self.outbox_task = asyncio.create_task(self.drain_outbox())
+        
+        self.cooling_timers = CoolingTimers(self.app, self.notify_cooling_due)
+        self.cooling_timers.start()
+        self.start_scheduler()
+        
+        if self.webhook_mode:
+            # Обновления приходят в Flask (/api/telegram/webhook); повторный вызов
+            # из каждого воркера безопасен — Telegram хранит один адрес
+            await self.application.bot.set_webhook(
+                url=TELEGRAM_WEBHOOK_URL,
+                secret_token=TELEGRAM_WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            await self.application.bot.delete_webhook()
+            await self.application.updater.start_polling()
         
-        logger.info("Bot started successfully with periodic reminders!")
+        logger.info(f"Bot started successfully in {'webhook' if self.webhook_mode else 'polling'} mode!")
     
     def stop(self):
         """Остановка бота"""
         if self.scheduler.running:
             self.scheduler.shutdown()
+        if self.cooling_timers:
+            self.cooling_timers.stop()
+        self.db_executor.shutdown(wait=False)
         logger.info("Bot stopped")
 
 
 bot_instance = None
 
 
-def init_telegram_bot(token: str, db_session):
+def init_telegram_bot(token: str):
     """Инициализация бота"""
     global bot_instance
-    bot_instance = TelegramNotificationBot(token, db_session)
+    bot_instance = TelegramNotificationBot(token)
     return bot_instance
 
 
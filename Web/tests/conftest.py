@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+# Модули приложения лежат плоско в Web/ и импортируются по имени
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Приложение на отдельной SQLite базе в файле (очередь и бот работают из других потоков)"""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+
+    import analyzers
+    from app import create_app, init_db
+    from models import db
+    from parsers import product_cache
+    from user_cache import user_cache
+
+    # Кэши модулей живут дольше одного теста, а id пользователей в новых базах совпадают
+    monkeypatch.setattr(analyzers, 'rule_cache', analyzers.RuleCache())
+    product_cache.clear()
+    user_cache.clear()
+
+    app = create_app()
+    init_db(app)
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(client):
+    def make(nickname='user', **fields):
+        body = {'nickname': nickname, 'salary': 100000, 'monthly_savings': 20000, 'current_savings': 50000}
+        body.update(fields)
+        response = client.post('/api/auth/register', json=body)
+        assert response.status_code == 201, response.json
+        return response.json['user']['id']
+    return make
+
+
+class FakeBotApi:
+    """
+    Локальный HTTP-сервер с методами Bot API, которые вызывает бот.
+    Вызовы пишутся в calls; replies — очередь ответов-ошибок (статус, тело) для sendMessage
+    (например, 429 с retry_after), после неё отвечает успехом.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.replies = []
+        self._lock = threading.Lock()
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+                try:
+                    params = json.loads(body or '{}')
+                except ValueError:
+                    params = {key: values[0] for key, values in parse_qs(body).items()}
+                status, payload = api.handle(self.path.rsplit('/', 1)[-1], params)
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}/bot'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, method, params):
+        with self._lock:
+            if method == 'sendMessage' and self.replies:
+                return self.replies.pop(0)
+            self.calls.append((method, params))
+
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'}}
+        if method == 'sendMessage':
+            return 200, {'ok': True, 'result': {
+                'message_id': len(self.calls),
+                'date': 0,
+                'chat': {'id': int(params['chat_id']), 'type': 'private'},
+                'text': params.get('text', '')
+            }}
+        return 200, {'ok': True, 'result': True}
+
+    def sent(self):
+        with self._lock:
+            return [params for method, params in self.calls if method == 'sendMessage']
+
+
+@pytest.fixture
+def bot_api():
+    api = FakeBotApi()
+    yield api
+    api.server.shutdown()
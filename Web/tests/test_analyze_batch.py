@@ -0,0 +1,34 @@
+from models import db, Purchase
+
+
+def test_non_finite_prices_are_item_errors(client, make_user, app):
+    user_id = make_user()
+    items = [
+        {'name': 'ok', 'price': 1000, 'category': 'Еда'},
+        {'name': 'nan', 'price': 'nan', 'category': 'Еда'},
+        {'name': 'inf', 'price': 'Infinity', 'category': 'Еда'},
+        {'name': 'negative', 'price': -1, 'category': 'Еда'},
+        {'name': 'text', 'price': 'дорого', 'category': 'Еда'},
+    ]
+
+    response = client.post('/api/purchases/analyze-batch', json={'user_id': user_id, 'items': items})
+
+    assert response.status_code == 201
+    assert response.json['created'] == 1
+    assert [result.get('error') for result in response.json['results']] == [
+        None, 'Неверная цена', 'Неверная цена', 'Неверная цена', 'Неверная цена'
+    ]
+    with app.app_context():
+        assert Purchase.query.count() == 1
+
+
+def test_dry_run_returns_valid_json(client, make_user):
+    user_id = make_user()
+    items = [{'name': 'nan', 'price': 'nan', 'category': 'Еда'}, {'name': 'ok', 'price': 500, 'category': 'Еда'}]
+
+    response = client.post('/api/purchases/analyze-batch', json={'user_id': user_id, 'items': items, 'dry_run': True})
+
+    assert response.status_code == 200
+    assert b'NaN' not in response.data
+    assert response.json['created'] == 0
+    assert 'analysis' in response.json['results'][1]
@@ -0,0 +1,129 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import cooling_timers
+import routes
+from cooling_timers import CoolingTimers
+from models import db, Purchase
+
+
+def make_overdue_purchase(app, client, user_id):
+    response = client.post('/api/purchases', json={
+        'user_id': user_id, 'name': 'Наушники', 'price': 5000, 'category': 'Электроника'
+    })
+    purchase_id = response.json['id']
+    with app.app_context():
+        db.session.get(Purchase, purchase_id).cooling_end_date = datetime.utcnow() - timedelta(minutes=1)
+        db.session.commit()
+    return purchase_id
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timeout'
+        time.sleep(0.02)
+
+
+def test_failed_callback_is_retried(app, client, make_user, monkeypatch):
+    monkeypatch.setattr(cooling_timers, 'LOAD_RETRY_DELAY', 0.1)
+    purchase_id = make_overdue_purchase(app, client, make_user())
+    calls = []
+
+    def on_due(ids):
+        calls.append(list(ids))
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+
+    timers = CoolingTimers(app, on_due)
+    timers.start()
+    try:
+        wait_until(lambda: len(calls) >= 2)
+    finally:
+        timers.stop()
+
+    assert calls[:2] == [[purchase_id], [purchase_id]]
+
+
+def test_track_user_returns_skipped_purchases(app, client, make_user):
+    user_id = make_user()
+    purchase_id = make_overdue_purchase(app, client, user_id)
+    fired = []
+    event = threading.Event()
+
+    def on_due(ids):
+        fired.extend(ids)
+        event.set()
+
+    timers = CoolingTimers(app, on_due)
+    timers.start()
+    try:
+        assert event.wait(5)
+        event.clear()
+        assert timers.stats()['scheduled'] == 0
+
+        # Уведомление не отправлено (notified_at пуст), после привязки срок снова в таймерах
+        with app.app_context():
+            timers.track_user(user_id)
+        assert event.wait(5)
+    finally:
+        timers.stop()
+
+    assert fired == [purchase_id, purchase_id]
+
+
+def zero_cooling_user(client, make_user):
+    user_id = make_user(salary=100000, current_savings=1000000)
+    response = client.post('/api/price-ranges', json={'user_id': user_id, 'min_price': 0, 'cooling_days': 0})
+    assert response.status_code == 201
+    return user_id
+
+
+def started_timers(app, monkeypatch):
+    fired = []
+    event = threading.Event()
+
+    def on_due(ids):
+        fired.extend(ids)
+        event.set()
+
+    timers = CoolingTimers(app, on_due)
+    timers.start()
+    wait_until(lambda: timers.loaded_until is not None)
+    monkeypatch.setattr(routes, 'get_bot', lambda: SimpleNamespace(cooling_timers=timers))
+    return timers, fired, event
+
+
+def test_batch_purchases_due_inside_loaded_window_fire(app, client, make_user, monkeypatch):
+    user_id = zero_cooling_user(client, make_user)
+    timers, fired, event = started_timers(app, monkeypatch)
+    try:
+        response = client.post('/api/purchases/analyze-batch', json={
+            'user_id': user_id, 'items': [{'name': 'Книга', 'price': 500, 'category': 'Книги'}]
+        })
+        assert response.status_code == 201
+        assert response.json['results'][0]['analysis']['cooling_days'] == 0
+        assert event.wait(5)
+    finally:
+        timers.stop()
+
+    assert fired == [response.json['results'][0]['purchase']['id']]
+
+
+def test_imported_purchases_due_inside_loaded_window_fire(app, client, make_user, monkeypatch):
+    user_id = zero_cooling_user(client, make_user)
+    timers, fired, event = started_timers(app, monkeypatch)
+    try:
+        response = client.post(
+            f'/api/purchases/import?user_id={user_id}&format=ndjson',
+            data='{"name": "Книга", "price": 500, "category": "Книги"}\n'
+        )
+        assert response.json['imported'] == 1
+        assert event.wait(5)
+    finally:
+        timers.stop()
+
+    with app.app_context():
+        assert fired == [Purchase.query.filter_by(user_id=user_id).one().id]
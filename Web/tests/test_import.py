@@ -0,0 +1,61 @@
+import json
+
+from models import db, Purchase
+
+
+def post_import(client, user_id, body, fmt='ndjson'):
+    return client.post(f'/api/purchases/import?user_id={user_id}&format={fmt}', data=body)
+
+
+def test_non_finite_and_negative_prices_are_row_errors(client, make_user, app):
+    user_id = make_user()
+    lines = [
+        {'name': 'ok 1', 'price': 100, 'category': 'Еда'},
+        {'name': 'nan', 'price': 'nan', 'category': 'Еда'},
+        {'name': 'inf', 'price': 'inf', 'category': 'Еда'},
+        {'name': 'negative', 'price': -5, 'category': 'Еда'},
+        {'name': 'ok 2', 'price': '2500.5', 'category': 'Еда'},
+    ]
+    body = '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines).encode()
+
+    report = post_import(client, user_id, body).json
+
+    assert report['imported'] == 2
+    assert [(error['line'], error['error']) for error in report['errors']] == [
+        (2, 'Неверная цена'), (3, 'Неверная цена'), (4, 'Неверная цена')
+    ]
+    with app.app_context():
+        assert sorted(name for (name,) in db.session.query(Purchase.name)) == ['ok 1', 'ok 2']
+
+
+def test_invalid_utf8_is_reported_per_line(client, make_user):
+    user_id = make_user()
+    body = (
+        '{"name": "Чайник", "price": 3000, "category": "Дом"}\n'.encode()
+        + b'{"name": "\xff\xfe", "price": 10, "category": "x"}\n'
+        + b'\xc3\x28 not json\n'
+        + '{"name": "Лампа", "price": 1500, "category": "Дом"}\n'.encode()
+    )
+
+    response = post_import(client, user_id, body)
+
+    assert response.status_code == 201
+    assert response.json['imported'] == 2
+    assert response.json['errors'] == [
+        {'line': 2, 'error': 'Неверная кодировка строки (ожидается UTF-8)'},
+        {'line': 3, 'error': 'Неверный формат записи'}
+    ]
+
+
+def test_csv_with_bom_and_invalid_bytes(client, make_user):
+    user_id = make_user()
+    body = (
+        '﻿name,price,category\nКнига,800,Хобби\n'.encode()
+        + b'\xff,100,x\n'
+        + 'Игра,nan,Хобби\n'.encode()
+    )
+
+    report = post_import(client, user_id, body, fmt='csv').json
+
+    assert report['imported'] == 1
+    assert [error['line'] for error in report['errors']] == [3, 4]
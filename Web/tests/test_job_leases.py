@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+from apscheduler.triggers.cron import CronTrigger
+
+from job_leases import JobLeases
+from models import db, JobLease
+
+TICK = datetime(2026, 10, 5, 9, 0)
+
+
+def lease(name):
+    db.session.expire_all()
+    return db.session.get(JobLease, name)
+
+
+def test_acquire_runs_each_tick_once(app):
+    with app.app_context():
+        assert JobLeases.acquire('job:0', TICK, owner='a')
+        assert not JobLeases.acquire('job:0', TICK, owner='b')
+
+        JobLeases.complete('job:0', TICK, owner='a')
+        assert lease('job:0').last_run_at == TICK
+        assert not JobLeases.acquire('job:0', TICK, owner='b')
+        assert JobLeases.acquire('job:0', TICK + timedelta(hours=12), owner='b')
+
+
+def test_expired_lease_is_taken_over(app):
+    with app.app_context():
+        assert JobLeases.acquire('job:0', TICK, owner='a')
+        db.session.execute(db.update(JobLease).values(lease_until=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+
+        assert JobLeases.acquire('job:0', TICK, owner='b')
+        assert lease('job:0').owner == 'b'
+
+        # Прежний владелец, очнувшись, не отмечает тик и не снимает чужую аренду
+        JobLeases.complete('job:0', TICK, owner='a')
+        assert lease('job:0').last_run_at is None
+        assert lease('job:0').lease_until is not None
+
+        JobLeases.complete('job:0', TICK, owner='b')
+        assert lease('job:0').last_run_at == TICK
+
+
+def test_failed_shard_is_released_for_retry(app):
+    calls = []
+
+    def func(shard):
+        calls.append(shard)
+        if shard == (0, 2):
+            raise RuntimeError('boom')
+
+    with app.app_context():
+        assert JobLeases.run('job', func, TICK, shards=2) == 1
+        assert lease('job:0').lease_until is None and lease('job:0').last_run_at is None
+        assert lease('job:1').last_run_at == TICK
+        assert JobLeases.run('job', lambda shard: None, TICK, shards=2) == 1
+    assert calls == [(0, 2), (1, 2)]
+
+
+def test_scheduled_tick_ignores_start_delay():
+    trigger = CronTrigger(hour='9,21', minute=0, timezone=timezone.utc)
+    fired = datetime(2026, 10, 5, 9, 0, tzinfo=timezone.utc)
+
+    ticks = {
+        JobLeases.scheduled_tick(trigger, now=fired + delay)
+        for delay in (timedelta(0), timedelta(seconds=59), timedelta(seconds=61), timedelta(minutes=5))
+    }
+    assert ticks == {TICK}
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from messages import TEMPLATES, MessageCatalog, MessageTemplate, messages
+
+SAMPLE = {
+    'name': 'Наушники <b>', 'price': 12990.5, 'category': 'Электроника', 'days_left': 3, 'count': 2,
+    'lines': 'a\nb', 'risk_emoji': '🔴', 'impulse_score': 80, 'recommendation': 'Подождите',
+    'cooling_days': 7, 'number': 1, 'page': 1, 'pages': 2, 'amount': 1500, 'nickname': 'user',
+    'purchases': 4, 'spent': 1000.0, 'saved': 2500.0, 'verdict': 'ok'
+}
+
+
+@pytest.mark.parametrize('key', sorted(TEMPLATES['ru']))
+def test_templates_render_with_str_format(key):
+    for variant in messages.variants(key):
+        assert variant.render(SAMPLE) == variant.text.format_map(SAMPLE)
+
+
+def test_template_collects_field_names():
+    template = MessageTemplate('{user.name}: {items[0]} {price:,.0f} {{literal}}')
+
+    assert template.fields == {'user', 'items', 'price'}
+    assert template.render({
+        'user': type('U', (), {'name': 'Аня'}), 'items': ['x'], 'price': 1500
+    }) == 'Аня: x 1,500 {literal}'
+
+
+@pytest.mark.parametrize('text', ['{name!x}', '{name!}', 'Цена {price', 'Цена }'])
+def test_invalid_template_fails_with_value_error(text):
+    with pytest.raises(ValueError):
+        MessageTemplate(text)
+
+
+def test_variant_choice_is_deterministic_per_seed():
+    variants = [variant.text for variant in messages.variants('reminder')]
+    for seed in range(20):
+        expected = random.Random(seed).choice(variants).format_map(SAMPLE)
+        assert messages.render('reminder', SAMPLE, seed=seed) == expected
+
+
+def test_render_does_not_touch_global_random():
+    random.seed(42)
+    expected = random.random()
+    random.seed(42)
+    messages.render('reminder', SAMPLE, seed=1)
+    assert random.random() == expected
+
+
+def test_locale_falls_back_to_default():
+    catalog = MessageCatalog({**TEMPLATES, 'en': {'reminder.keep': '✅ Yes'}})
+
+    assert catalog.render('reminder.keep', locale='en') == '✅ Yes'
+    assert catalog.render('reminder.cancel', locale='en') == '❌ Передумал'
+    assert catalog.render('reminder.keep', locale='de') == '✅ Да, хочу'
+
+
+def test_catalog_rejects_inconsistent_translations():
+    with pytest.raises(ValueError, match='отсутствует'):
+        MessageCatalog({**TEMPLATES, 'en': {'unknown': 'text'}})
+    with pytest.raises(ValueError, match='Лишние поля'):
+        MessageCatalog({**TEMPLATES, 'en': {'reminder.keep': 'Yes {name}'}})
+    with pytest.raises(ValueError, match='по умолчанию'):
+        MessageCatalog(TEMPLATES, default_locale='en')
@@ -0,0 +1,30 @@
+from sqlalchemy import inspect
+
+from migrations import MIGRATIONS, run_migrations, schema_migrations
+from models import db, Purchase, OutboundMessage
+
+
+def test_fresh_database_records_every_migration(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            versions = [row[0] for row in connection.execute(db.select(schema_migrations.c.version))]
+        assert sorted(versions) == [version for version, _, _ in MIGRATIONS]
+        assert run_migrations() == []
+
+
+def test_migrations_upgrade_old_schema(app):
+    with app.app_context():
+        # База до миграций: без составных индексов и без колонок аренды очереди
+        with db.engine.begin() as connection:
+            for index in Purchase.__table__.indexes:
+                index.drop(connection)
+            OutboundMessage.__table__.drop(connection)
+            connection.execute(schema_migrations.delete().where(schema_migrations.c.version.in_([1, 3, 6])))
+
+        assert run_migrations() == [1, 3, 6]
+
+        inspector = inspect(db.engine)
+        assert {index['name'] for index in inspector.get_indexes('purchases')} >= {
+            'ix_purchases_user_status', 'ix_purchases_status_cooling_end', 'ix_purchases_user_created'
+        }
+        assert {'owner', 'claim_token', 'lease_until'} <= {c['name'] for c in inspector.get_columns('outbound_messages')}
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import telegram_bot
+from models import db, User, Purchase, OutboxEvent
+
+
+class FrozenDatetime(datetime):
+    """Один и тот же момент для всех вызовов (два процесса в одном тике или усечение микросекунд)"""
+
+    @classmethod
+    def utcnow(cls):
+        return datetime(2026, 10, 1, 12, 0, 0)
+
+
+def linked_purchases(app, client, make_user, count):
+    user_id = make_user()
+    ids = [
+        client.post('/api/purchases', json={
+            'user_id': user_id, 'name': f'Товар {i}', 'price': 100, 'category': 'Книги'
+        }).json['id']
+        for i in range(count)
+    ]
+    with app.app_context():
+        db.session.get(User, user_id).telegram_chat_id = '555'
+        db.session.commit()
+    return ids
+
+
+def test_rows_claimed_by_another_worker_in_same_tick_are_not_reselected(app, client, make_user, monkeypatch):
+    other, mine = linked_purchases(app, client, make_user, 2)
+    monkeypatch.setattr(telegram_bot, 'datetime', FrozenDatetime)
+    with app.app_context():
+        # Другой процесс забрал покупку в тот же момент и сам пишет её событие
+        purchase = db.session.get(Purchase, other)
+        purchase.notified_at = FrozenDatetime.utcnow()
+        purchase.claim_token = 'other-worker'
+        db.session.commit()
+
+    bot = telegram_bot.TelegramNotificationBot('1:test')
+    try:
+        with app.app_context():
+            bot.notify_cooling_due([other, mine])
+    finally:
+        bot.db_executor.shutdown(wait=False)
+
+    with app.app_context():
+        assert [event.purchase_id for event in OutboxEvent.query.filter_by(kind='cooling_ended')] == [mine]
+        assert db.session.get(Purchase, mine).notified_at == FrozenDatetime.utcnow()
+
+
+def test_each_due_purchase_gets_one_event(app, client, make_user):
+    ids = linked_purchases(app, client, make_user, 3)
+
+    bot = telegram_bot.TelegramNotificationBot('1:test')
+    try:
+        with app.app_context():
+            bot.notify_cooling_due(ids)
+            bot.notify_cooling_due(ids)
+    finally:
+        bot.db_executor.shutdown(wait=False)
+
+    with app.app_context():
+        events = OutboxEvent.query.filter_by(kind='cooling_ended').order_by(OutboxEvent.purchase_id)
+        assert [event.purchase_id for event in events] == ids
@@ -0,0 +1,88 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from telegram import Bot
+
+from models import db, User, OutboxEvent, OutboundMessage
+from outbox import Outbox
+from send_queue import SendQueue
+from test_send_queue import make_send, wait_for
+
+
+def render(events):
+    return ' + '.join(payload['name'] for _, payload in events), 'HTML', None, 1
+
+
+def add_events(app, user_id, names, chat_id='555'):
+    with app.app_context():
+        db.session.get(User, user_id).telegram_chat_id = chat_id
+        for name in names:
+            Outbox.add('cooling_ended', user_id, {'name': name}, key=f'{user_id}:{name}')
+        db.session.commit()
+
+
+def test_drain_claims_each_event_once(app, make_user):
+    linked, unlinked = make_user('linked'), make_user('unlinked')
+    add_events(app, linked, ['a', 'b'])
+    add_events(app, unlinked, ['c'], chat_id=None)
+
+    with app.app_context():
+        count, stored = Outbox.drain(render, owner='queue-1')
+        assert count == 3
+        assert [(message.chat_id, message.text) for message in stored] == [('555', 'a + b')]
+
+        statuses = {json.loads(e.payload)['name']: e.status for e in OutboxEvent.query}
+        assert statuses == {'a': 'sent', 'b': 'sent', 'c': 'skipped'}
+        row = db.session.get(OutboundMessage, stored[0].id)
+        assert row.owner == 'queue-1' and row.lease_until > datetime.utcnow()
+
+        assert Outbox.drain(render, owner='queue-2') == (0, [])
+        assert OutboundMessage.query.count() == 1
+
+
+def test_drain_respects_batch_limit(app, make_user):
+    user_id = make_user()
+    add_events(app, user_id, ['a', 'b', 'c'])
+
+    with app.app_context():
+        first, _ = Outbox.drain(render, limit=2)
+        second, stored = Outbox.drain(render, limit=2)
+        assert (first, second) == (2, 1)
+        assert [message.text for message in stored] == ['c']
+
+
+def test_message_of_dead_owner_is_redelivered_after_lease_expiry(app, make_user, bot_api):
+    user_id = make_user()
+    add_events(app, user_id, ['a'])
+    with app.app_context():
+        # Очередь, забравшая событие, упала, не отправив (или не удалив) сообщение
+        Outbox.drain(render, owner='dead')
+
+    async def claimed_by_other_queue():
+        async with Bot('1:test', base_url=bot_api.base_url) as bot:
+            queue = SendQueue(make_send(bot), app, global_rate=100, per_chat_rate=100)
+            await queue.start()
+            await asyncio.sleep(0.2)
+            await queue.stop()
+            return queue.sent
+
+    assert asyncio.run(claimed_by_other_queue()) == 0
+
+    with app.app_context():
+        db.session.execute(db.update(OutboundMessage).values(lease_until=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+
+    async def redelivered():
+        async with Bot('1:test', base_url=bot_api.base_url) as bot:
+            queue = SendQueue(make_send(bot), app, global_rate=100, per_chat_rate=100)
+            await queue.start()
+            await wait_for(lambda: queue.sent == 1)
+            await asyncio.sleep(0.1)
+            await queue.stop()
+
+    asyncio.run(redelivered())
+
+    assert [params['text'] for params in bot_api.sent()] == ['a']
+    with app.app_context():
+        assert OutboundMessage.query.count() == 0
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from marketplaces.ozon import extract_widgets, parse_price
+
+
+def test_extract_widgets_decodes_only_needed_values():
+    states = {
+        'webAddToCart-1-default-1': '{broken json',
+        'webProductHeading-2-default-1': json.dumps({'title': 'Чайник'}),
+        'webSale-3-default-1': {'price': '990 ₽'},
+        'webGallery-4-default-1': json.dumps({'images': []}),
+        'webGallery-5-default-2': json.dumps({'images': [{'src': 'second'}]})
+    }
+
+    assert extract_widgets(states) == {
+        'heading': {'title': 'Чайник'},
+        'sale': {'price': '990 ₽'},
+        'gallery': {'images': []}
+    }
+
+
+def test_extract_widgets_skips_invalid_values():
+    states = {
+        'webProductHeading-1-default-1': '{broken json',
+        'webSale-2-default-1': json.dumps(['not', 'a', 'dict'])
+    }
+
+    assert extract_widgets(states) == {}
+
+
+def test_extract_widgets_matches_widget_name_exactly():
+    # Ключ сравнивается по имени до '-', а не по подстроке
+    assert extract_widgets({'webSaleBanner-1-default-1': json.dumps({'price': '1 ₽'})}) == {}
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('12 990 ₽', 12990.0),
+    ('12\u00a0990\u00a0₽', 12990.0),
+    ('1\u2009299,50 ₽', 1299.5),
+    ('499.90 ₽', 499.9),
+    (12990, 12990.0),
+    (499.5, 499.5),
+    ('Нет в наличии', 0.0),
+    ('', 0.0)
+])
+def test_parse_price(value, expected):
+    assert parse_price(value) == expected
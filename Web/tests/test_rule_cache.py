@@ -0,0 +1,34 @@
+import analyzers
+from analyzers import PurchaseAnalyzer, RuleCache
+from models import db, PriceRange
+
+
+def test_cache_is_bounded(app, make_user):
+    cache = RuleCache(maxsize=2)
+    user_ids = [make_user(f'user{i}') for i in range(3)]
+
+    with app.app_context():
+        for user_id in user_ids:
+            cache.get(user_id)
+        assert cache.stats()['size'] == 2
+
+
+def test_purchase_uses_rules_changed_by_another_process(app, client, make_user):
+    user_id = make_user()
+    with app.app_context():
+        PurchaseAnalyzer.get_rules(user_id)
+        # Запись другого процесса: кэш этого процесса не сброшен
+        db.session.add(PriceRange(user_id=user_id, min_price=499, max_price=501, cooling_days=2))
+        db.session.commit()
+        assert analyzers.rule_cache.get(user_id).cooling_days_for(500) != 2
+
+    response = client.post('/api/purchases', json={
+        'user_id': user_id, 'name': 'Книга', 'price': 500, 'category': 'Книги'
+    })
+    assert response.status_code == 201
+    assert response.json['purchase']['cooling_period_days'] == 2
+
+    response = client.post('/api/purchases/analyze-batch', json={
+        'user_id': user_id, 'items': [{'name': 'Книга', 'price': 500, 'category': 'Книги'}]
+    })
+    assert response.json['results'][0]['purchase']['cooling_period_days'] == 2
@@ -0,0 +1,103 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from analyzers import PurchaseAnalyzer, RuleSnapshot
+from scoring import VectorizedAnalyzer
+
+FIELDS = ('is_blacklisted', 'cooling_days', 'price_cooling_days', 'savings_days', 'extra_days',
+          'can_afford', 'impulse_score', 'risk_level')
+CATEGORIES = ['Электроника', 'Одежда', 'Еда', 'Хобби', 'Дом']
+# Цены на границах диапазонов и долей зарплаты/накоплений, где легче всего разойтись
+EDGE_PRICES = [0, 1, 14999.99, 15000, 15000.01, 50000, 100000, 100000.01, 30000, 50000.5]
+
+
+def random_rules(rng):
+    bounds = sorted(rng.sample(range(1000, 200000, 500), rng.randint(0, 4)))
+    ranges = []
+    low = 0
+    for high in bounds:
+        ranges.append((low, high, rng.randint(0, 60)))
+        low = high if rng.random() < 0.8 else high + rng.randint(1, 5000)
+    if rng.random() < 0.7:
+        ranges.append((low, None, rng.randint(0, 120)))
+    if ranges and rng.random() < 0.3:
+        # Пересекающиеся диапазоны: побеждает наибольший min_price
+        ranges.append((rng.choice(ranges)[0], rng.choice([None, 300000]), rng.randint(0, 90)))
+    return RuleSnapshot(rng.sample(CATEGORIES, rng.randint(0, 2)), ranges)
+
+
+def random_user(rng):
+    return SimpleNamespace(
+        id=1,
+        salary=rng.choice([0, 30000, 100000, rng.uniform(1, 500000)]),
+        current_savings=rng.choice([0, 15000, 100000, rng.uniform(0, 1000000)]),
+        monthly_savings=rng.choice([0, 20000, rng.uniform(1, 100000)]),
+        use_savings_calculation=rng.random() < 0.7
+    )
+
+
+def as_python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_vectorized_matches_scalar_field_by_field(seed):
+    rng = random.Random(seed)
+
+    for _ in range(50):
+        rules = random_rules(rng)
+        user = random_user(rng)
+        prices = EDGE_PRICES + [user.salary * 0.3, user.salary * 0.5, user.current_savings,
+                                user.current_savings * 0.8, user.current_savings * 0.5]
+        prices += [rng.uniform(0, 400000) for _ in range(20)]
+        categories = [rng.choice(CATEGORIES) for _ in prices]
+
+        vectorized = VectorizedAnalyzer.score_for_user(user, prices, categories, rules=rules)
+
+        for i, (price, category) in enumerate(zip(prices, categories)):
+            scalar = PurchaseAnalyzer.analyze_impulse(user, price, category, rules)
+            for field in FIELDS:
+                assert as_python(vectorized[field][i]) == scalar[field], (field, price, category, vars(user))
+
+
+def test_salary_sweep_matches_scalar():
+    rng = random.Random(1)
+    rules = random_rules(rng)
+    user = random_user(rng)
+    prices = [rng.uniform(0, 300000) for _ in range(30)]
+    salaries = [0, 25000, 80000, 250000]
+
+    sweep = VectorizedAnalyzer.salary_sweep(user, prices, salaries, rules=rules)
+
+    for row, salary in enumerate(salaries):
+        scenario = SimpleNamespace(**{**vars(user), 'salary': salary})
+        for column, price in enumerate(prices):
+            scalar = PurchaseAnalyzer.analyze_impulse(scenario, price, None, rules)
+            assert sweep['impulse_score'][row, column] == scalar['impulse_score']
+            assert sweep['cooling_days'][row, column] == scalar['cooling_days']
+            assert sweep['risk_level'][row, column] == scalar['risk_level']
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_analyze_batch_matches_analyze_impulse(seed):
+    rng = random.Random(seed)
+
+    for _ in range(20):
+        rules = random_rules(rng)
+        user = random_user(rng)
+        prices = EDGE_PRICES + [rng.uniform(0, 400000) for _ in range(10)]
+        categories = [rng.choice(CATEGORIES) for _ in prices]
+
+        batch = VectorizedAnalyzer.analyze_batch(user, prices, categories, rules=rules)
+
+        assert batch == [
+            PurchaseAnalyzer.analyze_impulse(user, price, category, rules)
+            for price, category in zip(prices, categories)
+        ]
+
+
+def test_analyze_batch_empty():
+    assert VectorizedAnalyzer.analyze_batch(random_user(random.Random(0)), [], [], rules=RuleSnapshot([], [])) == []
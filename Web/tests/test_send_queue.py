@@ -0,0 +1,136 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from telegram import Bot
+
+from models import db, OutboundMessage
+from send_queue import SendQueue
+
+
+def make_send(bot):
+    async def send(chat_id, text, parse_mode=None, reply_markup=None):
+        await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode, reply_markup=reply_markup)
+    return send
+
+
+async def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timeout'
+        await asyncio.sleep(0.02)
+
+
+def add_rows(app, count, **fields):
+    with app.app_context():
+        db.session.add_all([
+            OutboundMessage(chat_id=str(100 + i), text=f'stored {i}', parse_mode='HTML', priority=1, **fields)
+            for i in range(count)
+        ])
+        db.session.commit()
+
+
+def test_sends_through_bot_api_and_deletes_rows(app, bot_api):
+    async def scenario():
+        async with Bot('1:test', base_url=bot_api.base_url) as bot:
+            queue = SendQueue(make_send(bot), app, global_rate=100, per_chat_rate=100)
+            await queue.start()
+            for i in range(10):
+                await queue.put(str(i), f'message {i}')
+            await wait_for(lambda: queue.sent == 10)
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+    assert sorted(params['text'] for params in bot_api.sent()) == sorted(f'message {i}' for i in range(10))
+    with app.app_context():
+        assert OutboundMessage.query.count() == 0
+
+
+def test_retry_after_pauses_every_chat(app, bot_api):
+    bot_api.replies.append((429, {
+        'ok': False, 'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': 1}
+    }))
+
+    async def scenario():
+        async with Bot('1:test', base_url=bot_api.base_url) as bot:
+            queue = SendQueue(make_send(bot), app, global_rate=100, per_chat_rate=100, max_in_flight=1)
+            await queue.start()
+            started = time.monotonic()
+            await queue.put('1', 'limited')
+            await wait_for(lambda: queue.retried == 1)
+            await queue.put('2', 'other chat')
+            await wait_for(lambda: queue.sent == 2)
+            elapsed = time.monotonic() - started
+            await queue.stop()
+            return elapsed
+
+    elapsed = asyncio.run(scenario())
+
+    # Сообщение в другой чат тоже ждёт retry_after
+    assert elapsed >= 0.9
+    assert sorted(params['text'] for params in bot_api.sent()) == ['limited', 'other chat']
+
+
+def test_claims_only_free_and_expired_rows(app, bot_api):
+    now = datetime.utcnow()
+    add_rows(app, 2)
+    add_rows(app, 2, owner='dead', lease_until=now - timedelta(seconds=1))
+    add_rows(app, 3, owner='alive', lease_until=now + timedelta(minutes=5))
+
+    async def scenario():
+        async with Bot('1:test', base_url=bot_api.base_url) as bot:
+            queue = SendQueue(make_send(bot), app, global_rate=100, per_chat_rate=100)
+            await queue.start()
+            await wait_for(lambda: queue.sent == 4)
+            await asyncio.sleep(0.2)
+            await queue.stop()
+            return queue.sent
+
+    assert asyncio.run(scenario()) == 4
+    with app.app_context():
+        assert [row.owner for row in OutboundMessage.query.all()] == ['alive'] * 3
+
+
+def test_concurrent_queues_send_each_row_once(app, bot_api):
+    add_rows(app, 30)
+
+    async def scenario():
+        async with Bot('1:test', base_url=bot_api.base_url) as bot:
+            queues = [SendQueue(make_send(bot), app, global_rate=100, per_chat_rate=100) for _ in range(3)]
+            await asyncio.gather(*(queue.start() for queue in queues))
+            await wait_for(lambda: sum(queue.sent for queue in queues) >= 30)
+            await asyncio.sleep(0.3)
+            for queue in queues:
+                await queue.stop()
+
+    asyncio.run(scenario())
+
+    texts = [params['text'] for params in bot_api.sent()]
+    assert sorted(texts) == sorted(f'stored {i}' for i in range(30))
+
+
+def test_concurrent_puts_and_deliveries_are_written_in_batches(app, bot_api):
+    batches = {'insert': [], 'delete': []}
+
+    async def scenario():
+        async with Bot('1:test', base_url=bot_api.base_url) as bot:
+            queue = SendQueue(make_send(bot), app, global_rate=1000, per_chat_rate=100)
+            for kind, name in (('insert', '_insert_many'), ('delete', '_delete_many')):
+                def counted(messages, write=getattr(queue, name), kind=kind):
+                    batches[kind].append(len(messages))
+                    return write(messages)
+                setattr(queue, name, counted)
+
+            await queue.start()
+            await asyncio.gather(*(queue.put(str(i), f'message {i}') for i in range(50)))
+            await wait_for(lambda: sum(batches['delete']) == 50)
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+    assert sum(batches['insert']) == 50 and len(batches['insert']) < 50
+    assert len(batches['delete']) < 50
+    assert len(bot_api.sent()) == 50
+    with app.app_context():
+        assert OutboundMessage.query.count() == 0
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        time.sleep(0.1)
+        return key.upper()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: flight.do('a', fetch, 'a'), range(8)))
+
+    assert results == ['A'] * 8
+    assert calls == ['a']
+    assert flight.in_flight() == 0
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        leader = asyncio.create_task(flight.do_async('key', fetch))
+        await loop.run_in_executor(None, started.wait, 5)
+        follower = asyncio.create_task(flight.do_async('key', fetch))
+        cancelled = asyncio.create_task(flight.do_async('key', fetch))
+        # Поток, ожидающий тот же вызов через do()
+        blocked = loop.run_in_executor(None, flight.do, 'key', fetch)
+        await asyncio.sleep(0.05)
+
+        cancelled.cancel()
+        await asyncio.sleep(0.05)
+        release.set()
+
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return await leader, await follower, await blocked
+
+    assert asyncio.run(scenario()) == ('result', 'result', 'result')
+    assert calls == [1]
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+
+    def fail():
+        time.sleep(0.05)
+        raise ValueError('boom')
+
+    async def scenario():
+        return await asyncio.gather(
+            *(flight.do_async('key', fail) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
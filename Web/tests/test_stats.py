@@ -0,0 +1,100 @@
+import threading
+
+from models import db, UserStats
+from stats import PurchaseStats
+
+
+def add_purchase(client, user_id, price=1000):
+    response = client.post('/api/purchases', json={
+        'user_id': user_id, 'name': 'Книга', 'price': price, 'category': 'Книги'
+    })
+    assert response.status_code == 201, response.json
+    return response.json['id']
+
+
+def test_materialized_row_follows_purchases(app, client, make_user):
+    app.config['MATERIALIZED_STATS'] = True
+    user_id = make_user()
+    add_purchase(client, user_id, 500)
+
+    assert client.get(f'/api/statistics/{user_id}').json['total'] == 1
+    add_purchase(client, user_id, 700)
+
+    with app.app_context():
+        assert db.session.get(UserStats, user_id).to_dict() == PurchaseStats.aggregate(user_id)
+
+
+def test_listener_counters_match_aggregate(app, client, make_user):
+    app.config['MATERIALIZED_STATS'] = True
+    user_id = make_user()
+    client.get(f'/api/statistics/{user_id}')
+
+    def counters():
+        with app.app_context():
+            row = db.session.get(UserStats, user_id).to_dict()
+            assert row == PurchaseStats.aggregate(user_id)
+            return row
+
+    ids = [add_purchase(client, user_id, price) for price in (500, 700, 900)]
+    assert counters()['pending'] == 3
+
+    assert client.put(f'/api/purchases/{ids[0]}', json={'status': 'approved'}).status_code == 200
+    assert client.put(f'/api/purchases/{ids[1]}', json={'status': 'rejected'}).status_code == 200
+    assert counters()['total_saved'] == 700
+
+    assert client.delete(f'/api/purchases/{ids[1]}').status_code == 200
+    assert counters() == {
+        'total': 2, 'pending': 1, 'approved': 1, 'rejected': 0, 'total_spent': 500.0, 'total_saved': 0.0
+    }
+
+
+def test_listener_is_idle_when_disabled(app, client, make_user, monkeypatch):
+    user_id = make_user()
+    calls = []
+    monkeypatch.setattr(PurchaseStats, 'apply_deltas', staticmethod(lambda *args: calls.append(args)))
+
+    add_purchase(client, user_id)
+    with app.app_context():
+        PurchaseStats.apply_bulk_insert(db.session.connection(), [{'user_id': user_id, 'price': 1}])
+
+    assert calls == []
+    with app.app_context():
+        assert UserStats.query.count() == 0
+
+
+def test_purchase_during_row_creation_is_not_lost(app, client, make_user, monkeypatch):
+    app.config['MATERIALIZED_STATS'] = True
+    user_id = make_user()
+    add_purchase(client, user_id)
+
+    aggregate = PurchaseStats.aggregate
+    aggregated = threading.Event()
+    resume = threading.Event()
+
+    def slow_aggregate(uid):
+        result = aggregate(uid)
+        aggregated.set()
+        # Параллельная покупка либо успеет до commit (старое поведение), либо ждёт блокировку
+        resume.wait(0.5)
+        return result
+
+    monkeypatch.setattr(PurchaseStats, 'aggregate', staticmethod(slow_aggregate))
+
+    def read_stats():
+        with app.app_context():
+            PurchaseStats.get(user_id)
+
+    reader = threading.Thread(target=read_stats)
+    reader.start()
+    assert aggregated.wait(5)
+    writer = threading.Thread(target=add_purchase, args=(app.test_client(), user_id, 2500))
+    writer.start()
+    writer.join(10)
+    resume.set()
+    reader.join(10)
+
+    monkeypatch.setattr(PurchaseStats, 'aggregate', staticmethod(aggregate))
+    with app.app_context():
+        row = db.session.get(UserStats, user_id).to_dict()
+        assert row == PurchaseStats.aggregate(user_id)
+        assert row['total'] == 2
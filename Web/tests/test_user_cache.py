@@ -0,0 +1,31 @@
+from models import db, User
+from user_cache import user_cache
+
+
+def test_purchase_is_scored_with_fresh_profile(app, client, make_user):
+    user_id = make_user(salary=100000, current_savings=500000)
+    assert client.get(f'/api/users/{user_id}').json['salary'] == 100000
+
+    # Изменение из другого воркера: кэш этого процесса не сброшен
+    with app.app_context():
+        db.session.get(User, user_id).salary = 20000
+        db.session.commit()
+    assert user_cache.get(user_id).salary == 100000
+
+    response = client.post('/api/purchases', json={
+        'user_id': user_id, 'name': 'Телефон', 'price': 15000, 'category': 'Электроника'
+    })
+
+    assert response.status_code == 201
+    assert response.json['analysis']['price_to_salary_ratio'] == 75
+    # Чтение профиля по-прежнему из кэша до TTL
+    assert client.get(f'/api/users/{user_id}').json['salary'] == 100000
+
+
+def test_update_user_invalidates_profile(client, make_user):
+    user_id = make_user()
+    client.get(f'/api/users/{user_id}')
+
+    client.put(f'/api/users/{user_id}', json={'salary': 150000})
+
+    assert client.get(f'/api/users/{user_id}').json['salary'] == 150000
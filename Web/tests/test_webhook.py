@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from telegram.ext import Application, CommandHandler
+
+import telegram_bot
+from telegram_bot import TelegramNotificationBot
+
+
+@pytest.fixture
+def webhook_bot(monkeypatch):
+    """Бот в режиме webhook без запуска Application (обновления до него не доходят)"""
+    monkeypatch.setattr(telegram_bot, 'TELEGRAM_WEBHOOK_URL', 'https://example.com/api/telegram/webhook')
+    monkeypatch.setattr(telegram_bot, 'TELEGRAM_WEBHOOK_SECRET', 'secret')
+    bot = TelegramNotificationBot('1:test')
+    bot.loop = asyncio.new_event_loop()
+    monkeypatch.setattr(telegram_bot, 'bot_instance', bot)
+    yield bot
+    bot.loop.close()
+    bot.db_executor.shutdown(wait=False)
+
+
+@pytest.fixture
+def running_bot(monkeypatch, bot_api):
+    """Бот в режиме webhook с запущенным Application на event loop в отдельном потоке"""
+    monkeypatch.setattr(telegram_bot, 'TELEGRAM_WEBHOOK_URL', 'https://example.com/api/telegram/webhook')
+    monkeypatch.setattr(telegram_bot, 'TELEGRAM_WEBHOOK_SECRET', 'secret')
+    bot = TelegramNotificationBot('1:test')
+    bot.loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=bot.loop.run_forever, daemon=True)
+    thread.start()
+
+    async def start():
+        bot.application = Application.builder().token('1:test').base_url(bot_api.base_url).build()
+        bot.application.add_handler(CommandHandler('start', bot.start_command))
+        await bot.application.initialize()
+        await bot.application.start()
+
+    asyncio.run_coroutine_threadsafe(start(), bot.loop).result(10)
+    monkeypatch.setattr(telegram_bot, 'bot_instance', bot)
+    yield bot
+
+    async def stop():
+        await bot.application.stop()
+        await bot.application.shutdown()
+
+    asyncio.run_coroutine_threadsafe(stop(), bot.loop).result(10)
+    bot.loop.call_soon_threadsafe(bot.loop.stop)
+    thread.join(5)
+    bot.loop.close()
+    bot.db_executor.shutdown(wait=False)
+
+
+def test_webhook_mode_requires_secret(monkeypatch):
+    monkeypatch.setattr(telegram_bot, 'TELEGRAM_WEBHOOK_URL', 'https://example.com/api/telegram/webhook')
+    monkeypatch.setattr(telegram_bot, 'TELEGRAM_WEBHOOK_SECRET', None)
+
+    with pytest.raises(RuntimeError):
+        TelegramNotificationBot('1:test')
+
+
+def test_rejects_missing_or_wrong_secret(client, webhook_bot):
+    update = {'update_id': 1, 'message': {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'}, 'text': '/unlink'}}
+
+    assert client.post('/api/telegram/webhook', json=update).status_code == 403
+    response = client.post('/api/telegram/webhook', json=update, headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+    assert response.status_code == 403
+
+
+def test_rejects_when_secret_is_cleared(client, webhook_bot, monkeypatch):
+    monkeypatch.setattr(telegram_bot, 'TELEGRAM_WEBHOOK_SECRET', None)
+
+    response = client.post('/api/telegram/webhook', json={'update_id': 1}, headers={'X-Telegram-Bot-Api-Secret-Token': ''})
+    assert response.status_code == 403
+
+
+def test_valid_secret_passes_to_update_validation(client, webhook_bot):
+    response = client.post('/api/telegram/webhook', json={}, headers={'X-Telegram-Bot-Api-Secret-Token': 'secret'})
+    assert response.status_code == 400
+
+
+def test_start_update_reaches_handler(client, running_bot, bot_api, monkeypatch):
+    processed = []
+    process_update = running_bot.application.process_update
+
+    async def spy(update):
+        processed.append(update.update_id)
+        await process_update(update)
+
+    monkeypatch.setattr(running_bot.application, 'process_update', spy)
+    update = {'update_id': 7, 'message': {
+        'message_id': 1, 'date': 0, 'chat': {'id': 42, 'type': 'private'}, 'text': '/start',
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]
+    }}
+
+    response = client.post('/api/telegram/webhook', json=update, headers={'X-Telegram-Bot-Api-Secret-Token': 'secret'})
+    assert response.status_code == 200
+
+    deadline = time.monotonic() + 10
+    while not bot_api.sent():
+        assert time.monotonic() < deadline, 'timeout'
+        time.sleep(0.02)
+
+    assert processed == [7]
+    [reply] = bot_api.sent()
+    assert int(reply['chat_id']) == 42
+    assert reply['text'].startswith('👋 Привет!')
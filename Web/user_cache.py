@@ -0,0 +1,154 @@
+import os
+import threading
+from flask import abort
+from cache import TTLCache
+
+# Поля пользователя, которые хранятся в кэше
+PROFILE_FIELDS = (
+    'id', 'nickname', 'salary', 'monthly_savings', 'current_savings', 'use_savings_calculation',
+    'telegram_chat_id', 'telegram_notifications_enabled', 'last_login'
+)
+
+
+class UserProfile:
+    """Неизменяемый снимок полей пользователя (атрибуты как у модели User)"""
+
+    __slots__ = PROFILE_FIELDS
+
+    def __init__(self, **values):
+        for field in PROFILE_FIELDS:
+            object.__setattr__(self, field, values[field])
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserProfile доступен только для чтения')
+
+    def replace(self, **changes):
+        return UserProfile(**{**{field: getattr(self, field) for field in PROFILE_FIELDS}, **changes})
+
+    def to_dict(self):
+        """То же представление, что и User.to_dict()"""
+        return {
+            'id': self.id,
+            'nickname': self.nickname,
+            'salary': self.salary,
+            'monthly_savings': self.monthly_savings,
+            'current_savings': self.current_savings,
+            'use_savings_calculation': self.use_savings_calculation,
+            'telegram_linked': self.telegram_chat_id is not None,
+            'telegram_notifications': self.telegram_notifications_enabled,
+            'last_login': self.last_login.isoformat() if self.last_login else None
+        }
+
+
+class UserCache:
+    """
+    Read-through кэш профилей пользователей в памяти процесса.
+    Профиль хранится под ключом ('id', id), ключи ('chat', chat_id) и ('nickname', nickname)
+    ссылаются на id. После изменения пользователя нужно вызвать invalidate() (после commit);
+    изменения из других процессов становятся видны по истечении TTL.
+    Только для чтения: пути, которые сохраняют вычисленное по профилю, читают User из БД.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def get(self, user_id):
+        """Профиль по id или None"""
+        user_id = int(user_id)
+        profile = self._cache.get(('id', user_id))
+        if profile is None:
+            profile = self._load(id=user_id)
+        return profile
+
+    def get_or_404(self, user_id):
+        profile = self.get(user_id)
+        if profile is None:
+            abort(404)
+        return profile
+
+    def by_chat(self, chat_id):
+        """Профиль по привязанному Telegram чату или None"""
+        chat_id = str(chat_id)
+        return self._lookup(('chat', chat_id), 'telegram_chat_id', chat_id)
+
+    def by_nickname(self, nickname):
+        return self._lookup(('nickname', nickname), 'nickname', nickname)
+
+    def invalidate(self, user_id=None, chat_id=None, nickname=None):
+        """Сбросить профиль пользователя и все ключи, которые на него ссылаются"""
+        with self._lock:
+            self._generation += 1
+
+        keys = set()
+        if chat_id is not None:
+            keys.add(('chat', str(chat_id)))
+        if nickname is not None:
+            keys.add(('nickname', nickname))
+        if user_id is not None:
+            keys.add(('id', int(user_id)))
+            profile = self._cache.get(('id', int(user_id)))
+            if profile is not None:
+                keys.add(('chat', profile.telegram_chat_id))
+                keys.add(('nickname', profile.nickname))
+
+        for key in keys:
+            self._cache.invalidate(key)
+
+    def refresh(self, profile, **changes):
+        """
+        Профиль с изменёнными полями (после записи в БД). В кэш он попадает, только если
+        там всё ещё лежит исходный профиль, — параллельный invalidate() не перетирается.
+        """
+        updated = profile.replace(**changes)
+        with self._lock:
+            if self._cache.get(('id', profile.id)) is profile:
+                self._cache.set(('id', profile.id), updated)
+        return updated
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+    def _lookup(self, key, field, value):
+        user_id = self._cache.get(key)
+        if user_id is not None:
+            profile = self.get(user_id)
+            # Ключ мог устареть (например, чат привязан к другому пользователю в другом процессе)
+            if profile is not None and getattr(profile, field) == value:
+                return profile
+            self._cache.invalidate(key)
+        return self._load(**{field: value})
+
+    def _load(self, **filters):
+        from models import db, User
+
+        with self._lock:
+            generation = self._generation
+
+        row = db.session.query(*(getattr(User, field) for field in PROFILE_FIELDS)).filter_by(**filters).first()
+        if row is None:
+            return None
+
+        profile = UserProfile(**row._asdict())
+
+        # Не сохраняем профиль, если пользователи менялись во время загрузки
+        with self._lock:
+            if self._generation == generation:
+                self._cache.set(('id', profile.id), profile)
+                self._cache.set(('nickname', profile.nickname), profile.id)
+                if profile.telegram_chat_id is not None:
+                    self._cache.set(('chat', profile.telegram_chat_id), profile.id)
+
+        return profile
+
+
+user_cache = UserCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('USER_CACHE_TTL', 60))
+)